@@ -0,0 +1,380 @@
+"""
+Project archive assembly from prebuilt per-stack base layers.
+
+Much of a generated project is identical for every plan of a stack: tool
+configs, ``app/globals.css``, ``.gitignore``. Those files are compressed once
+per stack into a base layer when the pipeline is built. Packaging a job
+copies the layer's already-deflated entries into the archive as raw bytes and
+only compresses the plan-specific overlay (package.json, pages, README, ...).
+
+A layer entry is only reused if the rendered file is byte-identical to the
+layer's copy, so a plan that customizes a "static" file still ships its own
+version. Archives are plain ZIP files without ZIP64 extensions, which is
+plenty for generated projects.
+
+Overlay files are read and compressed on a shared thread pool (zlib releases
+the GIL while deflating) and written in order as they complete. Files that
+are already compressed, tiny, or don't shrink are stored instead of deflated.
+``level`` trades speed for size per archive: 1 is fastest, 9 smallest, 0
+stores everything. Base layer entries are reused as built (at the
+packager's default level) unless ``level`` is 0. Layers can also be loaded
+prebuilt from a startup snapshot; a snapshot layer is only used if its level
+and files still match what the generator renders.
+
+For previews, ``ArchiveIndex`` reads an archive's central directory once and
+serves single entries straight from a memory map of the file, without
+extracting or reading the rest of the archive.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Iterable, List, Optional, Tuple
+
+import metrics
+
+PACKAGE_ENTRIES = metrics.Counter(
+    "zero_package_entries_total", "Files written to project archives", ["source"]
+)
+
+DEFLATE_LEVEL = 6
+# Deflating these gains next to nothing and costs a full pass over the data
+STORED_SUFFIXES = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".woff", ".woff2",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".jar", ".pdf", ".mp3", ".mp4"
+})
+# Below this the deflate block overhead eats any savings
+MIN_DEFLATE_SIZE = 64
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_RECORD = struct.Struct("<IHHHHIIH")
+_ZIP32_LIMIT = 0xFFFFFFFF
+_UTF8_FLAG = 0x800
+_VERSION = 20
+# Made by: Unix, so external attributes carry the file mode
+_VERSION_MADE_BY = (3 << 8) | _VERSION
+
+
+class ZipEntry:
+    """One archive member, already compressed and ready to be copied as is."""
+
+    __slots__ = ("name", "data", "crc", "size", "method", "mode", "date_time")
+
+    def __init__(self, name: str, data: bytes, crc: int, size: int, method: int, mode: int, date_time: Tuple):
+        self.name = name
+        self.data = data
+        self.crc = crc
+        self.size = size
+        self.method = method
+        self.mode = mode
+        self.date_time = date_time
+
+
+def compress_entry(
+    name: str,
+    content: bytes,
+    mode: int = 0o100644,
+    mtime: Optional[float] = None,
+    level: int = DEFLATE_LEVEL
+) -> ZipEntry:
+    """Deflate ``content``, or store it if deflating isn't worth it."""
+    date_time = time.localtime(time.time() if mtime is None else mtime)[:6]
+    crc = zlib.crc32(content)
+    if level > 0 and len(content) >= MIN_DEFLATE_SIZE and os.path.splitext(name)[1].lower() not in STORED_SUFFIXES:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        data = compressor.compress(content) + compressor.flush()
+        if len(data) < len(content):
+            return ZipEntry(name, data, crc, len(content), ZIP_DEFLATED, mode, date_time)
+    return ZipEntry(name, content, crc, len(content), ZIP_STORED, mode, date_time)
+
+
+def _dos_time(date_time: Tuple) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    year = max(year, 1980)
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class ArchiveWriter:
+    """Writes precompressed entries to a ZIP file."""
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._offset = 0
+        self._central = []
+
+    def add(self, entry: ZipEntry):
+        if entry.size > _ZIP32_LIMIT or len(entry.data) > _ZIP32_LIMIT or self._offset > _ZIP32_LIMIT:
+            raise ValueError(f"Archive member {entry.name} is too large for a ZIP32 archive")
+        name = entry.name.encode("utf-8")
+        flags = 0 if entry.name.isascii() else _UTF8_FLAG
+        dos_time, dos_date = _dos_time(entry.date_time)
+        header = _LOCAL_HEADER.pack(
+            0x04034B50, _VERSION, flags, entry.method, dos_time, dos_date,
+            entry.crc, len(entry.data), entry.size, len(name), 0
+        )
+        self._file.write(header)
+        self._file.write(name)
+        self._file.write(entry.data)
+        # MS-DOS directory attribute for directories, Unix mode in the high word
+        external = (entry.mode << 16) | (0x10 if entry.name.endswith("/") else 0)
+        self._central.append(_CENTRAL_HEADER.pack(
+            0x02014B50, _VERSION_MADE_BY, _VERSION, flags, entry.method, dos_time, dos_date,
+            entry.crc, len(entry.data), entry.size, len(name), 0, 0, 0, 0, external, self._offset
+        ) + name)
+        self._offset += len(header) + len(name) + len(entry.data)
+
+    def add_directory(self, name: str, mode: int = 0o40755, mtime: Optional[float] = None):
+        date_time = time.localtime(time.time() if mtime is None else mtime)[:6]
+        self.add(ZipEntry(name.rstrip("/") + "/", b"", 0, 0, ZIP_STORED, mode, date_time))
+
+    def close(self):
+        if len(self._central) >= 0xFFFF or self._offset > _ZIP32_LIMIT:
+            raise ValueError("Archive is too large for a ZIP32 archive")
+        directory = b"".join(self._central)
+        self._file.write(directory)
+        self._file.write(_END_RECORD.pack(
+            0x06054B50, 0, 0, len(self._central), len(self._central), len(directory), self._offset, 0
+        ))
+
+
+class BaseLayer:
+    """The precompressed static files of one stack."""
+
+    def __init__(self, files: Dict[str, str], level: int = DEFLATE_LEVEL):
+        built_at = time.time()
+        self.level = level
+        # relative path -> (uncompressed bytes, entry)
+        self.entries: Dict[str, Tuple[bytes, ZipEntry]] = {}
+        for name, text in files.items():
+            content = text.encode("utf-8")
+            self.entries[name] = (content, compress_entry(name, content, mtime=built_at, level=level))
+
+    def match(self, name: str, content: bytes) -> Optional[ZipEntry]:
+        """The layer's entry for ``name`` if the rendered file is unchanged."""
+        layer = self.entries.get(name)
+        if layer is not None and layer[0] == content:
+            return layer[1]
+        return None
+
+
+    def same_files(self, files: Dict[str, str]) -> bool:
+        return files.keys() == self.entries.keys() and all(
+            self.entries[name][0] == text.encode("utf-8") for name, text in files.items()
+        )
+
+
+def build_base_layers(
+    generator,
+    stacks: Iterable[str],
+    level: int = DEFLATE_LEVEL,
+    prebuilt: Optional[Dict[str, BaseLayer]] = None
+) -> Dict[str, BaseLayer]:
+    layers = {}
+    for stack in stacks:
+        files = generator.static_files(stack)
+        layer = (prebuilt or {}).get(stack)
+        if layer is None or layer.level != level or not layer.same_files(files):
+            layer = BaseLayer(files, level)
+        layers[stack] = layer
+    return layers
+
+
+class Packager:
+    def __init__(self, layers: Dict[str, BaseLayer], workers: Optional[int] = None, level: int = DEFLATE_LEVEL):
+        self.layers = layers
+        self.level = level
+        # Shared by all jobs, so it also caps the cores packaging can take
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix="compress")
+
+    def package(self, work_dir: str, zip_path: str, stack: str, level: Optional[int] = None) -> Dict[str, int]:
+        """Zip ``work_dir`` into ``zip_path``.
+
+        Returns entry counts, the archive size and the CPU time spent reading
+        and compressing on the pool.
+        """
+        layer = self.layers.get(stack)
+        level = self.level if level is None else level
+        stats = {"layer_entries": 0, "deflated_entries": 0, "stored_entries": 0}
+        cpu_seconds = 0.0
+        partial_path = zip_path + ".part"
+
+        # Directories are written inline; files are compressed ahead on the pool
+        members: List = []
+        for root, dirs, files in os.walk(work_dir):
+            dirs.sort()
+            relative_root = os.path.relpath(root, work_dir)
+            if relative_root != ".":
+                members.append((relative_root.replace(os.sep, "/"), os.stat(root).st_mtime))
+            for filename in sorted(files):
+                name = os.path.normpath(os.path.join(relative_root, filename)).replace(os.sep, "/")
+                members.append(self.executor.submit(self._load, os.path.join(root, filename), name, layer, level))
+
+        try:
+            with open(partial_path, "wb") as f:
+                writer = ArchiveWriter(f)
+                for member in members:
+                    if isinstance(member, tuple):
+                        writer.add_directory(member[0], mtime=member[1])
+                        continue
+                    entry, from_layer, cpu = member.result()
+                    cpu_seconds += cpu
+                    if from_layer:
+                        stats["layer_entries"] += 1
+                    elif entry.method == ZIP_DEFLATED:
+                        stats["deflated_entries"] += 1
+                    else:
+                        stats["stored_entries"] += 1
+                    writer.add(entry)
+                writer.close()
+        except BaseException:
+            for member in members:
+                if not isinstance(member, tuple):
+                    member.cancel()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+        os.replace(partial_path, zip_path)
+        PACKAGE_ENTRIES.inc(stats["layer_entries"], source="layer")
+        PACKAGE_ENTRIES.inc(stats["deflated_entries"], source="deflated")
+        PACKAGE_ENTRIES.inc(stats["stored_entries"], source="stored")
+        stats["archive_bytes"] = os.path.getsize(zip_path)
+        stats["compress_cpu_seconds"] = round(cpu_seconds, 6)
+        return stats
+
+    @staticmethod
+    def _load(path: str, name: str, layer: Optional[BaseLayer], level: int) -> Tuple[ZipEntry, bool, float]:
+        """Read and compress one file; returns the entry, whether it came from the layer, and CPU time."""
+        started = time.thread_time()
+        with open(path, "rb") as source:
+            content = source.read()
+        entry = layer.match(name, content) if layer and level > 0 else None
+        if entry is not None:
+            return entry, True, time.thread_time() - started
+        st = os.stat(path)
+        entry = compress_entry(name, content, mode=st.st_mode, mtime=st.st_mtime, level=level)
+        return entry, False, time.thread_time() - started
+
+
+class IndexEntry:
+    """Where one member of an existing archive lives, from its central directory record."""
+
+    __slots__ = ("name", "offset", "compressed_size", "size", "method", "crc", "mode", "date_time")
+
+    def __init__(
+        self,
+        name: str,
+        offset: int,
+        compressed_size: int,
+        size: int,
+        method: int,
+        crc: int,
+        mode: int,
+        date_time: Tuple
+    ):
+        self.name = name
+        self.offset = offset
+        self.compressed_size = compressed_size
+        self.size = size
+        self.method = method
+        self.crc = crc
+        self.mode = mode
+        self.date_time = date_time
+
+
+class ArchiveIndex:
+    """Random access to the members of a ZIP archive through a memory map."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            # The map keeps its own handle; it stays valid if the file is deleted
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries: Dict[str, IndexEntry] = {}
+        self._read_central_directory()
+
+    def _read_central_directory(self):
+        data = self._map
+        # The end record sits at the very end, after an optional comment of up to 64 KiB
+        end = data.rfind(b"PK\x05\x06", max(0, len(data) - 0xFFFF - _END_RECORD.size))
+        if end < 0:
+            raise ValueError("Not a ZIP archive")
+        _, _, _, _, count, _, offset, _ = _END_RECORD.unpack_from(data, end)
+        for _ in range(count):
+            (
+                signature, _, _, flags, method, dos_time, dos_date, crc, compressed_size, size,
+                name_length, extra_length, comment_length, _, _, external, header_offset
+            ) = _CENTRAL_HEADER.unpack_from(data, offset)
+            if signature != 0x02014B50:
+                raise ValueError("Corrupt ZIP central directory")
+            start = offset + _CENTRAL_HEADER.size
+            raw_name = data[start:start + name_length]
+            name = raw_name.decode("utf-8" if flags & _UTF8_FLAG else "cp437")
+            date_time = (
+                (dos_date >> 9) + 1980, (dos_date >> 5) & 0xF, dos_date & 0x1F,
+                dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2
+            )
+            self.entries[name] = IndexEntry(
+                name, header_offset, compressed_size, size, method, crc, external >> 16, date_time
+            )
+            offset = start + name_length + extra_length + comment_length
+
+    def files(self) -> List[IndexEntry]:
+        return [entry for name, entry in self.entries.items() if not name.endswith("/")]
+
+    def stream(self, name: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield the uncompressed content of one member in chunks."""
+        entry = self.entries[name]
+        if entry.method not in (ZIP_STORED, ZIP_DEFLATED):
+            raise ValueError(f"Unsupported compression method {entry.method} for {name}")
+        # The local header's name and extra field may differ from the central directory's
+        name_length, extra_length = struct.unpack_from("<HH", self._map, entry.offset + 26)
+        start = entry.offset + _LOCAL_HEADER.size + name_length + extra_length
+        end = start + entry.compressed_size
+        decompressor = zlib.decompressobj(-15) if entry.method == ZIP_DEFLATED else None
+        for offset in range(start, end, chunk_size):
+            chunk = self._map[offset:min(offset + chunk_size, end)]
+            if decompressor is None:
+                yield chunk
+                continue
+            # Bound the output per step so a highly compressed chunk doesn't balloon
+            while chunk:
+                output = decompressor.decompress(chunk, chunk_size)
+                if output:
+                    yield output
+                chunk = decompressor.unconsumed_tail
+        if decompressor is not None:
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+
+
+class ArchiveIndexCache:
+    """LRU of open ``ArchiveIndex``es keyed by path, invalidated when the file changes."""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._indexes: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> ArchiveIndex:
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = ArchiveIndex(path)
+        with self._lock:
+            self._indexes[key] = index
+            # Evicted maps are closed when in-flight streams drop their reference
+            while len(self._indexes) > self.max_size:
+                self._indexes.popitem(last=False)
+        return index
@@ -0,0 +1,223 @@
+"""
+Memory held by the in-memory job store, per 100k retained jobs.
+
+Runs jobs through the same sequence of store writes as the API and the
+pipeline (create, lease, plan, render and package checkpoints) and reports
+the memory still allocated afterwards, with tracemalloc, for:
+
+- ``dicts``: jobs kept as the plain dicts they are written as (the store
+  before ``job_records``)
+- ``records``: ``MemoryJobStore``, with slotted records and shared plans
+- ``records+compact``: ``MemoryJobStore(compact_finished=True)``
+
+    python bench/job_memory.py --jobs 100000 --distinct-plans 0.3 --failed 0.05
+
+``--distinct-plans`` is the share of jobs whose plan is unique; the rest
+repeat one of those plans (semantic cache hits, retries, fallback plans).
+Every job still gets its own plan object, parsed from JSON as if it came
+from the planner. Also reports the time to read a job the first time (as
+``/projects`` and the change feed do) and again (as ``/status`` polling does).
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import MemoryJobStore  # noqa: E402
+
+STACKS = ["nextjs", "go", "python", "rust"]
+FEATURES = ["auth", "payments", "realtime", "frontend", "database", "search", "admin", "uploads"]
+WORDS = "shop bakery booking dashboard inventory chat blog tracker portal marketplace fitness recipes".split()
+
+
+class DictJobStore:
+    """The memory store as it was before job records: one dict per job."""
+
+    def __init__(self):
+        self._jobs = {}
+
+    def create(self, project_id, fields):
+        self._jobs[project_id] = dict(fields)
+
+    def get(self, project_id):
+        job = self._jobs.get(project_id)
+        return dict(job) if job is not None else None
+
+    def update(self, project_id, fields):
+        if project_id in self._jobs:
+            self._jobs[project_id].update(fields)
+
+    def acquire_lease(self, project_id, owner, ttl):
+        self._jobs[project_id].update({"lease_owner": owner, "lease_expires": time.time() + ttl})
+        return True
+
+
+def make_plans(count: int, rng: random.Random):
+    plans = []
+    for i in range(count):
+        stack = rng.choice(STACKS)
+        name = f"{rng.choice(WORDS)}-{rng.choice(WORDS)}-{i}"
+        plans.append(json.dumps({
+            "stack": stack,
+            "features": rng.sample(FEATURES, rng.randint(1, 4)),
+            "infra": "docker",
+            "db": rng.choice(["sqlite", "postgres"]),
+            "tests": "jest" if stack == "nextjs" else "pytest",
+            "project_name": name,
+            "description": f"A {rng.choice(WORDS)} app for {rng.choice(WORDS)} with {rng.choice(FEATURES)} support",
+            "complexity": rng.choice(["simple", "medium", "complex"]),
+            "estimated_files": rng.randint(8, 40)
+        }))
+    return plans
+
+
+def run_job(store, project_id: str, plan_json: str, failed: bool, rng: random.Random):
+    """The store writes one job makes, from /generate to completed or failed."""
+    tenant = f"tenant-{rng.randint(1, 50)}"
+    now = datetime.now()
+    request = {
+        "prompt": f"Build a {rng.choice(WORDS)} {rng.choice(WORDS)} with {rng.choice(FEATURES)} for #{project_id}",
+        "stack": rng.choice(STACKS + [None]),
+        "features": rng.sample(FEATURES, 2),
+        "tenant": tenant,
+        "compression_level": None,
+        "quality": "auto"
+    }
+    store.create(project_id, {
+        "status": "planning",
+        "progress": 0,
+        "message": "Analyzing requirements...",
+        "created_at": now,
+        "request": request,
+        "tenant": tenant,
+        "estimated_cost": round(rng.uniform(5, 90), 2),
+        "estimated_completion": now + timedelta(seconds=30)
+    })
+    store.acquire_lease(project_id, "host:1234", 60)
+    if failed:
+        store.update(project_id, {
+            "status": "failed",
+            "message": "Generation failed: planner timed out",
+            "error": "planner timed out",
+            "failed_at": datetime.now()
+        })
+        return
+
+    plan = json.loads(plan_json)
+    usage = {
+        "llm": {
+            "calls": 1,
+            "prompt_tokens": rng.randint(300, 900),
+            "completion_tokens": rng.randint(150, 600),
+            "total_seconds": round(rng.uniform(2, 20), 3)
+        },
+        "cpu_seconds": {"plan": round(rng.uniform(0, 0.05), 3)}
+    }
+    timings = {"plan": round(rng.uniform(2, 20), 3)}
+    store.update(project_id, {
+        "status": "generating",
+        "progress": 50,
+        "message": f"Generating {plan['stack']} project...",
+        "plan": plan,
+        "phase": "planned",
+        "timings": dict(timings),
+        "usage": copy.deepcopy(usage)
+    })
+    timings["render"] = round(rng.uniform(0.1, 1), 3)
+    usage["cpu_seconds"]["render"] = round(rng.uniform(0.05, 0.5), 3)
+    usage["bytes_written"] = rng.randint(20_000, 400_000)
+    store.update(project_id, {
+        "status": "packaging",
+        "progress": 80,
+        "message": "Creating project package...",
+        "files_created": plan["estimated_files"],
+        "phase": "rendered",
+        "timings": dict(timings),
+        "usage": copy.deepcopy(usage)
+    })
+    timings["package"] = round(rng.uniform(0.05, 0.5), 3)
+    usage["cpu_seconds"]["package"] = round(rng.uniform(0.05, 0.5), 3)
+    usage["archive_bytes"] = rng.randint(5_000, 100_000)
+    zip_filename = f"{plan['project_name']}_{project_id}.zip"
+    store.update(project_id, {
+        "status": "completed",
+        "progress": 100,
+        "message": "Project generated successfully!",
+        "download_url": f"/download/{zip_filename}",
+        "zip_path": f"/tmp/zero-artifacts/{zip_filename}",
+        "plan": plan,
+        "files_created": plan["estimated_files"],
+        "phase": "packaged",
+        "timings": dict(timings),
+        "usage": copy.deepcopy(usage),
+        "completed_at": datetime.now()
+    })
+
+
+def measure(name: str, store, args):
+    rng = random.Random(args.seed)
+    plans = make_plans(max(1, int(args.jobs * args.distinct_plans)), rng)
+    ids = [f"{i:08x}-{rng.getrandbits(64):016x}" for i in range(args.jobs)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i, project_id in enumerate(ids):
+        # Every plan is used once before any repeats
+        plan_json = plans[i] if i < len(plans) else rng.choice(plans)
+        run_job(store, project_id, plan_json, rng.random() < args.failed, rng)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    sample = rng.sample(ids, min(len(ids), 1000))
+    started = time.perf_counter()
+    for project_id in sample:
+        store.get(project_id)
+    read_us = (time.perf_counter() - started) / len(sample) * 1e6
+    started = time.perf_counter()
+    for project_id in sample:
+        for _ in range(10):
+            store.get(project_id)
+    poll_us = (time.perf_counter() - started) / len(sample) / 10 * 1e6
+    per_100k = held / args.jobs * 100_000 / 2**20
+    print(f"{name:<18}{per_100k:>14.1f}{held / args.jobs:>12.0f}{read_us:>12.1f}{poll_us:>12.1f}")
+    return per_100k
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=100_000)
+    parser.add_argument("--distinct-plans", type=float, default=0.3, help="share of jobs with a unique plan")
+    parser.add_argument("--failed", type=float, default=0.05, help="share of jobs that fail before planning")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.jobs} jobs, {args.distinct_plans:.0%} distinct plans, {args.failed:.0%} failed")
+    print(f"{'store':<18}{'MiB/100k jobs':>14}{'bytes/job':>12}{'read us':>12}{'poll us':>12}")
+    variants = {
+        "dicts": DictJobStore,
+        "records": MemoryJobStore,
+        "records+compact": lambda: MemoryJobStore(compact_finished=True)
+    }
+    results = {}
+    for name, factory in variants.items():
+        store = factory()
+        results[name] = measure(name, store, args)
+        del store
+    baseline = results["dicts"]
+    print()
+    for name, per_100k in results.items():
+        if name != "dicts":
+            print(f"{name}: {1 - per_100k / baseline:.0%} less than dicts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Planner LLM throughput under bursty load, with and without micro-batching.
+
+Sends bursts of concurrent planner requests to an Ollama server and reports
+plans/sec, generated tokens/sec and latency percentiles for each mode:
+
+    python bench/llm_batching.py --url http://localhost:11434 --parallel 4 \\
+        --requests 32 --burst 8 --window-ms 5
+
+Run it against a dedicated server; ``--parallel`` should match the server's
+OLLAMA_NUM_PARALLEL.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chains.ollama_client import OllamaClient  # noqa: E402
+from chains.planner import ProjectPlanner  # noqa: E402
+
+PROMPTS = [
+    "A blog with user login and comments",
+    "An online store with Stripe payments",
+    "A realtime chat app with rooms",
+    "A REST API for a todo list backed by Postgres",
+    "An analytics dashboard for website traffic",
+    "A URL shortener with click statistics",
+    "A recipe sharing site with image uploads",
+    "A CLI tool that syncs files to S3",
+]
+
+
+class _Recorder:
+    """Stands in for a tracing span to capture the client's per-request attributes."""
+
+    def __init__(self):
+        self.attributes = {}
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+def run(client: OllamaClient, planner: ProjectPlanner, requests: int, burst: int, interval: float):
+    prompts = planner.prompts.current()
+    latencies = []
+    tokens = 0
+
+    def one(i: int):
+        body = planner._build_request(prompts.planner_prompt(PROMPTS[i % len(PROMPTS)]), prompts.system)
+        recorder = _Recorder()
+        started = time.monotonic()
+        client.generate(body, span=recorder)
+        return time.monotonic() - started, recorder.attributes.get("eval_count", 0)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        futures = []
+        for i in range(requests):
+            if i and i % burst == 0:
+                time.sleep(interval)
+            futures.append(pool.submit(one, i))
+        for future in futures:
+            latency, eval_count = future.result()
+            latencies.append(latency)
+            tokens += eval_count
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "plans_per_s": requests / elapsed,
+        "tokens_per_s": tokens / elapsed,
+        "p50_s": latencies[len(latencies) // 2],
+        "p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
+    parser.add_argument("--parallel", type=int, default=4, help="backend OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--burst", type=int, default=8, help="requests sent together")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between bursts")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="micro-batch window")
+    parser.add_argument("--model", help="override the planner model")
+    args = parser.parse_args()
+
+    modes = [("direct", 0.0), (f"batched-{args.window_ms:g}ms", args.window_ms / 1000)]
+    print(f"{'mode':<16}{'plans/s':>10}{'tokens/s':>11}{'p50 s':>9}{'p95 s':>9}")
+    for name, window in modes:
+        client = OllamaClient([args.url], parallel=[args.parallel], batch_window=window)
+        planner = ProjectPlanner(args.url, client=client)
+        if args.model:
+            planner.model = args.model
+        result = run(client, planner, args.requests, args.burst, args.interval)
+        print(
+            f"{name:<16}{result['plans_per_s']:>10.2f}{result['tokens_per_s']:>11.1f}"
+            f"{result['p50_s']:>9.2f}{result['p95_s']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Project packaging throughput: ``shutil.make_archive`` vs the layered packager.
+
+Renders a real project for ``--stack``, pads it with ``--extra-files``
+synthetic source files (and a few already-compressed assets) to model larger
+generated projects, then packages it repeatedly and reports archives/sec,
+input MB/s and archive size for each path:
+
+    python bench/packaging.py --stack nextjs --extra-files 200 --file-kb 16 --workers 4
+
+Packager rows are given per deflate level and compression thread count.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archives import Packager, build_base_layers  # noqa: E402
+from chains.codegen import CodeGenerator  # noqa: E402
+from chains.planner import SUPPORTED_STACKS  # noqa: E402
+
+PLAN = {
+    "project_name": "bench-app",
+    "description": "A benchmark project with auth, payments and a dashboard",
+    "features": ["auth", "payments", "database", "realtime"],
+    "infra": "docker",
+    "db": "postgres",
+    "tests": "jest",
+}
+
+WORDS = (
+    "const let return function import export from await async if else for while "
+    "user session payment order item total price id name email token handler request response"
+).split()
+
+
+def render_project(work_dir: str, stack: str, extra_files: int, file_kb: int, rng: random.Random):
+    generator = CodeGenerator()
+    generator.generate_project(dict(PLAN, stack=stack), work_dir)
+    for i in range(extra_files):
+        path = os.path.join(work_dir, "src", f"module_{i // 20}", f"file_{i}.ts")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines = []
+        size = 0
+        while size < file_kb * 1024:
+            line = " ".join(rng.choice(WORDS) for _ in range(12)) + ";\n"
+            lines.append(line)
+            size += len(line)
+        with open(path, "w") as f:
+            f.writelines(lines)
+    # Images and fonts are already compressed; the packager stores them
+    for i in range(max(1, extra_files // 20)):
+        path = os.path.join(work_dir, "public", f"asset_{i}.png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(rng.randbytes(file_kb * 1024))
+    return generator
+
+
+def tree_bytes(work_dir: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(work_dir) for name in files
+    )
+
+
+def measure(package, repeat: int, input_bytes: int, zip_path: str):
+    package()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        package()
+    elapsed = time.perf_counter() - started
+    return repeat / elapsed, input_bytes * repeat / elapsed / 1e6, os.path.getsize(zip_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stack", default="nextjs", choices=SUPPORTED_STACKS)
+    parser.add_argument("--extra-files", type=int, default=200, help="synthetic source files added to the project")
+    parser.add_argument("--file-kb", type=int, default=16, help="size of each synthetic file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="compression threads")
+    parser.add_argument("--levels", default="1,6,9", help="deflate levels to compare")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="zero-bench-")
+    try:
+        work_dir = os.path.join(scratch, "work")
+        generator = render_project(work_dir, args.stack, args.extra_files, args.file_kb, random.Random(1))
+        input_bytes = tree_bytes(work_dir)
+        zip_path = os.path.join(scratch, "out.zip")
+        layers = build_base_layers(generator, SUPPORTED_STACKS)
+        print(f"{input_bytes / 1e6:.1f} MB input, {args.extra_files} extra files")
+        print(f"{'path':<24}{'archives/s':>12}{'MB/s':>10}{'size KB':>10}")
+
+        def make_archive():
+            shutil.make_archive(zip_path[:-len(".zip")], "zip", work_dir)
+
+        rate, throughput, size = measure(make_archive, args.repeat, input_bytes, zip_path)
+        print(f"{'make_archive':<24}{rate:>12.2f}{throughput:>10.1f}{size / 1024:>10.0f}")
+
+        for level in (int(level) for level in args.levels.split(",")):
+            for workers in sorted({1, args.workers}):
+                packager = Packager(layers, workers=workers, level=level)
+                rate, throughput, size = measure(
+                    lambda: packager.package(work_dir, zip_path, args.stack), args.repeat, input_bytes, zip_path
+                )
+                packager.executor.shutdown()
+                name = f"layered L{level} x{workers}"
+                print(f"{name:<24}{rate:>12.2f}{throughput:>10.1f}{size / 1024:>10.0f}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
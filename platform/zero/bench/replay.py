@@ -0,0 +1,365 @@
+"""
+Replay recorded production traffic against a local instance.
+
+Reads a ``ZERO_RECORD_FILE`` recording (see ``recording``), starts fake
+Ollama backends that answer each planner call with the recorded time to
+first token, duration and plan, and sends the recorded ``/generate``
+requests with their original spacing, ``--speed`` times faster:
+
+    python bench/replay.py traffic.jsonl --speed 10 --backends 2 --parallel 4
+
+By default an API server is started on the fake backends with the current
+environment, so caching, scheduling and batching changes are compared by
+replaying the same file with different settings, e.g.
+
+    ZERO_SEMANTIC_CACHE=hashing python bench/replay.py traffic.jsonl --speed 10
+    ZERO_JOB_SCHEDULING=fifo python bench/replay.py traffic.jsonl --speed 10
+
+``--target`` replays against an instance that is already running (its
+backends should then be started with ``--fake-only``, and recorded tenants
+only stay apart if it maps each tenant pseudonym as an API key to itself
+in ``ZERO_API_KEYS``). LLM latencies are
+divided by ``--speed`` too, so the load shape is preserved; each fake
+backend serves ``--parallel`` calls at a time and queues the rest, like
+OLLAMA_NUM_PARALLEL. Calls beyond what was recorded for a prompt (e.g. an
+audit of a cached plan) get the median recorded latency.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ZERO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ZERO_DIR)
+
+from chains.prompt_registry import DEFAULT_PROMPTS_FILE, PromptRegistry  # noqa: E402
+
+FALLBACK_PLAN = {
+    "stack": "nextjs",
+    "features": ["auth"],
+    "infra": "docker",
+    "db": "postgres",
+    "tests": "jest",
+    "project_name": "replayed-app",
+    "description": "Replayed project",
+}
+CHUNKS = 16
+
+
+def load_recording(path: str, limit: int = 0):
+    """Return the recorded requests in arrival order and the results by job."""
+    requests, results = [], {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["type"] == "request":
+                requests.append(record)
+            elif record["type"] == "result":
+                results[record["job"]] = record
+    requests.sort(key=lambda record: record["ts"])
+    return requests[:limit] if limit else requests, results
+
+
+class RecordedCalls:
+    """The recorded planner calls per prompt, handed out in recorded order."""
+
+    def __init__(self, requests, results, prompts_file: str):
+        # prompt -> jobs still to be replayed, each a deque of (call, output)
+        self._jobs = defaultdict(deque)
+        self._plans = {}
+        calls = []
+        for request in requests:
+            result = results.get(request["job"])
+            if request["outcome"] != "started" or not result:
+                continue
+            plan = {k: v for k, v in (result.get("plan") or {}).items() if k not in ("model", "escalations", "degraded")}
+            self._plans.setdefault(request["prompt"], plan)
+            job = deque()
+            for i, call in enumerate(result.get("llm") or []):
+                last = i == len(result["llm"]) - 1
+                job.append((call, json.dumps(plan) if last else None))
+                calls.append(call)
+            if job:
+                self._jobs[request["prompt"]].append(job)
+        self.median = {
+            key: statistics.median(call[key] for call in calls) if calls else default
+            for key, default in (("ttft", 0.5), ("seconds", 5.0), ("completion_tokens", 200), ("prompt_tokens", 400))
+        }
+        self.served = self.unmatched = 0
+        self._lock = threading.Lock()
+        # The planner prompt is the template with the user's prompt substituted
+        marker = "\x00"
+        self._prefix, _, self._suffix = PromptRegistry(prompts_file).current().planner_prompt(marker).partition(marker)
+
+    def next_call(self, planner_prompt: str):
+        """``(call, output)`` for the next call with this prompt; output None means a rejected draft."""
+        prompt = planner_prompt
+        if prompt.startswith(self._prefix) and prompt.endswith(self._suffix):
+            prompt = prompt[len(self._prefix):len(prompt) - len(self._suffix)]
+        with self._lock:
+            jobs = self._jobs.get(prompt)
+            if jobs:
+                self.served += 1
+                call, output = jobs[0].popleft()
+                if not jobs[0]:
+                    jobs.popleft()
+                return call, output
+            self.unmatched += 1
+        return dict(self.median, response_bytes=0), json.dumps(self._plans.get(prompt, FALLBACK_PLAN))
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The API cancels streams (hedges, shutdown) by killing curl mid-response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def fake_ollama(calls: RecordedCalls, speed: float, parallel: int) -> ThreadingHTTPServer:
+    """An Ollama stand-in serving ``parallel`` calls at a time with recorded latencies."""
+    slots = threading.Semaphore(parallel)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_chunk(self, payload):
+            line = (json.dumps(payload) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        def do_GET(self):
+            self._send_json({"models": []})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+            if self.path == "/api/embeddings":
+                # Deterministic, so identical prompts embed identically
+                digest = hashlib.sha256(body.get("prompt", "").encode()).digest()
+                self._send_json({"embedding": [b / 255 for b in digest]})
+                return
+            if not body.get("prompt"):
+                # Model preload from the warm-up
+                self._send_json({"model": body.get("model"), "response": "", "done": True})
+                return
+
+            call, output = calls.next_call(body["prompt"])
+            if output is None:
+                # A draft the planner rejected: same size, not a plan
+                output = "x" * max(1, call.get("response_bytes", 0))
+            with slots:
+                time.sleep(call["ttft"] / speed)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                step = max(1, -(-len(output) // CHUNKS))
+                pause = max(0.0, call["seconds"] - call["ttft"]) / speed / CHUNKS
+                for i in range(0, len(output), step):
+                    self._send_chunk({"model": body.get("model"), "response": output[i:i + step], "done": False})
+                    time.sleep(pause)
+                self._send_chunk({
+                    "model": body.get("model"),
+                    "response": "",
+                    "done": True,
+                    "prompt_eval_count": call.get("prompt_tokens", 0),
+                    "eval_count": call.get("completion_tokens", 0),
+                    "total_duration": int(call["seconds"] / speed * 1e9),
+                })
+                self.wfile.write(b"0\r\n\r\n")
+
+    server = _QuietServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http(method: str, url: str, payload=None, headers=None, timeout: float = 30):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(
+        url, data=data, method=method, headers={"Content-Type": "application/json", **(headers or {})}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def start_server(backend_urls, scratch: str, tenants):
+    port = free_port()
+    env = dict(
+        os.environ,
+        OLLAMA_BASE_URL=backend_urls[0],
+        OLLAMA_BASE_URLS=",".join(backend_urls),
+        ZERO_ARTIFACT_DIR=os.path.join(scratch, "artifacts"),
+        ZERO_RECORD_FILE="",
+        # Each recorded tenant pseudonym is its own API key, so tenants stay apart
+        ZERO_API_KEYS=",".join(f"{tenant}={tenant}" for tenant in sorted(tenants)),
+    )
+    log_path = os.path.join(scratch, "server.log")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ZERO_DIR, env=env, stdout=open(log_path, "w"), stderr=subprocess.STDOUT
+    )
+    target = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as f:
+                sys.stderr.write(f.read()[-4000:])
+            raise SystemExit(f"API server exited with status {process.returncode}")
+        try:
+            if http("GET", f"{target}/ready", timeout=2)[0] == 200:
+                return process, target
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise SystemExit("API server did not become ready within 60s")
+
+
+def replay_one(target: str, record, poll: float, timeout: float):
+    """Send one recorded request and follow its job to the end."""
+    headers = {"X-API-Key": record["tenant"]}
+    if record.get("idempotency_key"):
+        headers["Idempotency-Key"] = record["idempotency_key"]
+    payload = {
+        key: record[key]
+        for key in ("prompt", "stack", "features", "quality", "compression_level")
+        if record.get(key) is not None
+    }
+    started = time.monotonic()
+    status, response = http("POST", f"{target}/generate", payload, headers)
+    if status != 200:
+        return {"outcome": "rate_limited" if status == 429 else f"http_{status}"}
+    attached = response["message"].startswith("Attached")
+    deadline = started + timeout
+    while time.monotonic() < deadline:
+        status, job = http("GET", f"{target}/status/{response['project_id']}")
+        if status == 200 and job["status"] in ("completed", "failed"):
+            return {
+                "outcome": "attached" if attached else job["status"],
+                "seconds": time.monotonic() - started
+            }
+        time.sleep(poll)
+    return {"outcome": "timeout"}
+
+
+def percentiles(values):
+    if not values:
+        return "-"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]  # noqa: E731
+    return f"p50 {pick(0.5):.2f}s  p95 {pick(0.95):.2f}s  p99 {pick(0.99):.2f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="JSONL written with ZERO_RECORD_FILE")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay N times faster (arrivals and LLM latency)")
+    parser.add_argument("--backends", type=int, default=1, help="fake Ollama backends")
+    parser.add_argument("--parallel", type=int, default=4, help="concurrent calls per fake backend")
+    parser.add_argument("--target", help="replay against this running instance instead of starting one")
+    parser.add_argument("--fake-only", action="store_true", help="only run the fake backends (for --target setups)")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N requests")
+    parser.add_argument("--clients", type=int, default=256, help="requests in flight at most")
+    parser.add_argument("--poll", type=float, default=0.1, help="seconds between status polls")
+    parser.add_argument("--timeout", type=float, default=600, help="give up on a job after this many seconds")
+    parser.add_argument("--prompts-file", default=os.getenv("ZERO_PROMPTS_FILE") or DEFAULT_PROMPTS_FILE)
+    args = parser.parse_args()
+
+    requests, results = load_recording(args.recording, args.limit)
+    if not requests:
+        raise SystemExit(f"No requests in {args.recording}")
+    calls = RecordedCalls(requests, results, args.prompts_file)
+    backends = [fake_ollama(calls, args.speed, args.parallel) for _ in range(args.backends)]
+    backend_urls = [f"http://127.0.0.1:{backend.server_address[1]}" for backend in backends]
+    if args.fake_only:
+        print("Fake Ollama backends: " + ",".join(backend_urls))
+        threading.Event().wait()
+
+    scratch = tempfile.mkdtemp(prefix="zero-replay-")
+    server = None
+    try:
+        target = args.target
+        if not target:
+            server, target = start_server(backend_urls, scratch, {record["tenant"] for record in requests})
+
+        span = requests[-1]["ts"] - requests[0]["ts"]
+        print(
+            f"Replaying {len(requests)} requests spanning {span:.0f}s at {args.speed:g}x "
+            f"against {target} ({args.backends} fake backend(s) x{args.parallel})"
+        )
+        executor = ThreadPoolExecutor(max_workers=args.clients)
+        started = time.monotonic()
+        lag = 0.0
+        futures = []
+        for record in requests:
+            due = started + (record["ts"] - requests[0]["ts"]) / args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+            futures.append(executor.submit(replay_one, target, record, args.poll, args.timeout))
+        outcomes = [future.result() for future in futures]
+        elapsed = time.monotonic() - started
+        executor.shutdown()
+
+        counts = defaultdict(int)
+        for outcome in outcomes:
+            counts[outcome["outcome"]] += 1
+        recorded = [
+            (results[r["job"]]["ts"] - r["ts"]) / args.speed
+            for r in requests if r["outcome"] == "started" and results.get(r["job"], {}).get("status") == "completed"
+        ]
+        replayed = [outcome["seconds"] for outcome in outcomes if outcome["outcome"] == "completed"]
+        print(f"outcomes       {dict(counts)}")
+        print(f"duration       {elapsed:.1f}s, {counts['completed'] / elapsed:.2f} jobs/s, max send lag {lag:.2f}s")
+        print(f"recorded       {percentiles(recorded)}  (scaled by 1/{args.speed:g})")
+        print(f"replayed       {percentiles(replayed)}")
+        print(f"llm calls      {calls.served} from recording, {calls.unmatched} at median latency")
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        for backend in backends:
+            backend.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
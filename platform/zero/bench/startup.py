@@ -0,0 +1,123 @@
+"""
+Cold start time of an API worker, with a regression budget.
+
+Starts fresh interpreters that import ``server``, run ``init_services`` and
+the warm-up, and reports the median of each phase with and without a
+startup snapshot:
+
+    python bench/startup.py --runs 5 --budget-ms 1500
+
+Exits with status 1 when the median import + init time of the snapshot
+variant exceeds ``--budget-ms``, printing the modules with the largest
+self import time, so it can gate CI. Warm-up is reported but not budgeted:
+it depends on the backends. Without ``--ollama`` model preloads fail fast
+and the warm-up only measures spawning ``--executor process`` job workers.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ZERO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ZERO_DIR)
+
+from startup import build_snapshot, write_snapshot  # noqa: E402
+
+CHILD = """
+import asyncio, json, logging, time
+started = time.perf_counter()
+import server
+imported = time.perf_counter()
+logging.disable(logging.WARNING)
+server.init_services()
+initialized = time.perf_counter()
+asyncio.run(server.warm_up_services())
+warmed = time.perf_counter()
+server.job_executor.shutdown()
+print(json.dumps({
+    "import": imported - started,
+    "init": initialized - imported,
+    "warmup": warmed - initialized,
+}))
+"""
+PHASES = ("interpreter", "import", "init", "warmup")
+
+
+def run_once(env):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ZERO_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    total = time.perf_counter() - started
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    # Interpreter startup and teardown: everything outside the measured phases
+    phases["interpreter"] = total - sum(phases.values())
+    return phases
+
+
+def slowest_imports(env, count: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=ZERO_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+\d+ \|(\s*)(\S+)", line)
+        if match:
+            rows.append((int(match.group(1)), match.group(3)))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--executor", default="thread", choices=["thread", "process"])
+    parser.add_argument("--workers", type=int, default=2, help="job workers (ZERO_JOB_WORKERS)")
+    parser.add_argument("--ollama", default="http://127.0.0.1:9", help="backend to preload models on")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="limit for median import + init")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="zero-bench-")
+    try:
+        snapshot_path = os.path.join(scratch, "snapshot.pkl")
+        write_snapshot(snapshot_path, build_snapshot())
+        env = dict(
+            os.environ,
+            OLLAMA_BASE_URL=args.ollama,
+            ZERO_ARTIFACT_DIR=os.path.join(scratch, "artifacts"),
+            ZERO_JOB_EXECUTOR=args.executor,
+            ZERO_JOB_WORKERS=str(args.workers),
+            ZERO_JOB_STORE=f"sqlite:///{scratch}/jobs.db" if args.executor == "process" else "memory",
+            ZERO_WARMUP_TIMEOUT="30"
+        )
+        env.pop("ZERO_STARTUP_SNAPSHOT", None)
+        variants = {"no snapshot": env, "snapshot": dict(env, ZERO_STARTUP_SNAPSHOT=snapshot_path)}
+
+        print(f"{args.runs} runs, {args.executor} executor x{args.workers}, median ms")
+        print(f"{'variant':<14}" + "".join(f"{phase:>13}" for phase in PHASES))
+        medians = {}
+        for name, variant_env in variants.items():
+            runs = [run_once(variant_env) for _ in range(args.runs)]
+            medians[name] = {phase: statistics.median(run[phase] for run in runs) * 1000 for phase in PHASES}
+            print(f"{name:<14}" + "".join(f"{medians[name][phase]:>13.1f}" for phase in PHASES))
+
+        cold_start = medians["snapshot"]["import"] + medians["snapshot"]["init"]
+        if cold_start > args.budget_ms:
+            print(f"\nFAIL: import + init {cold_start:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+            print("Largest self import times:")
+            for micros, module in slowest_imports(variants["snapshot"], 15):
+                print(f"  {micros / 1000:>8.1f} ms  {module}")
+            sys.exit(1)
+        print(f"\nOK: import + init {cold_start:.1f} ms within the {args.budget_ms:.0f} ms budget")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
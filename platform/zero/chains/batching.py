@@ -0,0 +1,128 @@
+"""
+Micro-batching of LLM requests onto backend parallel slots.
+
+Ollama serves up to ``OLLAMA_NUM_PARALLEL`` sequences per model at once and
+queues the rest. Instead of letting requests trickle in one by one, the
+batcher holds them for a short window (or until the free slots are filled)
+and releases them together, assigning each to a backend slot. A backend has
+as many slots as its adaptive in-flight limit currently allows, or its
+parallel capacity without one, and the request is sent to the backend that
+owns its slot. Excess requests wait here instead of in Ollama's queue. That wait is bounded by the caller's
+``timeout`` (the client's queue timeout) and raises ``SlotTimeoutError`` when
+it runs out. The request's own deadline and hedging only start once it is
+released.
+
+Each caller still runs and streams its own request; batching only decides
+when it starts and on which backend.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import metrics
+
+LLM_BATCH_SIZE = metrics.Histogram(
+    "zero_llm_batch_size", "LLM requests released together by the micro-batcher",
+    buckets=(1, 2, 4, 8, 16, 32)
+)
+LLM_BATCH_WAIT = metrics.Histogram(
+    "zero_llm_batch_wait_seconds", "Time LLM requests waited in the micro-batcher",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+
+
+class SlotTimeoutError(TimeoutError):
+    pass
+
+
+class _Ticket:
+    __slots__ = ("event", "backend", "queued_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.backend = None
+        self.queued_at = time.monotonic()
+
+
+class MicroBatcher:
+    def __init__(self, backends: List, window: float = 0.005):
+        self.window = window
+        self.backends = backends
+        # Slots handed out per backend; a shrinking limit can leave more than it allows
+        self._busy: Dict[str, int] = {backend.url: 0 for backend in backends}
+        self._waiting: deque = deque()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name="llm-batcher", daemon=True).start()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """Wait up to ``timeout`` seconds to be released in a batch; yields the backend to send to.
+
+        Raises ``SlotTimeoutError`` if no backend slot was assigned in time.
+        """
+        ticket = _Ticket()
+        with self._cond:
+            self._waiting.append(ticket)
+            self._cond.notify_all()
+        if not ticket.event.wait(timeout):
+            with self._cond:
+                # The batcher may have assigned a slot just as the wait ran out
+                if ticket.backend is None:
+                    self._waiting.remove(ticket)
+                    LLM_BATCH_WAIT.observe(time.monotonic() - ticket.queued_at)
+                    raise SlotTimeoutError(f"No LLM backend slot was free within {timeout:g}s")
+        try:
+            yield ticket.backend
+        finally:
+            with self._cond:
+                self._busy[ticket.backend.url] -= 1
+                # Limits only change while requests run, so a release is when slots may appear
+                self._cond.notify_all()
+
+    def _free(self, backend) -> int:
+        slots = int(backend.limiter.limit) if backend.limiter else backend.parallel
+        return max(0, slots - self._busy[backend.url])
+
+    def _free_slots(self) -> int:
+        return sum(self._free(backend) for backend in self.backends)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._waiting:
+                    self._cond.wait()
+                # Collect arrivals until the window closes or they fill every free slot
+                deadline = self._waiting[0].queued_at + self.window
+                while len(self._waiting) < self._free_slots():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                while not self._free_slots():
+                    self._cond.wait()
+                batch = []
+                while self._waiting and self._free_slots():
+                    ticket = self._waiting.popleft()
+                    ticket.backend = self._pick_backend()
+                    self._busy[ticket.backend.url] += 1
+                    batch.append(ticket)
+
+            if not batch:
+                # Everyone waiting timed out meanwhile
+                continue
+            now = time.monotonic()
+            LLM_BATCH_SIZE.observe(len(batch))
+            for ticket in batch:
+                LLM_BATCH_WAIT.observe(now - ticket.queued_at)
+                ticket.event.set()
+
+    def _pick_backend(self):
+        """The backend with the most free slots, preferring ones whose circuit isn't open."""
+        candidates = [backend for backend in self.backends if self._free(backend) > 0]
+        return max(candidates, key=lambda backend: (not backend.breaker.is_open(), self._free(backend)))
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"waiting": len(self._waiting), "free_slots": self._free_slots()}
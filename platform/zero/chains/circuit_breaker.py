@@ -0,0 +1,89 @@
+"""
+Circuit breaker for LLM backends.
+
+- closed: calls go through; ``failure_threshold`` consecutive failures open it
+- open: calls are refused immediately for ``reset_timeout`` seconds
+- half-open: a single probe call is let through; success closes the circuit,
+  failure opens it again
+"""
+import threading
+import time
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = metrics.Gauge(
+    "zero_llm_circuit_state", "LLM circuit breaker state (0 closed, 1 half-open, 2 open)", ["backend"]
+)
+CIRCUIT_TRANSITIONS = metrics.Counter(
+    "zero_llm_circuit_transitions_total", "LLM circuit breaker state changes", ["backend", "state"]
+)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, backend=name)
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half-open state this claims the probe."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def is_open(self) -> bool:
+        """Whether calls are currently refused outright (open and not yet due for a probe)."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def release(self):
+        """Give back a claimed call that ended without an outcome (e.g. a cancelled hedge)."""
+        with self._lock:
+            self._probing = False
+
+    def _transition(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], backend=self.name)
+        CIRCUIT_TRANSITIONS.inc(backend=self.name, state=state)
+        print(f"LLM circuit for {self.name} is now {state}")
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
@@ -4,90 +4,113 @@ Code generation chain for creating project files based on specifications.
 import json
 import os
 import subprocess
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from pathlib import Path
 
+import tracing
+
 class CodeGenerator:
     def __init__(self, ollama_base_url: str = "http://localhost:11434"):
         self.ollama_base_url = ollama_base_url
         self.model = "codellama:13b-instruct"
         self.templates = self._load_templates()
     
-    def generate_project(self, plan: Dict[str, Any], output_dir: str) -> List[str]:
-        """Generate complete project based on plan."""
-        created_files = []
-        
+    def generate_project(
+        self,
+        plan: Dict[str, Any],
+        output_dir: str,
+        scaffold: Optional[List[str]] = None
+    ) -> List[str]:
+        """Generate complete project based on plan.
+        
+        If ``scaffold`` is given it must be the result of an earlier
+        ``generate_scaffold`` call for the same stack and project name into
+        ``output_dir``; those files are kept instead of being rewritten.
+        """
         # Create project structure
         os.makedirs(output_dir, exist_ok=True)
         
+        # Stack-level scaffold (configs, .gitignore, base layout)
+        if scaffold is None:
+            scaffold = self.generate_scaffold(plan, output_dir)
+        created_files = list(scaffold)
+        
         # Generate based on stack
-        if plan["stack"] == "nextjs":
-            created_files.extend(self._generate_nextjs_project(plan, output_dir))
-        elif plan["stack"] == "go":
-            created_files.extend(self._generate_go_project(plan, output_dir))
-        elif plan["stack"] == "python":
-            created_files.extend(self._generate_python_project(plan, output_dir))
-        elif plan["stack"] == "rust":
-            created_files.extend(self._generate_rust_project(plan, output_dir))
+        with tracing.span(f"codegen.generate_{plan['stack']}_project"):
+            if plan["stack"] == "nextjs":
+                created_files.extend(self._generate_nextjs_project(plan, output_dir))
+            elif plan["stack"] == "go":
+                created_files.extend(self._generate_go_project(plan, output_dir))
+            elif plan["stack"] == "python":
+                created_files.extend(self._generate_python_project(plan, output_dir))
+            elif plan["stack"] == "rust":
+                created_files.extend(self._generate_rust_project(plan, output_dir))
         
         # Generate common files
-        created_files.extend(self._generate_common_files(plan, output_dir))
+        with tracing.span("codegen.generate_common_files"):
+            created_files.extend(self._generate_common_files(plan, output_dir))
         
         return created_files
     
-    def _generate_nextjs_project(self, plan: Dict[str, Any], output_dir: str) -> List[str]:
-        """Generate Next.js project files."""
+    def generate_scaffold(self, plan: Dict[str, Any], output_dir: str) -> List[str]:
+        """Write the stack-level scaffold for a plan.
+        
+        The scaffold only depends on ``stack`` and ``project_name``, so it can
+        be written before the rest of the plan is known.
+        """
         created_files = []
         
-        # package.json
-        package_json = {
-            "name": plan["project_name"],
-            "version": "0.1.0",
-            "private": True,
-            "scripts": {
-                "dev": "next dev",
-                "build": "next build",
-                "start": "next start",
-                "lint": "next lint",
-                "test": "jest"
-            },
-            "dependencies": {
-                "next": "14.0.0",
-                "react": "^18.2.0",
-                "react-dom": "^18.2.0"
-            },
-            "devDependencies": {
-                "@types/node": "^20.0.0",
-                "@types/react": "^18.2.0",
-                "@types/react-dom": "^18.2.0",
-                "autoprefixer": "^10.4.16",
-                "eslint": "^8.54.0",
-                "eslint-config-next": "14.0.0",
-                "jest": "^29.7.0",
-                "postcss": "^8.4.31",
-                "tailwindcss": "^3.3.5",
-                "typescript": "^5.3.2"
-            }
-        }
+        with tracing.span("codegen.generate_scaffold", stack=plan["stack"]):
+            for relative_path, content in self._scaffold_files(plan).items():
+                file_path = os.path.join(output_dir, relative_path)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, 'w') as f:
+                    f.write(content)
+                created_files.append(file_path)
         
-        # Add feature-specific dependencies
-        if "auth" in plan["features"]:
-            package_json["dependencies"]["next-auth"] = "^4.24.5"
-        if "payments" in plan["features"]:
-            package_json["dependencies"]["stripe"] = "^14.9.0"
-        if "realtime" in plan["features"]:
-            package_json["dependencies"]["socket.io-client"] = "^4.7.4"
-        if "database" in plan["features"]:
-            package_json["dependencies"]["prisma"] = "^5.6.0"
-            package_json["dependencies"]["@prisma/client"] = "^5.6.0"
+        return created_files
+    
+    def _scaffold_files(self, plan: Dict[str, Any]) -> Dict[str, str]:
+        """Return the scaffold files (relative path -> content) for a plan."""
+        files = dict(self.static_files(plan["stack"]))
         
-        package_file = os.path.join(output_dir, "package.json")
-        with open(package_file, 'w') as f:
-            json.dump(package_json, f, indent=2)
-        created_files.append(package_file)
+        if plan["stack"] == "go":
+            # go.mod
+            go_mod = f'''module {plan["project_name"]}
+
+go 1.21
+
+require (
+	github.com/gin-gonic/gin v1.9.1
+	github.com/joho/godotenv v1.5.1
+)'''
+            files["go.mod"] = go_mod
+        elif plan["stack"] == "rust":
+            # Cargo.toml
+            cargo_toml = f'''[package]
+name = "{plan["project_name"].replace("-", "_")}"
+version = "0.1.0"
+edition = "2021"
+
+[dependencies]
+tokio = {{ version = "1.35", features = ["full"] }}
+serde = {{ version = "1.0", features = ["derive"] }}
+serde_json = "1.0"
+warp = "0.3"'''
+            files["Cargo.toml"] = cargo_toml
+        
+        return files
+    
+    def static_files(self, stack: str) -> Dict[str, str]:
+        """Return the scaffold files that are identical for every plan of a stack.
         
-        # Next.js config
-        next_config = '''/** @type {import('next').NextConfig} */
+        These only depend on ``stack``, so packaging can prebuild them once.
+        """
+        files = {}
+        
+        if stack == "nextjs":
+            # Next.js config
+            next_config = '''/** @type {import('next').NextConfig} */
 const nextConfig = {
   experimental: {
     appDir: true,
@@ -95,14 +118,10 @@ const nextConfig = {
 }
 
 module.exports = nextConfig'''
-        
-        config_file = os.path.join(output_dir, "next.config.js")
-        with open(config_file, 'w') as f:
-            f.write(next_config)
-        created_files.append(config_file)
-        
-        # TypeScript config
-        tsconfig = '''{
+            files["next.config.js"] = next_config
+            
+            # TypeScript config
+            tsconfig = '''{
   "compilerOptions": {
     "target": "es5",
     "lib": ["dom", "dom.iterable", "es6"],
@@ -129,14 +148,10 @@ module.exports = nextConfig'''
   "include": ["next-env.d.ts", "**/*.ts", "**/*.tsx", ".next/types/**/*.ts"],
   "exclude": ["node_modules"]
 }'''
-        
-        tsconfig_file = os.path.join(output_dir, "tsconfig.json")
-        with open(tsconfig_file, 'w') as f:
-            f.write(tsconfig)
-        created_files.append(tsconfig_file)
-        
-        # Tailwind config
-        tailwind_config = '''/** @type {import('tailwindcss').Config} */
+            files["tsconfig.json"] = tsconfig
+            
+            # Tailwind config
+            tailwind_config = '''/** @type {import('tailwindcss').Config} */
 module.exports = {
   content: [
     './pages/**/*.{js,ts,jsx,tsx,mdx}',
@@ -148,11 +163,114 @@ module.exports = {
   },
   plugins: [],
 }'''
+            files["tailwind.config.js"] = tailwind_config
+            
+            # Globals CSS
+            globals_css = '''@tailwind base;
+@tailwind components;
+@tailwind utilities;'''
+            files["app/globals.css"] = globals_css
         
-        tailwind_file = os.path.join(output_dir, "tailwind.config.js")
-        with open(tailwind_file, 'w') as f:
-            f.write(tailwind_config)
-        created_files.append(tailwind_file)
+        # .gitignore
+        gitignore_content = '''# Dependencies
+node_modules/
+__pycache__/
+target/
+vendor/
+
+# Environment variables
+.env
+.env.local
+.env.development.local
+.env.test.local
+.env.production.local
+
+# Build outputs
+dist/
+build/
+.next/
+
+# IDE
+.vscode/
+.idea/
+*.swp
+*.swo
+
+# OS
+.DS_Store
+Thumbs.db
+
+# Logs
+*.log
+npm-debug.log*
+yarn-debug.log*
+yarn-error.log*
+
+# Database
+*.db
+*.sqlite
+
+# Coverage
+coverage/
+.nyc_output/
+
+# Temporary files
+tmp/
+temp/'''
+        files[".gitignore"] = gitignore_content
+        
+        return files
+    
+    def _generate_nextjs_project(self, plan: Dict[str, Any], output_dir: str) -> List[str]:
+        """Generate Next.js project files."""
+        created_files = []
+        
+        # package.json
+        package_json = {
+            "name": plan["project_name"],
+            "version": "0.1.0",
+            "private": True,
+            "scripts": {
+                "dev": "next dev",
+                "build": "next build",
+                "start": "next start",
+                "lint": "next lint",
+                "test": "jest"
+            },
+            "dependencies": {
+                "next": "14.0.0",
+                "react": "^18.2.0",
+                "react-dom": "^18.2.0"
+            },
+            "devDependencies": {
+                "@types/node": "^20.0.0",
+                "@types/react": "^18.2.0",
+                "@types/react-dom": "^18.2.0",
+                "autoprefixer": "^10.4.16",
+                "eslint": "^8.54.0",
+                "eslint-config-next": "14.0.0",
+                "jest": "^29.7.0",
+                "postcss": "^8.4.31",
+                "tailwindcss": "^3.3.5",
+                "typescript": "^5.3.2"
+            }
+        }
+        
+        # Add feature-specific dependencies
+        if "auth" in plan["features"]:
+            package_json["dependencies"]["next-auth"] = "^4.24.5"
+        if "payments" in plan["features"]:
+            package_json["dependencies"]["stripe"] = "^14.9.0"
+        if "realtime" in plan["features"]:
+            package_json["dependencies"]["socket.io-client"] = "^4.7.4"
+        if "database" in plan["features"]:
+            package_json["dependencies"]["prisma"] = "^5.6.0"
+            package_json["dependencies"]["@prisma/client"] = "^5.6.0"
+        
+        package_file = os.path.join(output_dir, "package.json")
+        with open(package_file, 'w') as f:
+            json.dump(package_json, f, indent=2)
+        created_files.append(package_file)
         
         # Create app directory structure
         app_dir = os.path.join(output_dir, "app")
@@ -218,37 +336,12 @@ export default function RootLayout({
             f.write(page_content)
         created_files.append(page_file)
         
-        # Globals CSS
-        globals_css = '''@tailwind base;
-@tailwind components;
-@tailwind utilities;'''
-        
-        globals_file = os.path.join(app_dir, "globals.css")
-        with open(globals_file, 'w') as f:
-            f.write(globals_css)
-        created_files.append(globals_file)
-        
         return created_files
     
     def _generate_go_project(self, plan: Dict[str, Any], output_dir: str) -> List[str]:
         """Generate Go project files."""
         created_files = []
         
-        # go.mod
-        go_mod = f'''module {plan["project_name"]}
-
-go 1.21
-
-require (
-	github.com/gin-gonic/gin v1.9.1
-	github.com/joho/godotenv v1.5.1
-)'''
-        
-        go_mod_file = os.path.join(output_dir, "go.mod")
-        with open(go_mod_file, 'w') as f:
-            f.write(go_mod)
-        created_files.append(go_mod_file)
-        
         # main.go
         main_go = '''package main
 
@@ -374,23 +467,6 @@ if __name__ == "__main__":
         """Generate Rust project files."""
         created_files = []
         
-        # Cargo.toml
-        cargo_toml = f'''[package]
-name = "{plan["project_name"].replace("-", "_")}"
-version = "0.1.0"
-edition = "2021"
-
-[dependencies]
-tokio = {{ version = "1.35", features = ["full"] }}
-serde = {{ version = "1.0", features = ["derive"] }}
-serde_json = "1.0"
-warp = "0.3"'''
-        
-        cargo_file = os.path.join(output_dir, "Cargo.toml")
-        with open(cargo_file, 'w') as f:
-            f.write(cargo_toml)
-        created_files.append(cargo_file)
-        
         # src/main.rs
         src_dir = os.path.join(output_dir, "src")
         os.makedirs(src_dir, exist_ok=True)
@@ -555,58 +631,6 @@ This project is licensed under the MIT License - see the LICENSE file for detail
             f.write(readme)
         created_files.append(readme_file)
         
-        # .gitignore
-        gitignore_content = '''# Dependencies
-node_modules/
-__pycache__/
-target/
-vendor/
-
-# Environment variables
-.env
-.env.local
-.env.development.local
-.env.test.local
-.env.production.local
-
-# Build outputs
-dist/
-build/
-.next/
-
-# IDE
-.vscode/
-.idea/
-*.swp
-*.swo
-
-# OS
-.DS_Store
-Thumbs.db
-
-# Logs
-*.log
-npm-debug.log*
-yarn-debug.log*
-yarn-error.log*
-
-# Database
-*.db
-*.sqlite
-
-# Coverage
-coverage/
-.nyc_output/
-
-# Temporary files
-tmp/
-temp/'''
-        
-        gitignore_file = os.path.join(output_dir, ".gitignore")
-        with open(gitignore_file, 'w') as f:
-            f.write(gitignore_content)
-        created_files.append(gitignore_file)
-        
         return created_files
     
     def _load_templates(self) -> Dict[str, str]:
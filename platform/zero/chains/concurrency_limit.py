@@ -0,0 +1,102 @@
+"""
+Adaptive concurrency limits for LLM backends.
+
+A fixed cap on in-flight requests is either too low (a small model is hot and
+could serve more) or too high (a large model is loading and requests just
+pile up in Ollama's queue). ``GradientLimiter`` adjusts a backend's limit from
+latency, in the style of Netflix's gradient2 limiter:
+
+- a slow moving average of time to first token (TTFT) is the baseline the
+  backend achieves without queueing; TTFT is used rather than total latency
+  because it doesn't depend on how long the response is
+- each sample's gradient, ``tolerance * baseline / recent TTFT`` capped at 1,
+  shrinks the limit in proportion once latency rises past ``tolerance`` times
+  the baseline; while it stays within that, ``sqrt(limit)`` of headroom is
+  added so the limit keeps probing upwards
+- errors and timeouts halve the limit
+
+The limit only grows while the backend is using at least half of it, so a
+quiet period doesn't inflate it.
+"""
+import math
+import threading
+
+import metrics
+
+LLM_CONCURRENCY_LIMIT = metrics.Gauge(
+    "zero_llm_concurrency_limit", "Adaptive in-flight request limit per LLM backend", ["backend"]
+)
+
+
+class GradientLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial: float,
+        min_limit: float = 1,
+        max_limit: float = 32,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        short_window: int = 10,
+        long_window: int = 100
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.short_window = short_window
+        self.long_window = long_window
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.inflight = 0
+        self._short = None
+        self._long = None
+        self._lock = threading.Lock()
+        LLM_CONCURRENCY_LIMIT.set(self.limit, backend=name)
+
+    def has_capacity(self) -> bool:
+        with self._lock:
+            return self.inflight < int(self.limit)
+
+    def acquire(self):
+        with self._lock:
+            self.inflight += 1
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def on_sample(self, ttft: float):
+        """Adjust the limit from a completed request's time to first token."""
+        with self._lock:
+            if self._long is None:
+                self._short = self._long = ttft
+            else:
+                self._short += (ttft - self._short) / self.short_window
+                self._long += (ttft - self._long) / self.long_window
+                if self._long > 2 * self._short:
+                    # Latency dropped a lot (e.g. a model finished loading): catch the baseline up
+                    self._long *= 0.9
+            gradient = max(0.5, min(1.0, self.tolerance * self._long / self._short))
+            target = self.limit * gradient
+            if gradient == 1.0 and self.inflight >= self.limit / 2:
+                target += math.sqrt(self.limit)
+            self._set(self.limit * (1 - self.smoothing) + target * self.smoothing)
+
+    def on_drop(self):
+        """A request failed or timed out: back off multiplicatively."""
+        with self._lock:
+            self._set(self.limit / 2)
+
+    def _set(self, limit: float):
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        LLM_CONCURRENCY_LIMIT.set(round(self.limit, 2), backend=self.name)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "inflight": self.inflight,
+                "ttft_baseline": self._long,
+                "ttft_recent": self._short
+            }
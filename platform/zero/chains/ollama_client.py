@@ -0,0 +1,506 @@
+"""
+Ollama client with adaptive timeouts, hedged requests and circuit breakers.
+
+Every request is streamed so time to first token (TTFT) and total latency can
+be tracked per backend. Once a backend has ``min_samples`` observations:
+
+- the request deadline is ``timeout_multiplier`` x its p99 total latency,
+  clamped to ``[min_timeout, max_timeout]`` (``max_timeout`` until then)
+- with hedging enabled and more than one backend, a request that has not
+  produced a token within the primary backend's p95 TTFT is also sent to the
+  next backend; the first backend to produce a token wins and the other
+  request is cancelled
+
+Each backend has its own circuit breaker; backends whose circuit is open are
+skipped, and when all are open ``generate`` raises ``CircuitOpenError``
+without making a request. With ``max_inflight`` set, each backend also has an
+adaptive concurrency limit (see ``concurrency_limit``): a request waits up to
+``queue_timeout`` for a backend under its limit, then is shed with
+``LLMOverloadedError``; hedges and failovers only go to backends with spare
+capacity. With a batch window set, requests are started in
+micro-batches sized to each backend's parallel slots (see ``batching``);
+the wait for a batch slot counts against ``queue_timeout`` too.
+
+Inside ``record_calls()``, each completed request also appends its model,
+timings, token counts and response size to a per-context call log, which
+the traffic recorder uses to reproduce backend behaviour in replays.
+"""
+import contextvars
+import itertools
+import json
+import queue
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import metrics
+from chains.batching import MicroBatcher, SlotTimeoutError
+from chains.circuit_breaker import CircuitBreaker, CircuitOpenError
+from chains.concurrency_limit import GradientLimiter
+
+# Figures from Ollama's final "done" chunk: counts, and durations in nanoseconds
+USAGE_COUNTS = {"prompt_eval_count": "prompt_tokens", "eval_count": "completion_tokens"}
+USAGE_DURATIONS = {
+    "load_duration": "load_seconds",
+    "prompt_eval_duration": "prompt_eval_seconds",
+    "eval_duration": "eval_seconds",
+    "total_duration": "total_seconds"
+}
+
+
+def add_usage(usage: Dict[str, Any], chunk: Dict[str, Any]):
+    """Accumulate one response's token counts and durations into ``usage``."""
+    usage["calls"] = usage.get("calls", 0) + 1
+    for field, key in USAGE_COUNTS.items():
+        usage[key] = usage.get(key, 0) + chunk.get(field, 0)
+    for field, key in USAGE_DURATIONS.items():
+        usage[key] = round(usage.get(key, 0.0) + chunk.get(field, 0) / 1e9, 6)
+
+
+# Completed requests of the current job while record_calls() is active
+_call_log: contextvars.ContextVar = contextvars.ContextVar("zero_llm_call_log", default=None)
+
+
+@contextmanager
+def record_calls() -> Iterator[List[Dict[str, Any]]]:
+    """Collect a summary of every LLM request completed inside the block."""
+    calls: List[Dict[str, Any]] = []
+    token = _call_log.set(calls)
+    try:
+        yield calls
+    finally:
+        _call_log.reset(token)
+
+
+LLM_TTFT = metrics.Histogram(
+    "zero_llm_ttft_seconds", "Time to first token per backend", ["backend"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+LLM_DURATION = metrics.Histogram(
+    "zero_llm_request_seconds", "Total LLM request latency per backend", ["backend"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+LLM_REQUESTS = metrics.Counter(
+    "zero_llm_requests_total", "LLM requests by backend and outcome", ["backend", "outcome"]
+)
+LLM_HEDGES = metrics.Counter(
+    "zero_llm_hedges_total", "Hedged LLM requests by which attempt won", ["winner"]
+)
+LLM_SHED = metrics.Counter(
+    "zero_llm_shed_total", "LLM requests shed because every backend was at its concurrency limit"
+)
+
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+
+class LLMOverloadedError(RuntimeError):
+    pass
+
+
+class ModelNotFoundError(RuntimeError):
+    """No backend has the requested model pulled."""
+
+
+class Backend:
+    """One Ollama endpoint and its recent latency samples."""
+
+    def __init__(
+        self,
+        url: str,
+        parallel: int = 1,
+        breaker_failures: int = 5,
+        breaker_reset: float = 30.0,
+        window: int = 200,
+        max_inflight: Optional[int] = None
+    ):
+        self.url = url.rstrip("/")
+        # Sequences the backend serves concurrently (its OLLAMA_NUM_PARALLEL)
+        self.parallel = parallel
+        self.breaker = CircuitBreaker(self.url, breaker_failures, breaker_reset)
+        # Adaptive in-flight limit, starting at the backend's parallel slots
+        self.limiter = GradientLimiter(self.url, parallel, max_limit=max_inflight) if max_inflight else None
+        self.ttft = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, ttft: float, total: float):
+        with self._lock:
+            self.ttft.append(ttft)
+            self.total.append(total)
+        LLM_TTFT.observe(ttft, backend=self.url)
+        LLM_DURATION.observe(total, backend=self.url)
+
+    def percentile(self, samples: str, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(getattr(self, samples))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def samples(self) -> int:
+        return len(self.total)
+
+
+class _Attempt:
+    def __init__(self, backend: Backend, process: subprocess.Popen, hedge: bool):
+        self.backend = backend
+        self.process = process
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.first_token: Optional[float] = None
+        self.settled = False
+
+    def succeed(self):
+        self.settled = True
+        self.backend.breaker.record_success()
+
+    def fail(self):
+        self.settled = True
+        self.backend.breaker.record_failure()
+        if self.backend.limiter:
+            self.backend.limiter.on_drop()
+
+    def cancel(self):
+        if self.process.poll() is None:
+            self.process.kill()
+
+
+class OllamaClient:
+    def __init__(
+        self,
+        base_urls: List[str],
+        hedging: bool = False,
+        min_timeout: float = 30.0,
+        max_timeout: float = 300.0,
+        timeout_multiplier: float = 3.0,
+        min_samples: int = 20,
+        breaker_failures: int = 5,
+        breaker_reset: float = 30.0,
+        parallel: Optional[List[int]] = None,
+        batch_window: float = 0.0,
+        max_inflight: Optional[int] = None,
+        queue_timeout: float = 30.0
+    ):
+        parallel = parallel or [1]
+        self.backends = [
+            # A single parallel value applies to every backend
+            Backend(
+                url,
+                parallel[i] if i < len(parallel) else parallel[-1],
+                breaker_failures,
+                breaker_reset,
+                max_inflight=max_inflight
+            )
+            for i, url in enumerate(base_urls)
+        ]
+        self.queue_timeout = queue_timeout
+        # Signalled whenever a request releases backend capacity
+        self._capacity = threading.Condition()
+        self.hedging = hedging
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self._next_primary = itertools.count()
+        self.batcher = MicroBatcher(self.backends, batch_window) if batch_window > 0 else None
+
+    def capacity(self) -> int:
+        """Calls the backends take at once: their adaptive limits, or their parallel slots without one."""
+        return max(1, sum(
+            int(backend.limiter.limit) if backend.limiter else backend.parallel
+            for backend in self.backends
+        ))
+
+    def available(self) -> bool:
+        """Whether any backend's circuit would currently let a request through."""
+        return any(not backend.breaker.is_open() for backend in self.backends)
+
+    def timeout_for(self, backend: Backend) -> float:
+        """Deadline for a whole request, adapted to the backend's p99 latency."""
+        if backend.samples() < self.min_samples:
+            return self.max_timeout
+        p99 = backend.percentile("total", 0.99)
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay_for(self, backend: Backend) -> Optional[float]:
+        """How long to wait for a first token before hedging, if hedging applies."""
+        if not self.hedging or len(self.backends) < 2 or backend.samples() < self.min_samples:
+            return None
+        return backend.percentile("ttft", 0.95)
+
+    def generate(
+        self,
+        body: Dict[str, Any],
+        on_text: Optional[Callable[[str], None]] = None,
+        span=None,
+        usage: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Run a generate request and return the full response text.
+
+        ``on_text`` is called with the accumulated response after every chunk
+        from the winning backend. The winning response's token counts and
+        durations are added to ``usage`` (see ``add_usage``).
+        """
+        if self.batcher is None:
+            return self._generate(body, on_text, span, None, usage, self.queue_timeout)
+        queued_at = time.monotonic()
+        try:
+            with self.batcher.slot(self.queue_timeout) as backend:
+                # The batcher's wait counts against the same queue timeout
+                remaining = max(0.0, self.queue_timeout - (time.monotonic() - queued_at))
+                return self._generate(body, on_text, span, backend, usage, remaining)
+        except SlotTimeoutError as e:
+            LLM_SHED.inc()
+            raise LLMOverloadedError(str(e)) from None
+
+    def _generate(
+        self,
+        body: Dict[str, Any],
+        on_text: Optional[Callable[[str], None]],
+        span,
+        preferred: Optional[Backend],
+        usage: Optional[Dict[str, Any]],
+        queue_timeout: float
+    ) -> str:
+        model = body.get("model")
+        body = json.dumps(dict(body, stream=True))
+        start = next(self._next_primary)
+        order = [self.backends[(start + i) % len(self.backends)] for i in range(len(self.backends))]
+        # The batcher's slot is on ``preferred``; the other backends are only for failover and hedges
+        reserved = [] if preferred is None else [preferred]
+        if preferred is not None:
+            order.remove(preferred)
+        events: queue.Queue = queue.Queue()
+        attempts: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        response = ""
+        hedged = False
+        last_error = "no response"
+        # Whether last_error is a backend reporting the model as missing
+        missing_model = False
+
+        def launch(hedge: bool, wait: float = 0.0, candidates: Optional[List[Backend]] = None) -> bool:
+            backend = self._claim(order if candidates is None else candidates, wait)
+            if backend is None:
+                return False
+            attempt = _Attempt(backend, self._spawn(backend, body), hedge)
+            attempts.append(attempt)
+            threading.Thread(
+                target=self._pump, args=(attempt, events), name="ollama-stream", daemon=True
+            ).start()
+            return True
+
+        if preferred is not None:
+            # Wait for the backend holding the slot; go elsewhere only if its circuit refuses it
+            # (_claim then drops it from ``reserved``)
+            launched = launch(hedge=False, wait=queue_timeout, candidates=reserved) or (
+                not reserved and launch(hedge=False)
+            )
+        else:
+            launched = launch(hedge=False, wait=queue_timeout)
+        if not launched:
+            if order or reserved:
+                LLM_SHED.inc()
+                raise LLMOverloadedError(
+                    f"Every LLM backend is at its concurrency limit after {self.queue_timeout:g}s"
+                )
+            raise CircuitOpenError("LLM circuit is open for every backend")
+        primary = attempts[0].backend
+        timeout = self.timeout_for(primary)
+        deadline = attempts[0].started + timeout
+        hedge_at = self.hedge_delay_for(primary)
+        if hedge_at is not None:
+            hedge_at += attempts[0].started
+
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    for attempt in attempts:
+                        if attempt.process.poll() is None:
+                            attempt.fail()
+                            LLM_REQUESTS.inc(backend=attempt.backend.url, outcome="timeout")
+                    raise LLMTimeoutError(f"LLM request timed out after {timeout:g}s")
+                wait = deadline - now
+                if winner is None and hedge_at is not None:
+                    if now >= hedge_at:
+                        hedge_at = None
+                        hedged = launch(hedge=True)
+                        continue
+                    wait = min(wait, hedge_at - now)
+
+                try:
+                    attempt, line = events.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                if winner is not None and attempt is not winner:
+                    continue
+
+                if line is None:
+                    # Stream ended without a "done" chunk: this attempt failed
+                    if not attempt.settled:
+                        if attempt.process.returncode:
+                            last_error = f"{attempt.backend.url}: curl exit status {attempt.process.returncode}"
+                            missing_model = False
+                        LLM_REQUESTS.inc(backend=attempt.backend.url, outcome="error")
+                        attempt.fail()
+                    if winner is attempt:
+                        raise RuntimeError(f"Ollama stream from {attempt.backend.url} ended early")
+                    # Fail over to the next backend once nothing else is in flight
+                    if all(a.process.poll() is not None for a in attempts) and not launch(hedge=True):
+                        error = ModelNotFoundError if missing_model else RuntimeError
+                        raise error(f"All Ollama backends failed: {last_error}")
+                    continue
+
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    last_error = f"{attempt.backend.url}: {chunk['error']}"
+                    LLM_REQUESTS.inc(backend=attempt.backend.url, outcome="error")
+                    missing_model = "not found" in str(chunk["error"])
+                    if missing_model:
+                        # The backend is healthy, it just doesn't have this model pulled
+                        attempt.settled = True
+                        attempt.backend.breaker.release()
+                    else:
+                        attempt.fail()
+                    if winner is attempt:
+                        error = ModelNotFoundError if missing_model else RuntimeError
+                        raise error(f"Ollama error from {last_error}")
+                    attempt.cancel()
+                    continue
+
+                if winner is None:
+                    winner = attempt
+                    winner.first_token = time.monotonic()
+                    if winner.backend.limiter:
+                        winner.backend.limiter.on_sample(winner.first_token - winner.started)
+                    for other in attempts:
+                        if other is not winner:
+                            other.cancel()
+                    if hedged:
+                        LLM_HEDGES.inc(winner="hedge" if winner.hedge else "primary")
+
+                response += chunk.get("response", "")
+                if on_text:
+                    on_text(response)
+
+                if chunk.get("done"):
+                    finished = time.monotonic()
+                    winner.backend.record(winner.first_token - winner.started, finished - winner.started)
+                    LLM_REQUESTS.inc(backend=winner.backend.url, outcome="ok")
+                    winner.succeed()
+                    if usage is not None:
+                        add_usage(usage, chunk)
+                    calls = _call_log.get()
+                    if calls is not None:
+                        calls.append({
+                            "model": model,
+                            "ttft": round(winner.first_token - winner.started, 3),
+                            "seconds": round(finished - winner.started, 3),
+                            "prompt_tokens": chunk.get("prompt_eval_count", 0),
+                            "completion_tokens": chunk.get("eval_count", 0),
+                            "response_bytes": len(response.encode())
+                        })
+                    if span:
+                        span.set_attribute("backend", winner.backend.url)
+                        span.set_attribute("hedged", hedged)
+                        span.set_attribute("ttft_ms", int((winner.first_token - winner.started) * 1000))
+                        span.set_attribute("eval_count", chunk.get("eval_count", 0))
+                        span.set_attribute("prompt_eval_count", chunk.get("prompt_eval_count", 0))
+                        span.set_attribute("load_ms", int(chunk.get("load_duration", 0) / 1e6))
+                    return response
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+                if not attempt.settled:
+                    # Cancelled without an outcome: don't hold a half-open probe
+                    attempt.backend.breaker.release()
+                if attempt.backend.limiter:
+                    attempt.backend.limiter.release()
+                    with self._capacity:
+                        self._capacity.notify_all()
+
+    def _claim(self, candidates: List[Backend], wait: float) -> Optional[Backend]:
+        """Take the first candidate under its concurrency limit whose circuit lets a call through.
+
+        Candidates are tried at most once per request and removed when
+        claimed or refused by their circuit; ones merely at their limit stay,
+        and are waited for up to ``wait`` seconds. Returns None if nothing
+        could be claimed.
+        """
+        deadline = time.monotonic() + wait
+        with self._capacity:
+            while True:
+                for backend in list(candidates):
+                    if backend.breaker.is_open():
+                        candidates.remove(backend)
+                        continue
+                    if backend.limiter and not backend.limiter.has_capacity():
+                        continue
+                    candidates.remove(backend)
+                    if backend.breaker.allow():
+                        if backend.limiter:
+                            backend.limiter.acquire()
+                        return backend
+                remaining = deadline - time.monotonic()
+                if not candidates or remaining <= 0:
+                    return None
+                self._capacity.wait(remaining)
+
+    def preload(self, backend: Backend, model: str, timeout: float = 300.0):
+        """Load ``model`` into ``backend``'s memory without generating anything."""
+        # Ollama loads the model and returns right away for a request without a prompt
+        body = json.dumps({"model": model, "stream": False})
+        result = subprocess.run(
+            [
+                "curl", "-s", "--connect-timeout", "5", "--max-time", str(timeout),
+                f"{backend.url}/api/generate", "-d", body
+            ],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{backend.url}: curl exit status {result.returncode}")
+        for line in result.stdout.splitlines():
+            if line.strip() and "error" in json.loads(line):
+                raise RuntimeError(f"{backend.url}: {json.loads(line)['error']}")
+
+    def _spawn(self, backend: Backend, body: str) -> subprocess.Popen:
+        cmd = [
+            "curl", "-sN", "--connect-timeout", "5", f"{backend.url}/api/generate", "-d", body
+        ]
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+
+    def _pump(self, attempt: _Attempt, events: queue.Queue):
+        """Forward an attempt's NDJSON lines to the event queue; ``None`` marks the end."""
+        try:
+            for line in attempt.process.stdout:
+                if line.strip():
+                    events.put((attempt, line))
+        except (OSError, ValueError):
+            pass
+        finally:
+            attempt.process.stdout.close()
+            attempt.process.wait()
+            events.put((attempt, None))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "url": backend.url,
+                "parallel": backend.parallel,
+                "samples": backend.samples(),
+                "ttft_p50": backend.percentile("ttft", 0.5),
+                "ttft_p95": backend.percentile("ttft", 0.95),
+                "total_p99": backend.percentile("total", 0.99),
+                "timeout": self.timeout_for(backend),
+                "circuit": backend.breaker.snapshot(),
+                "concurrency": backend.limiter.snapshot() if backend.limiter else None
+            }
+            for backend in self.backends
+        ]
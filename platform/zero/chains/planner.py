@@ -1,92 +1,380 @@
 """
 Planner chain for analyzing user requirements and creating project specifications.
 """
+import copy
 import json
+import random
 import re
-from typing import Dict, List, Any
-import subprocess
-import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Any, Optional, Tuple
+import time
+
+import metrics
+import tracing
+from chains.circuit_breaker import CircuitOpenError
+from chains.ollama_client import ModelNotFoundError, OllamaClient
+from chains.prompt_registry import PromptRegistry, PromptVersion
+
+SUPPORTED_STACKS = ("nextjs", "go", "rust", "python")
+
+# Planner model tiers, cheapest first; "auto" starts at the first and escalates
+QUALITY_TIERS = ("fast", "balanced", "best")
+DEFAULT_MODELS = {
+    "fast": "qwen2.5-coder:3b-instruct-q4_K_M",
+    "balanced": "codellama:13b-instruct",
+    "best": "starcoder2:15b-instruct"
+}
+REQUIRED_FIELDS = ("stack", "features", "infra", "db", "tests", "project_name", "description")
+
+PLANNER_LATENCY = metrics.Histogram(
+    "zero_planner_model_seconds", "Planner LLM call latency per model", ["model"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+PLANS_BY_MODEL = metrics.Counter(
+    "zero_plans_total", "LLM plans produced, by quality mode and the model that produced them", ["quality", "model"]
+)
+PLAN_ESCALATIONS = metrics.Counter(
+    "zero_plan_escalations_total", "Draft plans rejected and re-planned with a larger model", ["tier", "reason"]
+)
 
 class ProjectPlanner:
-    def __init__(self, ollama_base_url: str = "http://localhost:11434"):
+    def __init__(
+        self,
+        ollama_base_url: str = "http://localhost:11434",
+        scheduler=None,
+        plan_cache=None,
+        prompts: Optional[PromptRegistry] = None,
+        client: Optional[OllamaClient] = None,
+        models: Optional[Dict[str, str]] = None,
+        quality: str = "auto"
+    ):
         self.ollama_base_url = ollama_base_url
-        self.model = "codellama:13b-instruct"
-    
-    def analyze_requirements(self, prompt: str) -> Dict[str, Any]:
-        """Analyze user requirements and create project specification."""
-        
-        # Enhanced prompt for better analysis
-        enhanced_prompt = f"""
-        Analyze this user request and generate a complete project specification:
-        
-        User Request: "{prompt}"
-        
-        Consider:
-        1. What type of application is this?
-        2. What features are needed?
-        3. What technology stack would be best?
-        4. What infrastructure requirements?
-        5. What database is appropriate?
-        6. What testing strategy?
-        
-        Return ONLY valid JSON following this exact schema:
-        {{
-            "stack": "nextjs|go|rust|python",
-            "features": ["auth", "payments", "realtime", "database", "api", "frontend", "testing"],
-            "infra": "docker|k8s|serverless",
-            "db": "postgres|sqlite|distributed|mongodb",
-            "tests": "jest|pytest|go-test",
-            "project_name": "descriptive-project-name",
-            "description": "Brief description of the project",
-            "complexity": "simple|medium|complex",
-            "estimated_files": 10
-        }}
+        models = dict(DEFAULT_MODELS, **(models or {}))
+        self.model = models["balanced"]
+        self.fast_model = models["fast"]
+        self.best_model = models["best"]
+        # Quality used when a request doesn't ask for one
+        self.quality = quality
+        # Streams every request; adds adaptive timeouts and hedging across backends
+        self.client = client or OllamaClient([ollama_base_url])
+        # Prompt templates from prompts/zero-code.toml, hot-reloaded on change
+        self.prompts = prompts or PromptRegistry()
+        # Optional FairScheduler sharing LLM capacity between tenants
+        self.scheduler = scheduler
+        # Optional SemanticPlanCache serving plans for near-duplicate prompts
+        self.plan_cache = plan_cache
+        self._audit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plan-cache-audit")
+    
+    def analyze_requirements(
+        self,
+        prompt: str,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+        tenant: str = "anonymous",
+        usage: Optional[Dict[str, Any]] = None,
+        quality: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Analyze user requirements and create project specification.
+        
+        If ``on_partial`` is given the response is streamed and the callback is
+        invoked once, as soon as ``stack`` and ``project_name`` have been
+        parsed from the partial output. LLM token counts and durations are
+        added to ``usage`` if given.
+        
+        ``quality`` picks the model tier (``fast``, ``balanced``, ``best``);
+        ``auto`` drafts with the fast model and escalates a tier whenever the
+        draft fails the schema and confidence checks or the model isn't pulled;
+        other call errors fall back to the keyword plan at once. The plan
+        records the ``model`` that produced it and its number of ``escalations``;
+        plans served from the semantic cache keep those and are marked ``cached``.
         """
+        quality = quality or self.quality
+        
+        # One prompt version per request, even if the file is reloaded meanwhile
+        prompts = self.prompts.current()
+        enhanced_prompt = prompts.planner_prompt(prompt)
         
+        with tracing.span(
+            "planner.analyze_requirements",
+            tenant=tenant,
+            prompt_chars=len(prompt),
+            prompt_version=prompts.version,
+            quality=quality
+        ) as span:
+            if self.plan_cache:
+                cached_plan = self._get_cached_plan(prompt, prompts, quality, tenant)
+                if cached_plan:
+                    if span:
+                        span.set_attribute("cache_hit", True)
+                    return cached_plan
+            
+            try:
+                if not self.client.available():
+                    # Ollama is known to be down: degrade now instead of queueing for a slot
+                    raise CircuitOpenError("LLM circuit is open")
+                plan = self._plan_with_escalation(enhanced_prompt, prompts, quality, on_partial, tenant, usage)
+                if span:
+                    span.set_attribute("model", plan["model"])
+                    span.set_attribute("escalations", plan["escalations"])
+                if self.plan_cache:
+                    self._store_cached_plan(prompt, plan, prompts, quality, tenant)
+                return plan
+            except Exception as e:
+                print(f"Error in planning: {e}")
+                if span:
+                    span.set_attribute("fallback", True)
+                return self._get_fallback_plan(prompt)
+    
+    def estimate_plan(self, prompt: str) -> Dict[str, Any]:
+        """Cheap keyword guess at the plan, for scheduling before the real plan exists."""
+        plan = self._get_fallback_plan(prompt)
+        features = len(plan["features"])
+        plan["complexity"] = "simple" if features <= 1 else "medium" if features == 2 else "complex"
+        return plan
+    
+    def models_for(self, quality: Optional[str] = None) -> List[str]:
+        """Models a plan at ``quality`` (default: the planner's) may call, in order."""
+        return [model for _, model in self._tiers(quality or self.quality)]
+    
+    def _tiers(self, quality: str) -> List[Tuple[str, str]]:
+        """The ``(tier, model)`` pairs to try in order for a quality setting."""
+        models = {"fast": self.fast_model, "balanced": self.model, "best": self.best_model}
+        if quality == "auto":
+            return [(tier, models[tier]) for tier in QUALITY_TIERS]
+        if quality not in models:
+            raise ValueError(f"Unknown planner quality: {quality}")
+        return [(quality, models[quality])]
+    
+    def _plan_with_escalation(
+        self,
+        enhanced_prompt: str,
+        prompts: PromptVersion,
+        quality: str,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]],
+        tenant: str,
+        usage: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Plan with each tier in turn until one produces an acceptable plan."""
+        tiers = self._tiers(quality)
+        for escalations, (tier, model) in enumerate(tiers):
+            last = escalations == len(tiers) - 1
+            started = time.monotonic()
+            try:
+                with self._llm_slot(tenant):
+                    # Only the first attempt may start a speculative scaffold
+                    response = self._call_ollama(
+                        enhanced_prompt, prompts.system, on_partial if escalations == 0 else None, usage, model
+                    )
+            except ModelNotFoundError as e:
+                # The draft model isn't pulled on any backend; a larger one may be. Timeouts,
+                # transport errors and an open circuit would fail the same way on every tier.
+                if last:
+                    raise
+                PLAN_ESCALATIONS.inc(tier=tier, reason="model_not_found")
+                print(f"Planner model {model} is not available, escalating: {e}")
+                continue
+            PLANNER_LATENCY.observe(time.monotonic() - started, model=model)
+            
+            with tracing.span("planner.parse_response", response_chars=len(response), model=model):
+                try:
+                    plan = self._extract_json(response)
+                    problems = self._check_plan(plan)
+                except ValueError as e:
+                    if last:
+                        raise
+                    plan, problems = None, [str(e)]
+            if problems and not last:
+                PLAN_ESCALATIONS.inc(tier=tier, reason="invalid_json" if plan is None else "schema")
+                print(f"Draft plan from {model} rejected ({'; '.join(problems)}), escalating")
+                continue
+            
+            plan = self._validate_plan(plan)
+            plan["model"] = model
+            plan["escalations"] = escalations
+            PLANS_BY_MODEL.inc(quality=quality, model=model)
+            return plan
+    
+    def _cache_namespace(self, prompts: PromptVersion, quality: str, tenant: str) -> str:
+        """Cached plans are only reused for the same models and prompt version, and tenant unless shared."""
+        models = "+".join(model for _, model in self._tiers(quality))
+        namespace = f"{quality}:{models}:{prompts.version}"
+        return namespace if self.plan_cache.scope == "global" else f"{namespace}:{tenant}"
+    
+    def _get_cached_plan(
+        self,
+        prompt: str,
+        prompts: PromptVersion,
+        quality: str,
+        tenant: str
+    ) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached plan for a near-duplicate prompt, if any, marked ``cached``."""
         try:
-            response = self._call_ollama(enhanced_prompt)
-            return self._parse_json_response(response)
+            match = self.plan_cache.lookup(prompt, self._cache_namespace(prompts, quality, tenant))
         except Exception as e:
-            print(f"Error in planning: {e}")
-            return self._get_fallback_plan(prompt)
-    
-    def _call_ollama(self, prompt: str) -> str:
-        """Call Ollama API for LLM inference."""
-        cmd = [
-            "curl", "-s", f"{self.ollama_base_url}/api/generate",
-            "-d", json.dumps({
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,
-                    "top_p": 0.9,
-                    "max_tokens": 1000
-                }
-            })
-        ]
+            print(f"Error in plan cache lookup: {e}")
+            return None
+        if not match:
+            return None
         
+        plan, similarity, cached_prompt = match
+        if random.random() < self.plan_cache.audit_rate:
+            self._audit_executor.submit(
+                self._audit_cached_plan, prompt, prompts, cached_prompt, similarity, plan
+            )
+        plan = copy.deepcopy(plan)
+        # Served without an LLM call: usage stats leave it out of model and escalation counts
+        plan["cached"] = True
+        return plan
+    
+    def _store_cached_plan(
+        self,
+        prompt: str,
+        plan: Dict[str, Any],
+        prompts: PromptVersion,
+        quality: str,
+        tenant: str
+    ):
         try:
-            result = subprocess.check_output(cmd, text=True)
-            response_data = json.loads(result)
-            return response_data.get("response", "")
+            self.plan_cache.store(prompt, copy.deepcopy(plan), self._cache_namespace(prompts, quality, tenant))
         except Exception as e:
-            print(f"Error calling Ollama: {e}")
-            raise
+            print(f"Error storing plan in cache: {e}")
+    
+    def _audit_cached_plan(
+        self,
+        prompt: str,
+        prompts: PromptVersion,
+        cached_prompt: str,
+        similarity: float,
+        cached_plan: Dict[str, Any]
+    ):
+        """Plan the prompt for real and record whether the cached plan agreed."""
+        try:
+            with self._llm_slot("plan-cache-audit"):
+                response = self._call_ollama(prompts.planner_prompt(prompt), prompts.system)
+            fresh_plan = self._parse_json_response(response)
+        except Exception as e:
+            print(f"Plan cache audit skipped: {e}")
+            return
+        self.plan_cache.record_audit(prompt, cached_prompt, similarity, cached_plan, fresh_plan)
+    
+    def _llm_slot(self, tenant: str):
+        """Wait for this tenant's turn on the LLM backend, if a scheduler is set."""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(tenant)
+    
+    def _build_request(self, prompt: str, system: str, model: Optional[str] = None) -> Dict[str, Any]:
+        """Build the body for an Ollama generate request."""
+        return {
+            "model": model or self.model,
+            "system": system,
+            "prompt": prompt,
+            "options": {
+                "temperature": 0.3,
+                "top_p": 0.9,
+                "max_tokens": 1000
+            }
+        }
+    
+    def _call_ollama(
+        self,
+        prompt: str,
+        system: str,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
+    ) -> str:
+        """Call Ollama API for LLM inference.
+        
+        With ``on_partial``, it is invoked once as soon as the streamed output
+        contains the early plan fields.
+        """
+        model = model or self.model
+        with tracing.span("ollama.generate", model=model, stream=bool(on_partial)) as span:
+            on_text = self._partial_reporter(on_partial, span) if on_partial else None
+            try:
+                response = self.client.generate(self._build_request(prompt, system, model), on_text, span, usage)
+                if span:
+                    span.set_attribute("response_bytes", len(response))
+                return response
+            except Exception as e:
+                print(f"Error calling Ollama: {e}")
+                raise
+    
+    def _partial_reporter(
+        self,
+        on_partial: Callable[[Dict[str, Any]], None],
+        span
+    ) -> Callable[[str], None]:
+        """Wrap ``on_partial`` as a streaming callback that fires once."""
+        started = time.monotonic()
+        reported = False
+        
+        def on_text(response: str):
+            nonlocal reported
+            if reported:
+                return
+            fields = self._parse_early_fields(response)
+            if not fields:
+                return
+            reported = True
+            if span:
+                span.set_attribute("partial_after_ms", int((time.monotonic() - started) * 1000))
+            try:
+                on_partial(fields)
+            except Exception as e:
+                print(f"Error in partial plan callback: {e}")
+        
+        return on_text
+    
+    def _parse_early_fields(self, partial: str) -> Optional[Dict[str, Any]]:
+        """Extract ``stack`` and ``project_name`` from a partial JSON response."""
+        stack_match = re.search(r'"stack"\s*:\s*"([^"]*)"', partial)
+        name_match = re.search(r'"project_name"\s*:\s*"([^"]+)"', partial)
+        if not stack_match or not name_match:
+            return None
+        if stack_match.group(1) not in SUPPORTED_STACKS:
+            return None
+        return {
+            "stack": stack_match.group(1),
+            "project_name": name_match.group(1)
+        }
     
     def _parse_json_response(self, response: str) -> Dict[str, Any]:
         """Parse and validate JSON response from LLM."""
-        # Extract JSON from response
+        return self._validate_plan(self._extract_json(response))
+    
+    def _extract_json(self, response: str) -> Dict[str, Any]:
+        """Extract the JSON object from an LLM response."""
         json_match = re.search(r'\{.*\}', response, re.DOTALL)
         if not json_match:
             raise ValueError("No JSON found in response")
         
         try:
             plan = json.loads(json_match.group())
-            return self._validate_plan(plan)
         except json.JSONDecodeError as e:
             print(f"Invalid JSON: {e}")
             raise
+        if not isinstance(plan, dict):
+            raise ValueError("Response JSON is not an object")
+        return plan
+    
+    def _check_plan(self, plan: Dict[str, Any]) -> List[str]:
+        """Problems that make a raw plan untrustworthy; empty if it looks sound.
+        
+        ``_validate_plan`` would paper over these with defaults, so a draft
+        model that leaves fields out or invents values is escalated instead.
+        """
+        problems = [f"missing {field}" for field in REQUIRED_FIELDS if not plan.get(field)]
+        if plan.get("stack") and plan["stack"] not in SUPPORTED_STACKS:
+            problems.append(f"unsupported stack {plan['stack']!r}")
+        features = plan.get("features")
+        if features and (not isinstance(features, list) or not all(isinstance(f, str) for f in features)):
+            problems.append("features is not a list of strings")
+        name = plan.get("project_name")
+        if name and not (isinstance(name, str) and re.fullmatch(r"[a-z0-9][a-z0-9-]{0,63}", name)):
+            problems.append(f"invalid project_name {name!r}")
+        return problems
     
     def _validate_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and sanitize the plan."""
@@ -153,5 +441,7 @@ class ProjectPlanner:
             "project_name": "generated-app",
             "description": f"Generated {stack} application based on: {prompt[:100]}...",
             "complexity": "simple",
-            "estimated_files": 10
+            "estimated_files": 10,
+            # Not LLM-planned; surfaced to clients and never cached
+            "degraded": True
         }
\ No newline at end of file
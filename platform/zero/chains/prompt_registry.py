@@ -0,0 +1,119 @@
+"""
+Versioned prompt registry backed by ``prompts/zero-code.toml``.
+
+The TOML file is parsed once and its templates are compiled into a
+``PromptVersion``; the version id is a hash of the file contents so caches
+can key on it. The file is re-checked at most once per ``check_interval``
+and reloaded when it changes, so prompt edits take effect without a restart.
+A file that fails to load leaves the previous version in place.
+
+Given a startup snapshot (see ``startup``) whose version matches the file,
+the compiled templates are taken from the snapshot instead of parsing the
+TOML again.
+"""
+import hashlib
+import os
+import threading
+import time
+from string import Template
+from typing import Any, Dict, Optional
+
+DEFAULT_PROMPTS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts", "zero-code.toml"
+)
+
+# Mapping tables rendered into the planner template as "- key: description" lines
+MAPPING_TABLES = {
+    "stacks": "stack_analysis",
+    "features": "feature_mapping",
+    "infra": "infra_mapping",
+    "databases": "db_mapping",
+}
+
+
+class PromptVersion:
+    """One loaded revision of the prompt file with its templates compiled."""
+
+    def __init__(self, version: str, config: Dict[str, Any]):
+        self.version = version
+        self.system = config["zero_code"]["system"].strip()
+        mappings = {
+            name: "\n".join(f"- {key}: {value}" for key, value in config.get(table, {}).items())
+            for name, table in MAPPING_TABLES.items()
+        }
+        # Expand the static mappings now so each request only substitutes $prompt
+        self._planner = Template(
+            Template(config["planner"]["template"].strip()).safe_substitute(mappings)
+        )
+
+    @classmethod
+    def compiled(cls, version: str, system: str, planner: str) -> "PromptVersion":
+        """Rebuild a version from the output of ``snapshot``."""
+        prompts = cls.__new__(cls)
+        prompts.version = version
+        prompts.system = system
+        prompts._planner = Template(planner)
+        return prompts
+
+    def snapshot(self) -> Dict[str, str]:
+        return {"version": self.version, "system": self.system, "planner": self._planner.template}
+
+    def planner_prompt(self, prompt: str) -> str:
+        return self._planner.safe_substitute(prompt=prompt)
+
+
+class PromptRegistry:
+    def __init__(
+        self,
+        path: str = DEFAULT_PROMPTS_FILE,
+        check_interval: float = 1.0,
+        snapshot: Optional[Dict[str, str]] = None
+    ):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = snapshot
+        self._lock = threading.Lock()
+        self._stamp = _file_stamp(path)
+        self._checked_at = time.monotonic()
+        self._current = self._load()
+
+    def current(self) -> PromptVersion:
+        """Return the latest prompt version, reloading the file if it changed."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._reload_if_changed()
+        return self._current
+
+    def _reload_if_changed(self):
+        try:
+            stamp = _file_stamp(self.path)
+        except OSError as e:
+            print(f"Prompt file unavailable, keeping version {self._current.version}: {e}")
+            return
+        if stamp == self._stamp:
+            return
+        # Record the stamp first so a broken file is reported once, not on every check
+        self._stamp = stamp
+        try:
+            self._current = self._load()
+            print(f"Loaded prompt version {self._current.version} from {self.path}")
+        except Exception as e:
+            print(f"Invalid prompt file, keeping version {self._current.version}: {e}")
+
+    def _load(self) -> PromptVersion:
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        version = hashlib.sha256(raw).hexdigest()[:12]
+        if self._snapshot and self._snapshot["version"] == version:
+            return PromptVersion.compiled(**self._snapshot)
+        # Imported lazily: a matching snapshot skips parsing altogether
+        import tomllib
+        return PromptVersion(version, tomllib.loads(raw.decode()))
+
+
+def _file_stamp(path: str):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,159 @@
+"""
+Push job status changes to WebSocket subscribers.
+
+One hub per API process follows the job store's change feed (a single
+``changes_since`` query per poll, however many clients are connected) and
+fans changes out to subscribers. Every replica sharing the job store reads
+the same feed, so a client connected to any replica sees jobs run by all
+of them.
+
+Subscribers only receive the fields that changed since their last message,
+and bursts of updates to one job are coalesced into a single message.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Set
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WS_SUBSCRIBERS = metrics.Gauge("zero_ws_subscribers", "Connected job status WebSocket clients")
+WS_MESSAGES = metrics.Counter("zero_ws_messages_total", "Job status messages pushed to WebSocket clients")
+
+
+def status_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The client-visible status of a job record."""
+    eta = job.get("estimated_completion")
+    if job["status"] in ("completed", "failed"):
+        eta = None
+    elif isinstance(eta, datetime):
+        eta = eta.isoformat()
+    return {
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "download_url": job.get("download_url"),
+        "degraded": bool((job.get("plan") or {}).get("degraded")),
+        "estimated_completion": eta,
+        "usage": usage_view(job)
+    }
+
+
+def usage_view(job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Resources a job used so far: LLM figures, CPU and wall seconds per phase, bytes."""
+    usage = job.get("usage")
+    timings = job.get("timings")
+    if not usage and not timings:
+        return None
+    return dict(usage or {}, wall_seconds=dict(timings or {}))
+
+
+def job_tenant(job: Dict[str, Any]) -> str:
+    return (job.get("request") or {}).get("tenant", "anonymous")
+
+
+class Subscriber:
+    """One WebSocket client: the jobs it follows and what it was last sent."""
+
+    def __init__(self, tenant: str):
+        self.tenant = tenant
+        self.project_ids: Set[str] = set()
+        self.all_jobs = False
+        self.sent: Dict[str, Dict[str, Any]] = {}
+        # project_id -> latest view not yet sent (None means deleted)
+        self.pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.wake = asyncio.Event()
+
+    def wants(self, project_id: str, job: Optional[Dict[str, Any]]) -> bool:
+        if project_id in self.project_ids or project_id in self.sent:
+            return True
+        return self.all_jobs and job is not None and job_tenant(job) == self.tenant
+
+    def push(self, project_id: str, job: Optional[Dict[str, Any]]):
+        self.pending[project_id] = status_view(job) if job is not None else None
+        self.wake.set()
+
+    def take_message(self) -> Optional[Dict[str, Any]]:
+        """Diff pending views against what was sent; ``None`` if nothing changed."""
+        updates = {}
+        deleted = []
+        for project_id, view in self.pending.items():
+            previous = self.sent.get(project_id)
+            if view is None:
+                if previous is not None or project_id in self.project_ids:
+                    deleted.append(project_id)
+                self.sent.pop(project_id, None)
+                continue
+            changes = {k: v for k, v in view.items() if previous is None or previous.get(k) != v}
+            if changes:
+                updates[project_id] = changes
+                self.sent[project_id] = view
+        self.pending.clear()
+        self.wake.clear()
+        if not updates and not deleted:
+            return None
+        return {"type": "jobs", "updates": updates, "deleted": deleted}
+
+
+class JobEventHub:
+    def __init__(self, store, interval: float = 0.25):
+        self.store = store
+        self.interval = interval
+        self.subscribers: Set[Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def add(self, subscriber: Subscriber):
+        self.subscribers.add(subscriber)
+        WS_SUBSCRIBERS.set(len(self.subscribers))
+
+    def remove(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+        WS_SUBSCRIBERS.set(len(self.subscribers))
+
+    async def subscribe(self, subscriber: Subscriber, project_ids: Iterable[str] = (), all_jobs: bool = False):
+        """Follow more jobs; their current state is queued for the subscriber right away."""
+        project_ids = set(project_ids) - subscriber.project_ids
+        subscriber.project_ids |= project_ids
+        for project_id in project_ids:
+            subscriber.push(project_id, await asyncio.to_thread(self.store.get, project_id))
+        if all_jobs and not subscriber.all_jobs:
+            subscriber.all_jobs = True
+            for project_id, job in await asyncio.to_thread(self.store.items):
+                if job_tenant(job) == subscriber.tenant:
+                    subscriber.push(project_id, job)
+
+    def unsubscribe(self, subscriber: Subscriber, project_ids: Iterable[str] = (), all_jobs: bool = False):
+        for project_id in project_ids:
+            subscriber.project_ids.discard(project_id)
+            subscriber.sent.pop(project_id, None)
+            subscriber.pending.pop(project_id, None)
+        if all_jobs:
+            subscriber.all_jobs = False
+            subscriber.sent = {pid: view for pid, view in subscriber.sent.items() if pid in subscriber.project_ids}
+
+    async def _run(self):
+        cursor = await asyncio.to_thread(self.store.change_cursor)
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.subscribers:
+                # Nobody listening: skip the query but don't replay the backlog later
+                cursor = await asyncio.to_thread(self.store.change_cursor)
+                continue
+            try:
+                cursor, changes = await asyncio.to_thread(self.store.changes_since, cursor)
+            except Exception as e:
+                logger.warning(f"Job change feed poll failed: {e}")
+                continue
+            for project_id, job in changes:
+                for subscriber in self.subscribers:
+                    if subscriber.wants(project_id, job):
+                        subscriber.push(project_id, job)
@@ -0,0 +1,329 @@
+"""
+Compact in-memory job records.
+
+Jobs in ``MemoryJobStore`` used to be the dicts they were created from: a
+dict per job plus one per request, a ``datetime`` per timestamp and a private
+copy of every plan, which adds up with tens of thousands of retained jobs.
+They are now held as ``JobRecord``s:
+
+- a ``__slots__`` dataclass with one field per known job key; keys without a
+  field go to ``extra``
+- statuses and stacks are ``StrEnum`` members, and other repeated strings
+  (tenants, messages, phases, lease owners) are interned, so every job shares
+  one copy of each value
+- timestamps are POSIX floats, turned back into ``datetime``s on read
+- requests are tuples instead of dicts
+- plans go through a ``PlanPool``: identical plans (cache hits, retries,
+  fallback plans) are stored once and shared by every job that has them, and
+  the keys and short values of all plans are interned. Shared plans are
+  read-only (``FrozenDict``/``FrozenList``); ``copy.deepcopy`` gives a plain,
+  modifiable copy
+
+With ``compact_finished``, completed and failed jobs are further packed into a
+``PackedJob``: the shared plan plus the other fields as a zlib-compressed JSON
+list, unpacked only when the job is read.
+
+The store still hands out plain dicts (``JobRecord.to_dict``), with the
+read-only plan in them.
+"""
+import copy
+import hashlib
+import json
+import sys
+import threading
+import weakref
+import zlib
+from dataclasses import dataclass, fields
+from datetime import datetime
+from enum import StrEnum
+from typing import Any, Dict, Optional, Tuple, Union
+
+
+class JobStatus(StrEnum):
+    PLANNING = "planning"
+    GENERATING = "generating"
+    PACKAGING = "packaging"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class Stack(StrEnum):
+    NEXTJS = "nextjs"
+    GO = "go"
+    PYTHON = "python"
+    RUST = "rust"
+
+
+REQUEST_FIELDS = ("prompt", "stack", "features", "tenant", "compression_level", "quality")
+DATETIME_FIELDS = frozenset({"created_at", "completed_at", "failed_at", "estimated_completion"})
+# Strings shorter than this inside plans are interned (stack, db, feature names, ...)
+MAX_INTERNED_LENGTH = 32
+
+
+def _member(value: Any, enum) -> Any:
+    """The enum member for ``value``, or ``value`` itself if it isn't one."""
+    if isinstance(value, str):
+        try:
+            return enum(value)
+        except ValueError:
+            return sys.intern(value)
+    return value
+
+
+def _interned(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _timestamp(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return value
+
+
+def _pack_request(request: Any) -> Any:
+    """A request dict as a tuple in ``REQUEST_FIELDS`` order; other shapes are kept as is."""
+    if not isinstance(request, dict) or not request.keys() <= set(REQUEST_FIELDS):
+        return request
+    features = request.get("features")
+    return (
+        request.get("prompt"),
+        _member(request.get("stack"), Stack),
+        tuple(sys.intern(f) for f in features) if features is not None else None,
+        _interned(request.get("tenant")),
+        request.get("compression_level"),
+        _interned(request.get("quality"))
+    )
+
+
+def _unpack_request(request: Any) -> Any:
+    if not isinstance(request, (tuple, list)):
+        return request
+    values = dict(zip(REQUEST_FIELDS, request))
+    if values["features"] is not None:
+        values["features"] = list(values["features"])
+    if values["stack"] is not None:
+        values["stack"] = str(values["stack"])
+    return values
+
+
+def _read_only(*args, **kwargs):
+    raise TypeError("Plans are shared between jobs and read-only; modify a copy.deepcopy() of it")
+
+
+class FrozenList(list):
+    """A list that refuses changes; copies and pickles are plain lists."""
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(item, memo) for item in self]
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class FrozenDict(dict):
+    """A dict that refuses changes; copies and pickles are plain dicts."""
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class SharedPlan(FrozenDict):
+    """A plan held by the pool; weakly referenceable so unused plans are dropped."""
+
+    __slots__ = ("__weakref__",)
+
+
+def _intern_plan(value: Any) -> Any:
+    """A read-only copy of a plan value with its keys and short strings interned."""
+    if isinstance(value, dict):
+        return FrozenDict((sys.intern(k), _intern_plan(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return FrozenList(_intern_plan(v) for v in value)
+    if isinstance(value, str) and len(value) < MAX_INTERNED_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+class PlanPool:
+    """Stores each distinct plan once; jobs with identical plans share it."""
+
+    def __init__(self):
+        self._plans: "weakref.WeakValueDictionary[bytes, SharedPlan]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def share(self, plan: Optional[Dict[str, Any]]) -> Optional[SharedPlan]:
+        if plan is None or isinstance(plan, SharedPlan):
+            return plan
+        key = hashlib.blake2b(
+            json.dumps(plan, sort_keys=True, default=str).encode(), digest_size=16
+        ).digest()
+        with self._lock:
+            shared = self._plans.get(key)
+            if shared is None:
+                # A copy, so the caller can keep modifying its own plan
+                shared = SharedPlan(_intern_plan(plan))
+                self._plans[key] = shared
+            return shared
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+
+# How each known job key is stored; keys without an entry only change the type
+_CONVERTERS = {
+    "status": lambda value: _member(value, JobStatus),
+    "message": _interned,
+    "tenant": _interned,
+    "phase": _interned,
+    "lease_owner": _interned,
+    "request": _pack_request,
+    **{name: _timestamp for name in DATETIME_FIELDS},
+}
+
+
+@dataclass(slots=True)
+class JobRecord:
+    status: Union[JobStatus, str, None] = None
+    progress: Optional[int] = None
+    message: Optional[str] = None
+    tenant: Optional[str] = None
+    request: Union[Tuple, Dict, None] = None
+    plan: Optional[SharedPlan] = None
+    phase: Optional[str] = None
+    lease_owner: Optional[str] = None
+    lease_expires: Optional[float] = None
+    created_at: Optional[float] = None
+    completed_at: Optional[float] = None
+    failed_at: Optional[float] = None
+    estimated_cost: Optional[float] = None
+    estimated_completion: Optional[float] = None
+    files_created: Optional[int] = None
+    zip_path: Optional[str] = None
+    download_url: Optional[str] = None
+    error: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
+    usage: Optional[Dict[str, Any]] = None
+    # Job keys without a field of their own
+    extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_fields(cls, job: Dict[str, Any], plans: PlanPool) -> "JobRecord":
+        record = cls()
+        record.update(job, plans)
+        return record
+
+    def update(self, job: Dict[str, Any], plans: PlanPool):
+        for key, value in job.items():
+            if key == "plan":
+                self.plan = plans.share(value)
+            elif key in _FIELD_NAMES:
+                converter = _CONVERTERS.get(key)
+                setattr(self, key, converter(value) if converter and value is not None else value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        job: Dict[str, Any] = {}
+        for name in _PLAIN_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                job[name] = value
+        status = self.status
+        if status is not None:
+            job["status"] = status.value if isinstance(status, StrEnum) else status
+        for name in _DATETIME_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                job[name] = datetime.fromtimestamp(value) if isinstance(value, float) else value
+        if self.request is not None:
+            job["request"] = _unpack_request(self.request)
+        if self.extra:
+            job.update(self.extra)
+        return job
+
+
+_FIELD_NAMES = tuple(f.name for f in fields(JobRecord) if f.name != "extra")
+# Fields to_dict hands out as stored, and the ones it converts back to datetimes
+_PLAIN_FIELDS = tuple(name for name in _FIELD_NAMES if name not in DATETIME_FIELDS and name not in ("status", "request"))
+_DATETIME_FIELDS = tuple(name for name in _FIELD_NAMES if name in DATETIME_FIELDS)
+# Everything but the plan, in the order PackedJob stores it
+_PACKED_FIELDS = tuple(name for name in _FIELD_NAMES if name != "plan") + ("extra",)
+# Preset dictionary: small blobs compress far better when their common substrings are known up front
+_ZDICT = json.dumps([
+    "completed", "failed", "Project generated successfully!", "planned", "rendered", "packaged",
+    {"plan": 0.0, "render": 0.0, "package": 0.0},
+    {"llm": {"calls": 1, "prompt_tokens": 0, "completion_tokens": 0, "load_seconds": 0.0,
+             "prompt_eval_seconds": 0.0, "eval_seconds": 0.0, "total_seconds": 0.0},
+     "cpu_seconds": {"plan": 0.0, "render": 0.0, "package": 0.0}, "bytes_written": 0, "archive_bytes": 0},
+    "nextjs", "python", "rust", "anonymous", "/download/", ".zip"
+], separators=(",", ":")).encode()
+
+
+class PackedJob:
+    """A finished job: its shared plan plus every other field as compressed JSON."""
+
+    __slots__ = ("plan", "blob")
+
+    def __init__(self, plan: Optional[SharedPlan], blob: bytes):
+        self.plan = plan
+        self.blob = blob
+
+    @classmethod
+    def pack(cls, record: JobRecord) -> Optional["PackedJob"]:
+        """Pack ``record``, or return None if a field isn't plain JSON."""
+        try:
+            data = json.dumps([getattr(record, name) for name in _PACKED_FIELDS], separators=(",", ":"))
+        except TypeError:
+            return None
+        compressor = zlib.compressobj(zlib.Z_BEST_COMPRESSION, zdict=_ZDICT)
+        return cls(record.plan, compressor.compress(data.encode()) + compressor.flush())
+
+    def unpack(self) -> JobRecord:
+        decompressor = zlib.decompressobj(zdict=_ZDICT)
+        values = json.loads(decompressor.decompress(self.blob))
+        record = JobRecord(**dict(zip(_PACKED_FIELDS, values)), plan=self.plan)
+        record.status = _member(record.status, JobStatus)
+        for name in ("message", "tenant", "phase", "lease_owner"):
+            setattr(record, name, _interned(getattr(record, name)))
+        if isinstance(record.request, list):
+            record.request = _pack_request(_unpack_request(record.request))
+        return record
+
+
+StoredJob = Union[JobRecord, PackedJob]
+
+
+def unpacked(job: StoredJob) -> JobRecord:
+    return job.unpack() if isinstance(job, PackedJob) else job
+
+
+def stored(record: JobRecord, compact_finished: bool) -> StoredJob:
+    """How ``record`` is kept: packed if it is finished and packing is enabled."""
+    if compact_finished and record.finished():
+        return PackedJob.pack(record) or record
+    return record
+
@@ -0,0 +1,410 @@
+"""
+Job state storage for the Zero-Code Builder.
+
+The in-memory store keeps everything in one process. The SQLite store keeps
+job state in a file so several uvicorn workers and the generation process
+pool on the same pod see the same jobs, and so unfinished jobs survive a
+restart. Workers hold a renewable lease on the jobs they run; a job whose
+lease has expired is picked up and resumed by another worker.
+
+Both stores number every create, update and delete with an increasing
+sequence so ``changes_since`` can serve a change feed (lease bookkeeping
+does not count as a change).
+
+The in-memory store keeps jobs as compact ``JobRecord``s (see ``job_records``)
+and hands out plain dicts. Building a dict costs a few microseconds (tens for a
+packed job), so the dicts of recently read jobs are cached until the job
+changes; repeated ``/status`` polls of a job only pay for a shallow copy.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from job_records import JobRecord, PlanPool, StoredJob, stored, unpacked
+
+
+class MemoryJobStore:
+    """Job store backed by a dict; only valid inside a single process."""
+
+    shared = False
+    # Dicts of recently read jobs kept ready to hand out
+    view_cache_size = 1024
+
+    def __init__(self, compact_finished: bool = False):
+        self._jobs: Dict[str, StoredJob] = {}
+        self._plans = PlanPool()
+        # Pack completed and failed jobs into compressed blobs until they are read
+        self.compact_finished = compact_finished
+        self._views: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._keys: Dict[str, Tuple[str, float]] = {}
+        # project_id -> sequence of its last change (kept after delete)
+        self._versions: Dict[str, int] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _changed(self, project_id: str):
+        self._seq += 1
+        self._versions[project_id] = self._seq
+        self._views.pop(project_id, None)
+
+    def _view(self, project_id: str, job: StoredJob, remember: bool = True) -> Dict[str, Any]:
+        """A job as a dict; nested values are shared with the store, as with plain dict storage."""
+        view = self._views.get(project_id)
+        if view is not None:
+            self._views.move_to_end(project_id)
+        else:
+            view = unpacked(job).to_dict()
+            # Listing every job would only push out the jobs that are being polled
+            if remember:
+                self._views[project_id] = view
+                if len(self._views) > self.view_cache_size:
+                    self._views.popitem(last=False)
+        return dict(view)
+
+    def create(self, project_id: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[project_id] = self._store(JobRecord.from_fields(fields, self._plans))
+            self._changed(project_id)
+
+    def _store(self, record: JobRecord) -> StoredJob:
+        return stored(record, self.compact_finished)
+
+    def get(self, project_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(project_id)
+            return self._view(project_id, job) if job is not None else None
+
+    def update(self, project_id: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            job = self._jobs.get(project_id)
+            if job is not None:
+                record = unpacked(job)
+                record.update(fields, self._plans)
+                self._jobs[project_id] = self._store(record)
+                self._changed(project_id)
+
+    def delete(self, project_id: str) -> bool:
+        with self._lock:
+            if self._jobs.pop(project_id, None) is None:
+                return False
+            self._changed(project_id)
+            return True
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return [(pid, self._view(pid, job, remember=False)) for pid, job in self._jobs.items()]
+
+    def __contains__(self, project_id: str) -> bool:
+        return project_id in self._jobs
+
+    def claim_key(self, key: str, project_id: str, ttl: float, replace: bool = False) -> str:
+        """Bind ``key`` to ``project_id`` unless another live job already holds it.
+
+        Returns the project id that owns the key afterwards.
+        """
+        now = time.time()
+        with self._lock:
+            if len(self._keys) > 1000:
+                self._keys = {k: v for k, v in self._keys.items() if v[1] > now}
+            owner = self._keys.get(key)
+            if owner and owner[1] > now and not replace:
+                return owner[0]
+            self._keys[key] = (project_id, now + ttl)
+            return project_id
+
+    def incomplete_jobs(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            # Packed jobs are always finished; skip them without unpacking
+            return [
+                (pid, self._view(pid, job, remember=False)) for pid, job in self._jobs.items()
+                if isinstance(job, JobRecord) and job.status not in FINISHED_STATUSES
+            ]
+
+    def change_cursor(self) -> int:
+        return self._seq
+
+    def changes_since(self, cursor: int) -> Tuple[int, List[Tuple[str, Optional[Dict[str, Any]]]]]:
+        """Jobs changed after ``cursor`` (``None`` for deleted ones) and the new cursor."""
+        with self._lock:
+            changed = sorted(
+                (seq, pid) for pid, seq in self._versions.items() if seq > cursor
+            )
+            jobs = [
+                (pid, self._view(pid, self._jobs[pid]) if pid in self._jobs else None) for _, pid in changed
+            ]
+            return self._seq, jobs
+
+    def acquire_lease(self, project_id: str, owner: str, ttl: float) -> bool:
+        """Take ownership of a job unless another live owner holds its lease."""
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(project_id)
+            if job is None:
+                return False
+            record = unpacked(job)
+            if not _lease_available(record.to_dict(), owner, now):
+                return False
+            record.update({"lease_owner": owner, "lease_expires": now + ttl}, self._plans)
+            self._jobs[project_id] = self._store(record)
+            self._views.pop(project_id, None)
+            return True
+
+    def renew_leases(self, project_ids: List[str], owner: str, ttl: float) -> None:
+        expires = time.time() + ttl
+        with self._lock:
+            for project_id in project_ids:
+                job = self._jobs.get(project_id)
+                # Leased jobs are running, so never packed
+                if isinstance(job, JobRecord) and job.lease_owner == owner:
+                    job.lease_expires = expires
+                    self._views.pop(project_id, None)
+
+
+class SQLiteJobStore:
+    """Job store backed by a SQLite file shared between processes."""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " project_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " seq INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if "seq" not in columns:
+            # Job stores created before the change feed existed
+            conn.execute("ALTER TABLE jobs ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_seq ON jobs (seq)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_tombstones ("
+            " project_id TEXT PRIMARY KEY,"
+            " seq INTEGER NOT NULL,"
+            " deleted_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_keys ("
+            " key TEXT PRIMARY KEY,"
+            " project_id TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _dumps(self, job: Dict[str, Any]) -> str:
+        return json.dumps(job, default=_json_default)
+
+    def _max_seq(self, conn: sqlite3.Connection) -> int:
+        """Latest change sequence; writers call it inside their write transaction."""
+        return conn.execute(
+            "SELECT MAX(seq) FROM (SELECT MAX(seq) AS seq FROM jobs"
+            " UNION ALL SELECT MAX(seq) FROM job_tombstones)"
+        ).fetchone()[0] or 0
+
+    def create(self, project_id: str, fields: Dict[str, Any]) -> None:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (project_id, data, updated_at, seq) VALUES (?, ?, ?, ?)",
+                (project_id, self._dumps(fields), time.time(), self._max_seq(conn) + 1)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, project_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT data FROM jobs WHERE project_id = ?", (project_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, project_id: str, fields: Dict[str, Any]) -> None:
+        conn = self._connection()
+        # Read-modify-write under a write lock so concurrent updates don't clobber each other
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT data FROM jobs WHERE project_id = ?", (project_id,)
+            ).fetchone()
+            if row:
+                job = json.loads(row[0])
+                job.update(fields)
+                conn.execute(
+                    "UPDATE jobs SET data = ?, updated_at = ?, seq = ? WHERE project_id = ?",
+                    (self._dumps(job), time.time(), self._max_seq(conn) + 1, project_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, project_id: str) -> bool:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = self._max_seq(conn) + 1
+            deleted = conn.execute(
+                "DELETE FROM jobs WHERE project_id = ?", (project_id,)
+            ).rowcount > 0
+            if deleted:
+                # Tombstones let change-feed readers see the delete; a day is plenty
+                conn.execute("DELETE FROM job_tombstones WHERE deleted_at < ?", (now - 86400,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_tombstones (project_id, seq, deleted_at) VALUES (?, ?, ?)",
+                    (project_id, seq, now)
+                )
+            conn.execute("COMMIT")
+            return deleted
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        rows = self._connection().execute(
+            "SELECT project_id, data FROM jobs ORDER BY rowid"
+        ).fetchall()
+        return [(pid, json.loads(data)) for pid, data in rows]
+
+    def __contains__(self, project_id: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM jobs WHERE project_id = ?", (project_id,)
+        ).fetchone() is not None
+
+    def claim_key(self, key: str, project_id: str, ttl: float, replace: bool = False) -> str:
+        """Bind ``key`` to ``project_id`` unless another live job already holds it.
+
+        Returns the project id that owns the key afterwards.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM job_keys WHERE expires_at <= ?", (now,))
+            row = conn.execute(
+                "SELECT project_id FROM job_keys WHERE key = ?", (key,)
+            ).fetchone()
+            if row and not replace:
+                conn.execute("COMMIT")
+                return row[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO job_keys (key, project_id, expires_at) VALUES (?, ?, ?)",
+                (key, project_id, now + ttl)
+            )
+            conn.execute("COMMIT")
+            return project_id
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def incomplete_jobs(self) -> List[Tuple[str, Dict[str, Any]]]:
+        rows = self._connection().execute(
+            "SELECT project_id, data FROM jobs"
+            " WHERE json_extract(data, '$.status') NOT IN ('completed', 'failed')"
+        ).fetchall()
+        return [(pid, json.loads(data)) for pid, data in rows]
+
+    def change_cursor(self) -> int:
+        return self._max_seq(self._connection())
+
+    def changes_since(self, cursor: int) -> Tuple[int, List[Tuple[str, Optional[Dict[str, Any]]]]]:
+        """Jobs changed after ``cursor`` (``None`` for deleted ones) and the new cursor."""
+        rows = self._connection().execute(
+            "SELECT project_id, data, seq FROM jobs WHERE seq > ?"
+            " UNION ALL SELECT project_id, NULL, seq FROM job_tombstones WHERE seq > ?"
+            " ORDER BY seq",
+            (cursor, cursor)
+        ).fetchall()
+        if not rows:
+            return cursor, []
+        return rows[-1][2], [(pid, json.loads(data) if data else None) for pid, data, _ in rows]
+
+    def acquire_lease(self, project_id: str, owner: str, ttl: float) -> bool:
+        """Take ownership of a job unless another live owner holds its lease."""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT data FROM jobs WHERE project_id = ?", (project_id,)
+            ).fetchone()
+            acquired = bool(row) and _lease_available(json.loads(row[0]), owner, now)
+            if acquired:
+                job = json.loads(row[0])
+                job.update({"lease_owner": owner, "lease_expires": now + ttl})
+                conn.execute(
+                    "UPDATE jobs SET data = ?, updated_at = ? WHERE project_id = ?",
+                    (self._dumps(job), now, project_id)
+                )
+            conn.execute("COMMIT")
+            return acquired
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def renew_leases(self, project_ids: List[str], owner: str, ttl: float) -> None:
+        expires = time.time() + ttl
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for project_id in project_ids:
+                conn.execute(
+                    "UPDATE jobs SET data = json_set(data, '$.lease_expires', ?)"
+                    " WHERE project_id = ? AND json_extract(data, '$.lease_owner') = ?",
+                    (expires, project_id, owner)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+def _lease_available(job: Dict[str, Any], owner: str, now: float) -> bool:
+    return (
+        job.get("lease_owner") in (None, owner)
+        or job.get("lease_expires", 0) < now
+    )
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def create_job_store(url: str, compact_finished: bool = False):
+    """Create a job store from a URL: ``memory`` or ``sqlite:///path/to/jobs.db``.
+
+    ``compact_finished`` only applies to the memory store; SQLite already keeps jobs serialized.
+    """
+    if url == "memory":
+        return MemoryJobStore(compact_finished)
+    if url.startswith("sqlite:///"):
+        return SQLiteJobStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported job store URL: {url}")
@@ -0,0 +1,418 @@
+"""
+Project generation pipeline: plan, generate code, package.
+
+The pipeline only talks to a job store, so it can run on a thread in the API
+process or in a separate worker process that shares the store. Each phase
+checkpoints its output to the store (``phase``: planned, rendered, packaged)
+so an interrupted job can be resumed without repeating finished work.
+"""
+import contextvars
+import copy
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from chains.planner import SUPPORTED_STACKS, ProjectPlanner
+from chains.ollama_client import OllamaClient, record_calls
+from chains.prompt_registry import DEFAULT_PROMPTS_FILE, PromptRegistry
+from chains.codegen import CodeGenerator
+from jobs import create_job_store
+from archives import DEFLATE_LEVEL, BaseLayer, Packager, build_base_layers
+from scheduling import FairScheduler
+from startup import load_snapshot
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationPipeline:
+    def __init__(
+        self,
+        store,
+        planner: ProjectPlanner,
+        generator: CodeGenerator,
+        artifact_dir: str = "/tmp",
+        speculative_codegen: bool = False,
+        compression_level: int = DEFLATE_LEVEL,
+        compression_workers: Optional[int] = None,
+        prebuilt_layers: Optional[Dict[str, BaseLayer]] = None,
+        record_llm_calls: bool = False
+    ):
+        self.store = store
+        self.planner = planner
+        self.generator = generator
+        self.artifact_dir = artifact_dir
+        self.speculative_codegen = speculative_codegen
+        # Keep per-call LLM timings in the job record for the traffic recorder
+        self.record_llm_calls = record_llm_calls
+        # Static per-stack files are compressed once and copied into every archive
+        self.packager = Packager(
+            build_base_layers(generator, SUPPORTED_STACKS, compression_level or DEFLATE_LEVEL, prebuilt_layers),
+            workers=compression_workers,
+            level=compression_level
+        )
+        # Speculative codegen: write the stack scaffold while the planner is still streaming
+        self.speculation_executor = ThreadPoolExecutor(thread_name_prefix="speculative-codegen")
+
+    def run(
+        self,
+        project_id: str,
+        prompt: str,
+        preferred_stack: Optional[str] = None,
+        preferred_features: Optional[List[str]] = None,
+        tenant: str = "anonymous",
+        compression_level: Optional[int] = None,
+        quality: Optional[str] = None
+    ):
+        """Generate a project and record its progress in the job store."""
+        request = {
+            "prompt": prompt,
+            "stack": preferred_stack,
+            "features": preferred_features,
+            "tenant": tenant,
+            "compression_level": compression_level,
+            "quality": quality
+        }
+        self._execute(project_id, request, {})
+
+    def resume(self, project_id: str):
+        """Resume an interrupted job from its last checkpointed phase."""
+        job = self.store.get(project_id)
+        if job is None or job["status"] in ("completed", "failed"):
+            return
+        if not job.get("request"):
+            self._fail(project_id, "Job cannot be resumed: request was not recorded")
+            return
+        logger.info(f"Resuming project {project_id} after phase {job.get('phase') or 'none'}")
+        self._execute(project_id, job["request"], job)
+
+    def _execute(self, project_id: str, request: Dict[str, Any], checkpoint: Dict[str, Any]):
+        """Run the plan -> render -> package phases, skipping checkpointed ones."""
+        phase = checkpoint.get("phase")
+        # Wall time per phase, kept across resumes; feeds the job cost model
+        timings = dict(checkpoint.get("timings") or {})
+        # LLM tokens and durations, CPU seconds per phase and bytes written, also kept across resumes
+        usage = copy.deepcopy(checkpoint.get("usage") or {})
+        # Work directory lives next to the artifacts so a rendered checkpoint survives a restart
+        work_dir = os.path.join(self.artifact_dir, "work", project_id)
+
+        with tracing.span(
+            "pipeline.run",
+            trace_id=tracing.trace_id_for(project_id),
+            project_id=project_id,
+            tenant=request["tenant"],
+            resumed_after=phase or ""
+        ):
+            try:
+                scaffold = None
+                if phase in ("planned", "rendered"):
+                    plan = checkpoint["plan"]
+                else:
+                    plan, scaffold = self._plan_phase(project_id, request, work_dir, timings, usage)
+
+                if phase == "rendered" and os.path.isdir(work_dir):
+                    files_created = checkpoint["files_created"]
+                else:
+                    files_created = self._render_phase(project_id, plan, work_dir, scaffold, timings, usage)
+
+                self._package_phase(
+                    project_id, plan, work_dir, files_created, timings, usage, request.get("compression_level")
+                )
+
+            except Exception as e:
+                logger.error(f"Failed to generate project {project_id}: {e}")
+                self._fail(project_id, str(e))
+            finally:
+                # Only reached if this process survives; a crash leaves the checkpoint in place
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _plan_phase(
+        self,
+        project_id: str,
+        request: Dict[str, Any],
+        work_dir: str,
+        timings: Dict[str, float],
+        usage: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Optional[List[str]]]:
+        """Plan the project; returns the plan and any reusable speculative scaffold."""
+        started = time.monotonic()
+        cpu_started = time.thread_time()
+        llm_usage: Dict[str, Any] = {}
+        preferred_stack = request.get("stack")
+        preferred_features = request.get("features")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        speculation = {}
+
+        def start_speculative_scaffold(fields: Dict):
+            """Start the stack scaffold as soon as the planner has picked a stack."""
+            partial_plan = {
+                "stack": preferred_stack or fields["stack"],
+                "project_name": fields["project_name"]
+            }
+            speculation["plan"] = partial_plan
+            speculation["future"] = self.speculation_executor.submit(
+                contextvars.copy_context().run,
+                self.generator.generate_scaffold, partial_plan, work_dir
+            )
+            logger.info(f"Speculative {partial_plan['stack']} scaffold started for project {project_id}")
+
+        try:
+            # Update status: Planning
+            self.store.update(project_id, {
+                "status": "planning",
+                "progress": 20,
+                "message": "Creating project specification..."
+            })
+
+            # Step 1: Plan the project
+            logger.info(f"Planning project {project_id}")
+            with record_calls() as llm_calls:
+                plan = self.planner.analyze_requirements(
+                    request["prompt"],
+                    on_partial=start_speculative_scaffold if self.speculative_codegen else None,
+                    tenant=request["tenant"],
+                    usage=llm_usage,
+                    quality=request.get("quality")
+                )
+
+            # Apply user preferences if provided
+            if preferred_stack:
+                plan["stack"] = preferred_stack
+            if preferred_features:
+                plan["features"] = preferred_features
+
+            scaffold = self._reconcile_speculative_scaffold(project_id, speculation, plan, work_dir)
+        finally:
+            future = speculation.get("future")
+            if future and not future.cancel():
+                # Let a running scaffold finish before its directory is reused or removed
+                future.exception()
+
+        timings["plan"] = round(time.monotonic() - started, 3)
+        usage["llm"] = llm_usage
+        usage.setdefault("cpu_seconds", {})["plan"] = round(time.thread_time() - cpu_started, 3)
+        message = f"Generating {plan['stack']} project..."
+        if plan.get("degraded"):
+            message += " (AI planner unavailable, using a basic plan)"
+        
+        # Checkpoint: the plan is the expensive LLM output, never redo it
+        checkpoint = {
+            "status": "generating",
+            "progress": 50,
+            "message": message,
+            "plan": plan,
+            "phase": "planned",
+            "timings": dict(timings),
+            "usage": copy.deepcopy(usage)
+        }
+        if self.record_llm_calls:
+            checkpoint["llm_calls"] = llm_calls
+        self.store.update(project_id, checkpoint)
+        return plan, scaffold
+
+    def _render_phase(
+        self,
+        project_id: str,
+        plan: Dict[str, Any],
+        work_dir: str,
+        scaffold: Optional[List[str]],
+        timings: Dict[str, float],
+        usage: Dict[str, Any]
+    ) -> int:
+        """Render the project files into ``work_dir``; returns the file count."""
+        started = time.monotonic()
+        cpu_started = time.thread_time()
+        if scaffold is None:
+            # Drop anything a previous, interrupted render left behind
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+
+        # Step 2: Generate code
+        logger.info(f"Generating code for project {project_id}")
+        created_files = self.generator.generate_project(plan, work_dir, scaffold=scaffold)
+        timings["render"] = round(time.monotonic() - started, 3)
+        usage.setdefault("cpu_seconds", {})["render"] = round(time.thread_time() - cpu_started, 3)
+        usage["bytes_written"] = sum(os.path.getsize(path) for path in created_files)
+
+        # Checkpoint: rendered files stay in the work directory until packaged
+        self.store.update(project_id, {
+            "status": "packaging",
+            "progress": 80,
+            "message": "Creating project package...",
+            "files_created": len(created_files),
+            "phase": "rendered",
+            "timings": dict(timings),
+            "usage": copy.deepcopy(usage)
+        })
+        return len(created_files)
+
+    def _package_phase(
+        self,
+        project_id: str,
+        plan: Dict[str, Any],
+        work_dir: str,
+        files_created: int,
+        timings: Dict[str, float],
+        usage: Dict[str, Any],
+        compression_level: Optional[int] = None
+    ):
+        """Zip the rendered project and mark the job completed."""
+        started = time.monotonic()
+        cpu_started = time.thread_time()
+        # Step 3: Create zip file
+        zip_filename = f"{plan['project_name']}_{project_id}.zip"
+        zip_path = os.path.join(self.artifact_dir, zip_filename)
+
+        with tracing.span("package.assemble", files=files_created, stack=plan["stack"]) as span:
+            stats = self.packager.package(work_dir, zip_path, plan["stack"], level=compression_level)
+            if span:
+                for key, value in stats.items():
+                    span.set_attribute(key, value)
+        timings["package"] = round(time.monotonic() - started, 3)
+        # Compression runs on the packager's pool; count its CPU time too
+        package_cpu = time.thread_time() - cpu_started + stats["compress_cpu_seconds"]
+        usage.setdefault("cpu_seconds", {})["package"] = round(package_cpu, 3)
+        usage["archive_bytes"] = stats["archive_bytes"]
+
+        # Update status: Complete
+        self.store.update(project_id, {
+            "status": "completed",
+            "progress": 100,
+            "message": "Project generated successfully!",
+            "download_url": f"/download/{zip_filename}",
+            "zip_path": zip_path,
+            "plan": plan,
+            "files_created": files_created,
+            "phase": "packaged",
+            "timings": dict(timings),
+            "usage": copy.deepcopy(usage),
+            "completed_at": datetime.now()
+        })
+
+        logger.info(f"Project {project_id} generated successfully")
+
+    def _fail(self, project_id: str, error: str):
+        self.store.update(project_id, {
+            "status": "failed",
+            "progress": 0,
+            "message": f"Generation failed: {error}",
+            "error": error,
+            "failed_at": datetime.now()
+        })
+
+    def _reconcile_speculative_scaffold(
+        self,
+        project_id: str,
+        speculation: Dict,
+        plan: Dict[str, Any],
+        work_dir: str
+    ) -> Optional[List[str]]:
+        """Keep the speculative scaffold if it matches the final plan, else discard it."""
+        future = speculation.get("future")
+        if not future:
+            return None
+
+        speculative_plan = speculation["plan"]
+        try:
+            scaffold = future.result()
+        except Exception as e:
+            logger.warning(f"Speculative scaffold failed for project {project_id}: {e}")
+            scaffold = None
+
+        if scaffold is not None and (
+            speculative_plan["stack"] == plan["stack"]
+            and speculative_plan["project_name"] == plan["project_name"]
+        ):
+            logger.info(f"Speculative scaffold reused for project {project_id}")
+            return scaffold
+
+        # The final plan changed the stack or name: start from an empty directory
+        logger.info(f"Speculative scaffold discarded for project {project_id}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir, exist_ok=True)
+        return None
+
+
+def build_pipeline(store, ollama_base_url: str, options: Dict[str, Any]) -> GenerationPipeline:
+    """Build the planner, generator and pipeline from deployment options."""
+    plan_cache = None
+    if options.get("semantic_cache", "off") != "off":
+        # Imported lazily: NumPy is only needed when the semantic cache is enabled
+        from semantic_cache import create_plan_cache
+        plan_cache = create_plan_cache(options["semantic_cache"], ollama_base_url, options)
+    # Compiled prompts and base layers prebuilt at image build time
+    snapshot = load_snapshot(options.get("startup_snapshot")) or {}
+
+    client = OllamaClient(
+        options.get("ollama_base_urls") or [ollama_base_url],
+        hedging=options.get("llm_hedging", False),
+        min_timeout=options.get("llm_min_timeout", 30.0),
+        max_timeout=options.get("llm_timeout", 300.0),
+        breaker_failures=options.get("llm_breaker_failures", 5),
+        breaker_reset=options.get("llm_breaker_reset", 30.0),
+        parallel=options.get("llm_parallel"),
+        batch_window=options.get("llm_batch_window", 0.0),
+        max_inflight=options.get("llm_max_inflight"),
+        queue_timeout=options.get("llm_queue_timeout", 30.0)
+    )
+    planner = ProjectPlanner(
+        ollama_base_url,
+        # Without a fixed cap, the fair queue admits what the backends' (adaptive) limits take
+        scheduler=FairScheduler(options.get("llm_concurrency") or client.capacity, options.get("tenant_weights")),
+        plan_cache=plan_cache,
+        prompts=PromptRegistry(options.get("prompts_file") or DEFAULT_PROMPTS_FILE, snapshot=snapshot.get("prompts")),
+        client=client,
+        models=options.get("planner_models"),
+        quality=options.get("planner_quality", "auto")
+    )
+    return GenerationPipeline(
+        store,
+        planner,
+        CodeGenerator(ollama_base_url),
+        artifact_dir=options.get("artifact_dir", "/tmp"),
+        speculative_codegen=options.get("speculative_codegen", False),
+        compression_level=options.get("compression_level", DEFLATE_LEVEL),
+        compression_workers=options.get("compression_workers"),
+        prebuilt_layers=snapshot.get("layers"),
+        record_llm_calls=options.get("record_llm_calls", False)
+    )
+
+
+# Process pool workers: each worker process builds its own pipeline once
+_worker_pipeline: Optional[GenerationPipeline] = None
+
+
+def init_worker(store_url: str, ollama_base_url: str, options: Dict[str, Any]):
+    """Initializer for generation worker processes."""
+    global _worker_pipeline
+    logging.basicConfig(level=logging.INFO)
+    _worker_pipeline = build_pipeline(create_job_store(store_url), ollama_base_url, options)
+    logger.info(f"Generation worker {os.getpid()} ready")
+
+
+def worker_ready() -> int:
+    """No-op job submitted at startup so worker processes spawn before the first real job."""
+    return os.getpid()
+
+
+def run_job(
+    project_id: str,
+    prompt: str,
+    preferred_stack: Optional[str] = None,
+    preferred_features: Optional[List[str]] = None,
+    tenant: str = "anonymous",
+    compression_level: Optional[int] = None,
+    quality: Optional[str] = None
+):
+    """Run one generation job inside a worker process."""
+    _worker_pipeline.run(project_id, prompt, preferred_stack, preferred_features, tenant, compression_level, quality)
+
+
+def resume_job(project_id: str):
+    """Resume one interrupted generation job inside a worker process."""
+    _worker_pipeline.resume(project_id)
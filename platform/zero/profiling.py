@@ -0,0 +1,97 @@
+"""
+On-demand profiling of a live worker.
+
+- ``sample``: a pure-Python sampling profiler over every thread of this
+  process, returned as folded stacks (flamegraph.pl / speedscope input)
+- ``cprofile``: deterministic cProfile of the event loop thread, i.e. the
+  request handling path, returned as pstats text
+- ``py-spy``: runs ``py-spy record`` against this process and its
+  subprocesses (generation workers), if py-spy is installed
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Tuple
+
+MAX_SECONDS = 120
+_capture_lock = asyncio.Lock()
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """Sample all threads' stacks for ``seconds`` and return folded stacks."""
+    names = {}
+    counts: Counter = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        names.update({t.ident: t.name for t in threading.enumerate()})
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+async def profile_event_loop(seconds: float) -> str:
+    """cProfile everything the event loop thread runs for ``seconds``."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(100)
+    return output.getvalue()
+
+
+def py_spy_record(seconds: float) -> str:
+    """Record a speedscope profile of this process tree with py-spy."""
+    py_spy = shutil.which("py-spy")
+    if not py_spy:
+        raise RuntimeError("py-spy is not installed")
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "profile.json")
+        subprocess.run(
+            [py_spy, "record", "--pid", str(os.getpid()), "--subprocesses",
+             "--duration", str(int(seconds)), "--format", "speedscope", "--output", output],
+            check=True,
+            capture_output=True,
+            timeout=seconds + 30
+        )
+        with open(output) as f:
+            return f.read()
+
+
+async def capture(mode: str, seconds: float) -> Tuple[str, str]:
+    """Capture a profile; returns ``(content, media_type)``. One capture at a time."""
+    if mode not in ("sample", "cprofile", "py-spy"):
+        raise ValueError(f"Unknown profile mode: {mode}")
+    seconds = max(1.0, min(float(seconds), MAX_SECONDS))
+    if _capture_lock.locked():
+        raise RuntimeError("A profile capture is already running")
+
+    async with _capture_lock:
+        if mode == "sample":
+            return await asyncio.to_thread(sample_stacks, seconds), "text/plain"
+        if mode == "cprofile":
+            return await profile_event_loop(seconds), "text/plain"
+        return await asyncio.to_thread(py_spy_record, seconds), "application/json"
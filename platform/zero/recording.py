@@ -0,0 +1,133 @@
+"""
+Opt-in recording of production ``/generate`` traffic for offline replay.
+
+With ``ZERO_RECORD_FILE`` set, the API appends one compact JSON line per
+``/generate`` request and one per job it finished:
+
+    {"type":"request","ts":1718000000.123,"job":"3f2a9c1e0b7d","tenant":"5d41402abc4b",
+     "outcome":"started","prompt":"A shop for <email>'s bakery","quality":"auto"}
+    {"type":"result","ts":1718000012.5,"job":"3f2a9c1e0b7d","status":"completed",
+     "timings":{"plan":9.8,"render":0.4,"package":0.2},"llm":[{"model":"...","ttft":0.8,...}],"plan":{...}}
+
+A job's end-to-end latency is the difference between its ``started``
+request's and its result's ``ts``. ``llm`` holds each planner call's model,
+time to first token, total time, token counts and response size (see
+``chains.ollama_client.record_calls``).
+Prompts and plans are sanitized before they are written: e-mail addresses,
+URL credentials, tokens and keys, IP addresses and phone numbers become
+placeholders. Tenants, project ids and idempotency keys are replaced by
+stable hashes, so request lines still link to their job's result.
+
+Jobs are sampled by a hash of their id, so every API worker and pod keeps or
+drops the same jobs. ``bench/replay.py`` reads a recording back and replays
+it against a local instance.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Applied in order; earlier patterns would otherwise be split up by later ones
+_SECRET_PATTERNS = [
+    (re.compile(r"\b([a-z][a-z0-9+.-]*://)[^\s/:@]+:[^\s/@]+@", re.I), r"\1<credentials>@"),
+    (re.compile(r"\beyJ[\w-]+\.[\w-]+\.[\w-]+"), "<token>"),
+    (re.compile(r"\b(?:sk|pk|rk)_(?:live|test)_\w{8,}|\bsk-[\w-]{16,}|\bgh[pousr]_\w{20,}|\bxox[abpr]-[\w-]{10,}"), "<token>"),
+    (re.compile(r"\bAKIA[0-9A-Z]{16}\b"), "<token>"),
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "<email>"),
+    # Long random-looking strings: hex digests, base64 keys, session ids
+    (re.compile(r"\b(?=[\w-]*\d)(?=[\w-]*[A-Za-z])[\w-]{32,}\b"), "<token>"),
+    (re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b"), "<ip>"),
+]
+_PHONE = re.compile(r"(?<![\w<])\+?\d[\d\s().-]{7,}\d(?![\w>])")
+
+
+def sanitize(text: str) -> str:
+    """Replace personal data and credentials in ``text`` with placeholders."""
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    # Dates and version numbers look similar; phone numbers have at least 9 digits
+    return _PHONE.sub(lambda m: "<phone>" if sum(c.isdigit() for c in m.group()) >= 9 else m.group(), text)
+
+
+def sanitize_value(value: Any) -> Any:
+    """``sanitize`` every string in a JSON-like value."""
+    if isinstance(value, str):
+        return sanitize(value)
+    if isinstance(value, dict):
+        return {key: sanitize_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [sanitize_value(item) for item in value]
+    return value
+
+
+def pseudonym(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()[:12]
+
+
+class TrafficRecorder:
+    def __init__(self, path: str, sample_rate: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def sampled(self, project_id: str) -> bool:
+        return int(hashlib.sha256(project_id.encode()).hexdigest()[:8], 16) < self.sample_rate * 0x100000000
+
+    def record_request(
+        self,
+        project_id: str,
+        tenant: str,
+        request: Dict[str, Any],
+        outcome: str,
+        idempotency_key: Optional[str] = None
+    ):
+        """Record a ``/generate`` request: started a job, attached to ``project_id``, or rejected."""
+        if not self.sampled(project_id):
+            return
+        line = {
+            "type": "request",
+            "ts": round(time.time(), 3),
+            "job": pseudonym(project_id),
+            "tenant": pseudonym(tenant),
+            "outcome": outcome,
+            "prompt": sanitize(request["prompt"]),
+            "stack": request.get("stack"),
+            "features": sanitize_value(request.get("features")),
+            "quality": request.get("quality"),
+            "compression_level": request.get("compression_level"),
+            "idempotency_key": pseudonym(idempotency_key) if idempotency_key else None
+        }
+        self._write(line)
+
+    def record_result(self, project_id: str, job: Dict[str, Any]):
+        """Record how a finished job went, including each planner call it made."""
+        if not self.sampled(project_id):
+            return
+        usage = job.get("usage") or {}
+        line = {
+            "type": "result",
+            "ts": round(time.time(), 3),
+            "job": pseudonym(project_id),
+            "status": job["status"],
+            "timings": job.get("timings"),
+            "llm": job.get("llm_calls"),
+            "files": job.get("files_created"),
+            "archive_bytes": usage.get("archive_bytes"),
+            "plan": sanitize_value(job.get("plan"))
+        }
+        self._write(line)
+
+    def _write(self, line: Dict[str, Any]):
+        data = json.dumps({k: v for k, v in line.items() if v is not None}, separators=(",", ":"), default=str)
+        try:
+            with self._lock:
+                with open(self.path, "a") as f:
+                    f.write(data + "\n")
+        except OSError as e:
+            # Recording is best effort; never fail a request over it
+            logger.warning(f"Traffic recording to {self.path} failed: {e}")
@@ -0,0 +1,366 @@
+"""
+Per-tenant admission control and fair sharing of LLM capacity.
+
+``RateLimiter`` keeps a token bucket per tenant in front of /generate.
+``FairScheduler`` is a weighted fair queue in front of the LLM calls: at most
+``capacity`` calls run at once, so a tenant with a large batch only gets its
+weighted share of the backend while others are waiting. The capacity may be
+a callable, e.g. the LLM client's current adaptive limits, so it follows
+what the backends take instead of capping them.
+``JobQueue`` orders generation jobs waiting for a worker, shortest estimated
+job first with aging, using costs from ``JobCostModel``.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import metrics
+
+RATE_LIMITED = metrics.Counter(
+    "zero_rate_limited_total", "Requests rejected by the per-tenant rate limit", ["tenant"]
+)
+LLM_QUEUE_DEPTH = metrics.Gauge(
+    "zero_llm_queue_depth", "LLM calls waiting for a slot", ["tenant"]
+)
+LLM_WAIT_SECONDS = metrics.Histogram(
+    "zero_llm_wait_seconds", "Time LLM calls waited for a slot", ["tenant"]
+)
+LLM_INFLIGHT = metrics.Gauge(
+    "zero_llm_inflight", "LLM calls currently running"
+)
+JOB_QUEUE_DEPTH = metrics.Gauge(
+    "zero_job_queue_depth", "Generation jobs waiting for a worker"
+)
+JOB_QUEUE_WAIT = metrics.Histogram(
+    "zero_job_queue_wait_seconds", "Time generation jobs waited for a worker",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600)
+)
+
+
+# Per-tenant state is pruned of idle tenants once it holds more than this many
+MAX_IDLE_TENANTS = 1000
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse ``tenant=weight,tenant=weight`` into a dict."""
+    weights = {}
+    for item in spec.split(","):
+        if "=" in item:
+            tenant, weight = item.split("=", 1)
+            weights[tenant.strip()] = float(weight)
+    return weights
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Take one token; return 0 on success or the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token bucket rate limit per tenant; a rate of 0 disables limiting."""
+
+    def __init__(self, rate: float, burst: float, weights: Optional[Dict[str, float]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights or {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now: float):
+        """Drop buckets that have refilled; a new bucket starts out the same."""
+        self._buckets = {
+            tenant: bucket for tenant, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate < bucket.burst
+        }
+
+    def check(self, tenant: str) -> float:
+        """Admit one request; return 0 if allowed, else the suggested retry delay."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(tenant)
+            if bucket is None:
+                if len(self._buckets) > MAX_IDLE_TENANTS:
+                    self._evict_idle(now)
+                # Weighted tenants get a proportionally larger rate and burst
+                weight = self.weights.get(tenant, 1.0)
+                bucket = TokenBucket(self.rate * weight, max(1.0, self.burst * weight))
+                self._buckets[tenant] = bucket
+            # Not ``now``: a bucket created just above is stamped later, and would start short of a token
+            retry_after = bucket.take(time.monotonic())
+        if retry_after:
+            RATE_LIMITED.inc(tenant=tenant)
+        return retry_after
+
+    def refund(self, tenant: str):
+        """Give back the token of an admitted request that didn't start anything."""
+        with self._lock:
+            bucket = self._buckets.get(tenant)
+            if bucket is not None:
+                bucket.tokens = min(bucket.burst, bucket.tokens + 1)
+
+
+class FairScheduler:
+    """Weighted fair queue limiting concurrent LLM calls across tenants.
+    
+    Uses start-time fair queuing: each call is tagged with
+    ``start = max(virtual_time, previous finish of its tenant)`` and
+    ``finish = start + cost / weight``; waiting calls are granted in start-tag
+    order and the virtual time follows the start tag of the last granted call.
+    """
+
+    def __init__(self, capacity: Union[int, Callable[[], int]], weights: Optional[Dict[str, float]] = None):
+        # A fixed number of slots, or a callable read on every acquire and release
+        self.capacity = capacity
+        self.weights = weights or {}
+        self._running = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, tenant: str, cost: float = 1.0):
+        """Hold one LLM slot for ``tenant`` for the duration of the block."""
+        self.acquire(tenant, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, tenant: str, cost: float = 1.0):
+        started = time.monotonic()
+        with self._lock:
+            if len(self._last_finish) > MAX_IDLE_TENANTS:
+                if not self._queue:
+                    # Nobody is backlogged: as at the end of a busy period, every tenant starts level
+                    self._virtual_time = max(self._virtual_time, *self._last_finish.values())
+                    self._last_finish = {}
+                else:
+                    # Finish tags behind the virtual time no longer affect scheduling
+                    self._last_finish = {
+                        t: finish for t, finish in self._last_finish.items() if finish > self._virtual_time
+                    }
+            start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+            self._last_finish[tenant] = start + cost / self.weights.get(tenant, 1.0)
+
+            if self._running < self._capacity() and not self._queue:
+                self._running += 1
+                self._virtual_time = start
+                LLM_INFLIGHT.set(self._running)
+                LLM_WAIT_SECONDS.observe(0.0, tenant=tenant)
+                return
+
+            granted = threading.Event()
+            heapq.heappush(self._queue, (start, next(self._sequence), tenant, granted))
+            LLM_QUEUE_DEPTH.inc(tenant=tenant)
+
+        granted.wait()
+        LLM_WAIT_SECONDS.observe(time.monotonic() - started, tenant=tenant)
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+            # Hand free slots to the waiters with the smallest start tags; the capacity may have grown
+            capacity = self._capacity()
+            while self._queue and self._running < capacity:
+                start, _, tenant, granted = heapq.heappop(self._queue)
+                self._virtual_time = start
+                self._running += 1
+                LLM_QUEUE_DEPTH.dec(tenant=tenant)
+                granted.set()
+            LLM_INFLIGHT.set(self._running)
+
+    def _capacity(self) -> int:
+        return self.capacity() if callable(self.capacity) else self.capacity
+
+    def queue_depths(self) -> Dict[str, int]:
+        with self._lock:
+            depths: Dict[str, int] = {}
+            for _, _, tenant, _ in self._queue:
+                depths[tenant] = depths.get(tenant, 0) + 1
+            return depths
+
+
+class JobCostModel:
+    """Estimate a job's run time from its plan and observed per-stack timings.
+
+    Planning time is a moving average over all jobs; rendering and packaging
+    time is a moving average of seconds per file for each stack, scaled by
+    the plan's ``estimated_files`` and ``complexity``.
+    """
+
+    COMPLEXITY = {"simple": 1.0, "medium": 1.5, "complex": 2.5}
+
+    def __init__(self, plan_seconds: float = 20.0, file_seconds: float = 0.05, alpha: float = 0.2):
+        self.alpha = alpha
+        self.plan_seconds = plan_seconds
+        self.default_file_seconds = file_seconds
+        self.file_seconds: Dict[str, float] = {}
+
+    def estimate(self, plan: Dict[str, Any], planned: bool = False) -> float:
+        """Seconds to finish a job with ``plan``; ``planned`` skips the planning phase."""
+        per_file = self.file_seconds.get(plan.get("stack"), self.default_file_seconds)
+        files = plan.get("estimated_files") or 10
+        build = per_file * files * self.COMPLEXITY.get(plan.get("complexity"), 1.0)
+        return build if planned else build + self.plan_seconds
+
+    def observe(self, plan: Dict[str, Any], timings: Dict[str, float], files_created: int):
+        """Learn from a finished job's phase timings."""
+        if "plan" in timings:
+            self.plan_seconds += self.alpha * (timings["plan"] - self.plan_seconds)
+        if files_created and "render" in timings and "package" in timings:
+            stack = plan.get("stack")
+            per_file = (timings["render"] + timings["package"]) / files_created
+            current = self.file_seconds.get(stack, per_file)
+            self.file_seconds[stack] = current + self.alpha * (per_file - current)
+
+
+class JobQueue:
+    """Jobs waiting for a worker, cheapest first with aging.
+
+    A job's priority is ``cost - aging * seconds waited``, so a waiting job
+    overtakes one that is ``aging`` seconds cheaper for every second it
+    waits and nothing starves. Since every job ages at the same rate the
+    order only depends on ``cost + aging * enqueued_at``, which lets a heap
+    keep it. Aging alone still lets a large job be passed over for a long
+    time, so a job that has waited ``max_wait`` seconds or more goes ahead
+    of everything, oldest first. With ``policy="fifo"`` costs are ignored.
+
+    ``ahead_of`` is asked on every enqueue, dispatch and status poll, so it
+    is cached: the queue order is re-walked once after jobs leave it, and a
+    job pushed since then is assumed to wait behind all queued work (the
+    running total of queued cost).
+
+    Not thread-safe; the API server uses it from the event loop only.
+    """
+
+    def __init__(self, policy: str = "sjf", aging: float = 0.5, max_wait: Optional[float] = 300.0):
+        if policy not in ("sjf", "fifo"):
+            raise ValueError(f"Unknown job scheduling policy: {policy}")
+        self.policy = policy
+        self.aging = aging
+        self.max_wait = max_wait if policy == "sjf" else None
+        self._heap: List[Tuple[float, int, str]] = []
+        # The same jobs by arrival, to find ones waiting past max_wait
+        self._arrivals: List[Tuple[float, int, str]] = []
+        # Latest clock value seen by push or pop, for deciding what is overdue in _walk
+        self._clock = 0.0
+        # job_id -> (heap sequence, cost, enqueued_at, item)
+        self._entries: Dict[str, Tuple[int, float, float, Any]] = {}
+        self._counter = itertools.count()
+        # Cost of all queued jobs, and of the jobs ahead of each one as of the last walk
+        self._total_cost = 0.0
+        self._ahead: Dict[str, float] = {}
+        self._ahead_stale = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def push(self, job_id: str, cost: float, item: Any, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        key = now if self.policy == "fifo" else cost + self.aging * now
+        seq = next(self._counter)
+        if job_id in self._entries:
+            # Re-queued: its old heap entry is skipped when reached
+            self._left(self._entries.pop(job_id)[1])
+        heapq.heappush(self._heap, (key, seq, job_id))
+        if self.max_wait is not None:
+            heapq.heappush(self._arrivals, (now, seq, job_id))
+        self._entries[job_id] = (seq, cost, now, item)
+        self._clock = now
+        self._total_cost += cost
+        JOB_QUEUE_DEPTH.set(len(self._entries))
+
+    def pop(self, now: Optional[float] = None) -> Tuple[str, float, Any]:
+        """Remove the next job; returns ``(job_id, cost, item)``."""
+        now = time.monotonic() if now is None else now
+        self._clock = now
+        job_id = self._overdue(now)
+        while job_id is None:
+            _, seq, candidate = heapq.heappop(self._heap)
+            if self._live(seq, candidate):
+                job_id = candidate
+        _, cost, enqueued_at, item = self._entries.pop(job_id)
+        self._left(cost)
+        JOB_QUEUE_DEPTH.set(len(self._entries))
+        JOB_QUEUE_WAIT.observe(now - enqueued_at)
+        return job_id, cost, item
+
+    def _overdue(self, now: float) -> Optional[str]:
+        """The longest-waiting job if it has waited ``max_wait`` or more."""
+        arrivals = self._arrivals
+        while arrivals and not self._live(arrivals[0][1], arrivals[0][2]):
+            heapq.heappop(arrivals)
+        if arrivals and now - arrivals[0][0] >= self.max_wait:
+            return heapq.heappop(arrivals)[2]
+        return None
+
+    def remove(self, job_id: str) -> bool:
+        """Drop a queued job; its heap entry is skipped when reached."""
+        entry = self._entries.pop(job_id, None)
+        if entry is not None:
+            self._left(entry[1])
+        JOB_QUEUE_DEPTH.set(len(self._entries))
+        return entry is not None
+
+    def _left(self, cost: float):
+        self._total_cost = self._total_cost - cost if self._entries else 0.0
+        self._ahead_stale = True
+
+    def cost_of(self, job_id: str) -> Optional[float]:
+        entry = self._entries.get(job_id)
+        return entry[1] if entry else None
+
+    def ahead_of(self, job_id: str) -> Optional[float]:
+        """Estimated cost of the jobs that will run before ``job_id``, or None if not queued."""
+        entry = self._entries.get(job_id)
+        if entry is None:
+            return None
+        if self._ahead_stale:
+            self._walk()
+        ahead = self._ahead.get(job_id)
+        return ahead if ahead is not None else self._total_cost - entry[1]
+
+    def _walk(self):
+        """Recompute the cost ahead of every queued job in one pass over the queue order."""
+        # Drop heap entries of popped and removed jobs while at it
+        self._heap = [entry for entry in self._heap if self._live(entry[1], entry[2])]
+        self._heap.sort()
+        order = [job_id for _, _, job_id in self._heap]
+        if self.max_wait is not None:
+            self._arrivals = [entry for entry in self._arrivals if self._live(entry[1], entry[2])]
+            self._arrivals.sort()
+            # Jobs already overdue run first, oldest first
+            cutoff = self._clock - self.max_wait
+            overdue = [job_id for enqueued_at, _, job_id in self._arrivals if enqueued_at <= cutoff]
+            if overdue:
+                skip = set(overdue)
+                order = overdue + [job_id for job_id in order if job_id not in skip]
+        self._ahead = {}
+        ahead = 0.0
+        for job_id in order:
+            self._ahead[job_id] = ahead
+            ahead += self._entries[job_id][1]
+        self._ahead_stale = False
+
+    def _live(self, seq: int, job_id: str) -> bool:
+        entry = self._entries.get(job_id)
+        return entry is not None and entry[0] == seq
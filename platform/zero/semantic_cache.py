@@ -0,0 +1,295 @@
+"""
+Semantic near-duplicate cache for planner output.
+
+Prompts are embedded either with a local hashed-feature vectorizer (concept,
+word and character trigram features, no model needed) or with an Ollama embedding
+model. Vectors live in one in-process NumPy matrix; a lookup is a single
+matrix-vector product followed by a top-k selection, and a cached plan is
+returned when the best cosine similarity clears the threshold.
+
+A hit also needs the same stack, technology and feature concepts (see
+``concepts``) as the cached prompt, whatever the similarity: "chat app with
+login" must not be served the plan for "chat app with login in rust".
+
+A sampled fraction of hits is audited: the planner also runs the real LLM
+plan in the background and the cache records whether the two agree on stack
+and features. Audited prompts are sanitized before they are kept.
+
+With ``scope="tenant"`` (the default) plans are only reused within the tenant
+that caused them to be planned; ``scope="global"`` shares them across tenants.
+"""
+import json
+import re
+import subprocess
+import threading
+import zlib
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from recording import sanitize
+
+CACHE_REQUESTS = metrics.Counter(
+    "zero_plan_cache_requests_total", "Semantic plan cache lookups", ["result"]
+)
+CACHE_SIMILARITY = metrics.Histogram(
+    "zero_plan_cache_similarity", "Best cosine similarity per lookup",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0)
+)
+CACHE_AUDITS = metrics.Counter(
+    "zero_plan_cache_audits_total", "Audited cache hits by outcome", ["result"]
+)
+
+STOPWORDS = frozenset(
+    "a an and app application basic build create for i in is it make me my need "
+    "of on online platform please simple site some that the to tool want web "
+    "website where which with".split()
+)
+
+# Words that map to the same planner feature, stack or technology, so "login" and "auth" match
+CONCEPTS = {
+    "auth": "auth", "authentication": "auth", "login": "auth", "signin": "auth",
+    "signup": "auth", "oauth": "auth", "accounts": "auth",
+    "payment": "payments", "payments": "payments", "stripe": "payments",
+    "checkout": "payments", "billing": "payments", "subscriptions": "payments",
+    "realtime": "realtime", "live": "realtime", "websocket": "realtime",
+    "websockets": "realtime", "chat": "realtime",
+    "database": "database", "db": "database", "sql": "database",
+    "api": "api", "rest": "api", "backend": "api", "graphql": "api",
+    "blog": "blog", "blogging": "blog", "blogs": "blog",
+    "shop": "shop", "store": "shop", "ecommerce": "shop",
+    "dashboard": "dashboard", "admin": "dashboard", "analytics": "dashboard",
+    # Stacks: a prompt naming one must get a plan for it
+    "go": "stack:go", "golang": "stack:go", "gin": "stack:go",
+    "rust": "stack:rust", "actix": "stack:rust", "axum": "stack:rust",
+    "python": "stack:python", "django": "stack:python", "flask": "stack:python", "fastapi": "stack:python",
+    "nextjs": "stack:nextjs", "react": "stack:nextjs", "node": "stack:nextjs", "nodejs": "stack:nextjs",
+    "typescript": "stack:nextjs", "javascript": "stack:nextjs",
+    # Databases and infrastructure
+    "postgres": "tech:postgres", "postgresql": "tech:postgres", "mysql": "tech:mysql",
+    "sqlite": "tech:sqlite", "mongodb": "tech:mongodb", "mongo": "tech:mongodb", "redis": "tech:redis",
+    "docker": "tech:docker", "kubernetes": "tech:kubernetes", "k8s": "tech:kubernetes",
+}
+# Spellings folded before tokenizing
+_ALIASES = {"real-time": "realtime", "e-commerce": "ecommerce", "next.js": "nextjs", "node.js": "nodejs"}
+
+
+def _words(text: str) -> List[str]:
+    text = text.lower()
+    for alias, word in _ALIASES.items():
+        text = text.replace(alias, word)
+    return [w for w in re.findall(r"[a-z0-9]+", text) if w not in STOPWORDS]
+
+
+def concepts(text: str) -> frozenset:
+    """The feature, stack and technology concepts a prompt mentions."""
+    return frozenset(CONCEPTS[w] for w in _words(text) if w in CONCEPTS)
+
+
+class HashingVectorizer:
+    """Signed feature hashing of concepts, words and character trigrams, L2-normalized."""
+
+    # Concepts dominate, then whole words, then character trigrams
+    WEIGHTS = {"k": 4.0, "w": 2.0, "c": 0.5}
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _words(text)
+        features = [f"k:{CONCEPTS[w]}" for w in words if w in CONCEPTS]
+        features.extend(f"w:{w}" for w in words if w not in CONCEPTS)
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in set(self._features(text)):
+            h = zlib.crc32(feature.encode())
+            weight = self.WEIGHTS[feature[0]]
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        return _normalize(vector)
+
+
+class OllamaEmbedder:
+    """Embeddings from a local Ollama embedding model."""
+
+    def __init__(self, ollama_base_url: str, model: str = "nomic-embed-text"):
+        self.ollama_base_url = ollama_base_url
+        self.model = model
+
+    def embed(self, text: str) -> np.ndarray:
+        cmd = [
+            "curl", "-s", "--max-time", "10", f"{self.ollama_base_url}/api/embeddings",
+            "-d", json.dumps({"model": self.model, "prompt": text})
+        ]
+        result = subprocess.check_output(cmd, text=True)
+        return _normalize(np.asarray(json.loads(result)["embedding"], dtype=np.float32))
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticPlanCache:
+    """Cosine top-k cache of plans keyed by prompt embeddings.
+
+    Entries are partitioned by ``namespace`` (model and prompt version, and
+    the tenant unless ``scope`` is ``global``) so a plan is never served
+    across models or prompt templates. When full, the oldest entry is
+    overwritten.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        threshold: float = 0.9,
+        capacity: int = 10000,
+        top_k: int = 5,
+        audit_rate: float = 0.05,
+        scope: str = "tenant"
+    ):
+        if scope not in ("tenant", "global"):
+            raise ValueError(f"Unknown semantic cache scope: {scope}")
+        self.embedder = embedder
+        self.threshold = threshold
+        self.capacity = capacity
+        self.top_k = top_k
+        self.audit_rate = audit_rate
+        self.scope = scope
+        self._matrix: Optional[np.ndarray] = None
+        # (prompt, namespace, plan, concepts of the prompt)
+        self._entries: List[Tuple[str, str, Dict[str, Any], frozenset]] = []
+        self._namespaces = np.zeros(capacity, dtype=np.int64)
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.audits = deque(maxlen=100)
+        self.audit_agreements = 0
+        self.audit_disagreements = 0
+
+    def lookup(self, prompt: str, namespace: str) -> Optional[Tuple[Dict[str, Any], float, str]]:
+        """Return ``(plan, similarity, cached_prompt)`` for the closest match, if close enough."""
+        vector = self.embedder.embed(prompt)
+        wanted = concepts(prompt)
+        with self._lock:
+            count = len(self._entries)
+            if count == 0:
+                self._record(False, 0.0)
+                return None
+            similarities = self._matrix[:count] @ vector
+            similarities[self._namespaces[:count] != _namespace_id(namespace)] = -1.0
+            k = min(self.top_k, count)
+            candidates = np.argpartition(-similarities, k - 1)[:k]
+            candidates = candidates[np.argsort(-similarities[candidates])]
+            best_similarity = float(similarities[candidates[0]])
+            for index in candidates:
+                similarity = float(similarities[index])
+                if similarity < self.threshold:
+                    break
+                cached_prompt, _, plan, cached_concepts = self._entries[index]
+                # Close wording is not enough if a stack, technology or feature differs
+                if cached_concepts == wanted:
+                    self._record(True, similarity)
+                    return plan, similarity, cached_prompt
+            self._record(False, best_similarity)
+            return None
+
+    def store(self, prompt: str, plan: Dict[str, Any], namespace: str):
+        vector = self.embedder.embed(prompt)
+        with self._lock:
+            slot = self._next % self.capacity
+            if self._matrix is None:
+                self._matrix = np.zeros((min(256, self.capacity), vector.shape[0]), dtype=np.float32)
+            elif slot >= self._matrix.shape[0]:
+                # Grow geometrically up to capacity instead of preallocating it all
+                rows = min(self.capacity, self._matrix.shape[0] * 2)
+                grown = np.zeros((rows, self._matrix.shape[1]), dtype=np.float32)
+                grown[:self._matrix.shape[0]] = self._matrix
+                self._matrix = grown
+            self._matrix[slot] = vector
+            self._namespaces[slot] = _namespace_id(namespace)
+            entry = (prompt, namespace, plan, concepts(prompt))
+            if slot < len(self._entries):
+                self._entries[slot] = entry
+            else:
+                self._entries.append(entry)
+            self._next += 1
+
+    def _record(self, hit: bool, similarity: float):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_REQUESTS.inc(result="hit" if hit else "miss")
+        CACHE_SIMILARITY.observe(max(similarity, 0.0))
+
+    def record_audit(
+        self,
+        prompt: str,
+        cached_prompt: str,
+        similarity: float,
+        cached_plan: Dict[str, Any],
+        fresh_plan: Dict[str, Any]
+    ):
+        """Compare a served cached plan with a freshly generated one."""
+        agrees = (
+            cached_plan.get("stack") == fresh_plan.get("stack")
+            and set(cached_plan.get("features", [])) == set(fresh_plan.get("features", []))
+        )
+        if agrees:
+            self.audit_agreements += 1
+        else:
+            self.audit_disagreements += 1
+        CACHE_AUDITS.inc(result="agree" if agrees else "disagree")
+        self.audits.append({
+            "prompt": sanitize(prompt),
+            "cached_prompt": sanitize(cached_prompt),
+            "similarity": round(similarity, 4),
+            "agrees": agrees,
+            "cached": {"stack": cached_plan.get("stack"), "features": cached_plan.get("features")},
+            "fresh": {"stack": fresh_plan.get("stack"), "features": fresh_plan.get("features")}
+        })
+
+    def stats(self, include_audits: bool = False) -> Dict[str, Any]:
+        """Counters; ``include_audits`` adds recent audited prompts, which may come from any tenant."""
+        lookups = self.hits + self.misses
+        audited = self.audit_agreements + self.audit_disagreements
+        return {
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "audited": audited,
+            "false_hit_rate": self.audit_disagreements / audited if audited else 0.0,
+            **({"recent_audits": list(self.audits)} if include_audits else {})
+        }
+
+
+def _namespace_id(namespace: str) -> int:
+    return zlib.crc32(namespace.encode())
+
+
+def create_plan_cache(mode: str, ollama_base_url: str, options: Dict[str, Any]) -> SemanticPlanCache:
+    """Create the plan cache for ``mode``: ``hashing`` or ``ollama`` embeddings."""
+    if mode == "hashing":
+        embedder = HashingVectorizer()
+    elif mode == "ollama":
+        embedder = OllamaEmbedder(ollama_base_url, options.get("embed_model", "nomic-embed-text"))
+    else:
+        raise ValueError(f"Unknown semantic cache mode: {mode}")
+    return SemanticPlanCache(
+        embedder,
+        threshold=options.get("semantic_threshold", 0.9),
+        capacity=options.get("semantic_cache_size", 10000),
+        audit_rate=options.get("semantic_audit_rate", 0.05),
+        scope=options.get("semantic_cache_scope", "tenant")
+    )
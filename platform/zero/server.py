@@ -2,23 +2,35 @@
 Ultra DevBox Zero-Code Builder API
 FastAPI server for generating complete projects from natural language prompts.
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+import asyncio
+import functools
+import hashlib
+import math
+import mimetypes
 import os
 import json
 import subprocess
-import tempfile
-import zipfile
-import shutil
 import uuid
-from typing import Dict, List, Optional
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 import logging
 from datetime import datetime
 
-from chains.planner import ProjectPlanner
-from chains.codegen import CodeGenerator
+from archives import ArchiveIndexCache
+from job_events import JobEventHub, Subscriber, WS_MESSAGES, status_view, usage_view
+from jobs import create_job_store
+from recording import TrafficRecorder
+from scheduling import JobCostModel, JobQueue, RateLimiter, parse_weights
+import metrics
+import pipeline
+import startup
+import tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -39,15 +51,123 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Deployment configuration
+WORKERS = int(os.getenv("WORKERS", 1))
+JOB_STORE_URL = os.getenv("ZERO_JOB_STORE", "memory")
+# Memory job store: keep finished jobs compressed until they are read
+JOB_COMPACT = os.getenv("ZERO_JOB_COMPACT", "false").lower() == "true"
+JOB_EXECUTOR = os.getenv("ZERO_JOB_EXECUTOR", "thread")
+JOB_WORKERS = int(os.getenv("ZERO_JOB_WORKERS", os.cpu_count() or 1))
+ARTIFACT_DIR = os.getenv("ZERO_ARTIFACT_DIR", "/tmp")
+DRAIN_TIMEOUT = float(os.getenv("ZERO_DRAIN_TIMEOUT", 300))
+LEASE_TTL = float(os.getenv("ZERO_JOB_LEASE", 60))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+SPECULATIVE_CODEGEN = os.getenv("ZERO_SPECULATIVE_CODEGEN", "false").lower() == "true"
+
+# Multi-tenant limits: requests/sec per tenant on /generate and concurrent LLM calls per process
+RATE_LIMIT = float(os.getenv("ZERO_RATE_LIMIT", 0))
+RATE_BURST = float(os.getenv("ZERO_RATE_BURST", 5))
+# 0: follow the LLM backends' parallel slots or adaptive limits
+LLM_CONCURRENCY = int(os.getenv("ZERO_LLM_CONCURRENCY", 0))
+TENANT_WEIGHTS = parse_weights(os.getenv("ZERO_TENANT_WEIGHTS", ""))
+# Single-flight: identical requests within the window (or with the same Idempotency-Key) share a job
+DEDUP_WINDOW = float(os.getenv("ZERO_DEDUP_WINDOW", 10))
+IDEMPOTENCY_TTL = float(os.getenv("ZERO_IDEMPOTENCY_TTL", 86400))
+# Semantic plan cache: off, hashing (local vectorizer) or ollama (embedding model)
+SEMANTIC_CACHE = os.getenv("ZERO_SEMANTIC_CACHE", "off")
+# Traffic recording for bench/replay.py: sanitized /generate requests and job outcomes as JSONL
+RECORD_FILE = os.getenv("ZERO_RECORD_FILE", "")
+RECORD_SAMPLE = float(os.getenv("ZERO_RECORD_SAMPLE", 1.0))
+
+# Passed to generation workers, which build their own pipeline
+PIPELINE_OPTIONS = {
+    "artifact_dir": ARTIFACT_DIR,
+    "speculative_codegen": SPECULATIVE_CODEGEN,
+    "llm_concurrency": LLM_CONCURRENCY,
+    "tenant_weights": TENANT_WEIGHTS,
+    "semantic_cache": SEMANTIC_CACHE,
+    "semantic_threshold": float(os.getenv("ZERO_SEMANTIC_THRESHOLD", 0.9)),
+    "semantic_cache_size": int(os.getenv("ZERO_SEMANTIC_CACHE_SIZE", 10000)),
+    "semantic_cache_scope": os.getenv("ZERO_SEMANTIC_CACHE_SCOPE", "tenant"),
+    "semantic_audit_rate": float(os.getenv("ZERO_SEMANTIC_AUDIT_RATE", 0.05)),
+    "embed_model": os.getenv("ZERO_EMBED_MODEL", "nomic-embed-text"),
+    "prompts_file": os.getenv("ZERO_PROMPTS_FILE"),
+    "ollama_base_urls": [url for url in os.getenv("OLLAMA_BASE_URLS", "").split(",") if url],
+    "llm_hedging": os.getenv("ZERO_LLM_HEDGING", "false").lower() == "true",
+    "llm_timeout": float(os.getenv("ZERO_LLM_TIMEOUT", 300)),
+    "llm_min_timeout": float(os.getenv("ZERO_LLM_MIN_TIMEOUT", 30)),
+    "llm_breaker_failures": int(os.getenv("ZERO_LLM_BREAKER_FAILURES", 5)),
+    "llm_breaker_reset": float(os.getenv("ZERO_LLM_BREAKER_RESET", 30)),
+    "llm_parallel": [int(n) for n in os.getenv("ZERO_LLM_PARALLEL", "4").split(",")],
+    "llm_batch_window": float(os.getenv("ZERO_LLM_BATCH_WINDOW_MS", 0)) / 1000,
+    "planner_models": dict(
+        item.split("=", 1) for item in os.getenv("ZERO_PLANNER_MODELS", "").split(",") if "=" in item
+    ),
+    "planner_quality": os.getenv("ZERO_PLANNER_QUALITY", "auto"),
+    "llm_max_inflight": int(os.getenv("ZERO_LLM_MAX_INFLIGHT", 16)) or None,
+    "llm_queue_timeout": float(os.getenv("ZERO_LLM_QUEUE_TIMEOUT", 30)),
+    "compression_level": int(os.getenv("ZERO_COMPRESSION_LEVEL", 6)),
+    "compression_workers": int(os.getenv("ZERO_COMPRESSION_WORKERS", 0)) or None,
+    "startup_snapshot": os.getenv("ZERO_STARTUP_SNAPSHOT"),
+    "record_llm_calls": bool(RECORD_FILE)
+}
+
+# Warm-up at startup: preload the first planner model on every backend and start job worker processes.
+# /ready answers 503 until it finishes (or times out)
+WARMUP = os.getenv("ZERO_WARMUP", "true").lower() == "true"
+WARMUP_MODELS = [model for model in os.getenv("ZERO_WARMUP_MODELS", "").split(",") if model]
+WARMUP_TIMEOUT = float(os.getenv("ZERO_WARMUP_TIMEOUT", 120))
+
+# Order of jobs waiting for a generation worker: sjf (cheapest first, with aging) or fifo
+JOB_SCHEDULING = os.getenv("ZERO_JOB_SCHEDULING", "sjf")
+JOB_AGING = float(os.getenv("ZERO_JOB_AGING", 0.5))
+# sjf: jobs waiting this many seconds go first, oldest first (0 disables)
+JOB_MAX_WAIT = float(os.getenv("ZERO_JOB_MAX_WAIT", 300)) or None
+
+# Parsed central directories of recently previewed archives
+archive_indexes = ArchiveIndexCache(int(os.getenv("ZERO_ARCHIVE_INDEX_CACHE", 256)))
+
+WS_POLL_INTERVAL = float(os.getenv("ZERO_WS_POLL_INTERVAL", 0.25))
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("ZERO_WS_MAX_SUBSCRIPTIONS", 1000))
+
+ADMIN_TOKEN = os.getenv("ZERO_ADMIN_TOKEN", "")
+API_KEY_TENANTS = dict(
+    item.split("=", 1) for item in os.getenv("ZERO_API_KEYS", "").split(",") if "=" in item
+)
+
 # Global variables
 planner = None
 generator = None
-project_cache = {}
+project_cache = None
+job_pipeline = None
+job_executor = None
+running_jobs: Dict[str, asyncio.Future] = {}
+# Jobs waiting for a worker, and jobs on a worker: project_id -> (started_at, estimated cost)
+job_queue = JobQueue(JOB_SCHEDULING, JOB_AGING, JOB_MAX_WAIT)
+started_jobs: Dict[str, Tuple[float, float]] = {}
+job_costs = JobCostModel()
+lease_task = None
+draining = False
+warmup_task = None
+# Outcome of each warm-up task; None while warm-up is still running
+warmup_report: Optional[Dict[str, Dict]] = None
+# Pushes job status changes to /ws/jobs subscribers
+job_hub: Optional[JobEventHub] = None
+rate_limiter = RateLimiter(RATE_LIMIT, RATE_BURST, TENANT_WEIGHTS)
+traffic_recorder = TrafficRecorder(RECORD_FILE, RECORD_SAMPLE) if RECORD_FILE else None
+
+DEDUPLICATED = metrics.Counter(
+    "zero_generate_deduplicated_total", "Generate requests attached to an existing job"
+)
 
 class PromptRequest(BaseModel):
     prompt: str
     stack: Optional[str] = None
     features: Optional[List[str]] = None
+    # ZIP deflate level: 1 fastest .. 9 smallest, 0 stores files uncompressed
+    compression_level: Optional[int] = Field(None, ge=0, le=9)
+    # Planner model tier; auto drafts with a small model and escalates on bad output
+    quality: Optional[Literal["auto", "fast", "balanced", "best"]] = None
 
 class ProjectResponse(BaseModel):
     project_id: str
@@ -62,18 +182,137 @@ class ProjectStatus(BaseModel):
     progress: int
     message: str
     download_url: Optional[str] = None
+    degraded: bool = False
+    estimated_completion: Optional[datetime] = None
+    usage: Optional[Dict] = None
 
 # Initialize services
 def init_services():
-    global planner, generator
+    global planner, generator, project_cache, job_pipeline, job_executor
+    started = time.perf_counter()
     ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    planner = ProjectPlanner(ollama_base_url)
-    generator = CodeGenerator(ollama_base_url)
-    logger.info(f"Services initialized with Ollama at {ollama_base_url}")
+    
+    project_cache = create_job_store(JOB_STORE_URL, JOB_COMPACT)
+    if not project_cache.shared and (WORKERS > 1 or JOB_EXECUTOR == "process"):
+        raise RuntimeError(
+            "Multiple workers need a shared job store, e.g. ZERO_JOB_STORE=sqlite:////var/lib/zero/jobs.db"
+        )
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    
+    job_pipeline = pipeline.build_pipeline(project_cache, ollama_base_url, PIPELINE_OPTIONS)
+    planner = job_pipeline.planner
+    generator = job_pipeline.generator
+    
+    if JOB_EXECUTOR == "process":
+        # Imported lazily: only the process executor needs multiprocessing
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # Spawn rather than fork: the API process already runs an event loop and threads
+        job_executor = ProcessPoolExecutor(
+            max_workers=JOB_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=pipeline.init_worker,
+            initargs=(JOB_STORE_URL, ollama_base_url, PIPELINE_OPTIONS)
+        )
+    else:
+        job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="generation")
+    
+    startup.STARTUP_SECONDS.set(round(time.perf_counter() - started, 4), phase="init")
+    logger.info(
+        f"Services initialized with Ollama at {ollama_base_url}, "
+        f"job store {JOB_STORE_URL}, {JOB_WORKERS} {JOB_EXECUTOR} job workers"
+    )
 
 @app.on_event("startup")
 async def startup_event():
+    global lease_task, job_hub, warmup_task, warmup_report
     init_services()
+    job_hub = JobEventHub(project_cache, interval=WS_POLL_INTERVAL)
+    job_hub.start()
+    if project_cache.shared:
+        # Renew our job leases and pick up jobs interrupted on other workers or pods
+        lease_task = asyncio.create_task(maintain_job_leases())
+    if WARMUP:
+        # In the background so /health answers right away; /ready waits for it
+        warmup_task = asyncio.create_task(warm_up_services())
+    else:
+        warmup_report = {}
+
+async def warm_up_services():
+    """Preload models and start job workers concurrently, then mark this worker ready."""
+    global warmup_report
+    started = time.perf_counter()
+    try:
+        # Only the first tier by default: preloading every tier on every backend evicts
+        # hot models on shared Ollama hosts during scale-out
+        models = WARMUP_MODELS or planner.models_for()[:1]
+    except ValueError as e:
+        # A bad ZERO_PLANNER_QUALITY fails requests, not readiness
+        logger.error(f"Cannot pick models to preload: {e}")
+        models = []
+    if PIPELINE_OPTIONS["semantic_cache"] == "ollama":
+        models = models + [PIPELINE_OPTIONS["embed_model"]]
+    tasks = startup.preload_tasks(planner.client, models)
+    if JOB_EXECUTOR == "process":
+        tasks["job workers"] = start_job_workers
+    report = await asyncio.to_thread(startup.warm_up, tasks, WARMUP_TIMEOUT)
+    elapsed = time.perf_counter() - started
+    startup.STARTUP_SECONDS.set(round(elapsed, 4), phase="warmup")
+    failed = [name for name, task in report.items() if task["outcome"] != "ok"]
+    if failed:
+        logger.warning(f"Warm-up finished in {elapsed:.1f}s; not warmed: {', '.join(failed)}")
+    else:
+        logger.info(f"Warm-up finished in {elapsed:.1f}s ({len(report)} tasks)")
+    warmup_report = report
+
+def start_job_workers():
+    """Spawn every job worker process now instead of on the first jobs."""
+    # Each submit spawns another process while none of the earlier ones is idle yet
+    futures = [job_executor.submit(pipeline.worker_ready) for _ in range(JOB_WORKERS)]
+    return [future.result() for future in futures]
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drain in-flight generations before the worker exits (SIGTERM)."""
+    global draining
+    draining = True
+    if running_jobs:
+        logger.info(f"Draining {len(running_jobs)} in-flight generation(s)")
+        done, pending = await asyncio.wait(list(running_jobs.values()), timeout=DRAIN_TIMEOUT)
+        if pending:
+            # Their leases lapse once we exit, so another worker resumes them from the last checkpoint
+            logger.warning(f"Drain timeout reached with {len(pending)} generation(s) still running")
+    if lease_task:
+        lease_task.cancel()
+    job_hub.stop()
+    job_executor.shutdown(wait=False, cancel_futures=True)
+
+async def maintain_job_leases():
+    """Keep leases on our running jobs fresh and resume orphaned jobs."""
+    while True:
+        try:
+            await asyncio.to_thread(
+                project_cache.renew_leases, list(running_jobs), WORKER_ID, LEASE_TTL
+            )
+            if not draining:
+                for project_id in await asyncio.to_thread(claim_orphaned_jobs):
+                    submit_resume(project_id)
+        except Exception as e:
+            logger.error(f"Job lease maintenance failed: {e}")
+        await asyncio.sleep(LEASE_TTL / 3)
+
+def claim_orphaned_jobs() -> List[str]:
+    """Lease unfinished jobs whose owner stopped renewing them."""
+    claimed = []
+    for project_id, job in project_cache.incomplete_jobs():
+        if project_id in running_jobs:
+            continue
+        if job.get("lease_expires", 0) > time.time():
+            continue
+        if project_cache.acquire_lease(project_id, WORKER_ID, LEASE_TTL):
+            logger.info(f"Recovering project {project_id} (phase: {job.get('phase') or 'none'})")
+            claimed.append(project_id)
+    return claimed
 
 @app.get("/")
 async def root():
@@ -84,8 +323,13 @@ async def root():
         "endpoints": {
             "generate": "/generate",
             "status": "/status/{project_id}",
+            "status_stream": "/ws/jobs",
             "download": "/download/{project_id}",
-            "health": "/health"
+            "files": "/projects/{project_id}/files",
+            "usage": "/usage",
+            "health": "/health",
+            "ready": "/ready",
+            "metrics": "/metrics"
         }
     }
 
@@ -111,7 +355,10 @@ async def health_check():
                 "ollama": ollama_status,
                 "planner": "available" if planner else "unavailable",
                 "generator": "available" if generator else "unavailable"
-            }
+            },
+            "prompt_version": planner.prompts.current().version if planner else None,
+            "llm_available": planner.client.available() if planner else False,
+            "llm_backends": planner.client.stats() if planner else []
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -124,29 +371,109 @@ async def health_check():
             }
         )
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: ready once warm-up has finished and until shutdown starts."""
+    if draining or warmup_report is None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "draining" if draining else "warming up"}
+        )
+    return {"status": "ready", "warmup": warmup_report}
+
+def resolve_tenant(http_request: Union[Request, WebSocket]) -> str:
+    """Identify the tenant from a configured API key; everyone else is "anonymous".
+    
+    Client-chosen values (unknown keys, tenant headers) would let a client
+    mint fresh rate-limit buckets and fair-share weights at will, so they
+    all share the anonymous tenant.
+    """
+    api_key = http_request.headers.get("X-API-Key")
+    if api_key is None and isinstance(http_request, WebSocket):
+        # Browsers cannot set headers on WebSocket connections
+        api_key = http_request.query_params.get("api_key")
+    return API_KEY_TENANTS.get(api_key, "anonymous") if api_key else "anonymous"
+
 @app.post("/generate", response_model=ProjectResponse)
-async def generate_project(request: PromptRequest, background_tasks: BackgroundTasks):
+async def generate_project(request: PromptRequest, http_request: Request):
     """Generate a complete project from a natural language prompt."""
+    if draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down")
+    
+    tenant = resolve_tenant(http_request)
+    idempotency_key = http_request.headers.get("Idempotency-Key")
+    # Generate unique project ID
+    project_id = str(uuid.uuid4())
+    
+    # Admit the request before creating anything for it
+    retry_after = rate_limiter.check(tenant)
+    if retry_after:
+        if traffic_recorder:
+            traffic_recorder.record_request(project_id, tenant, request.model_dump(), "rate_limited", idempotency_key)
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+    
     try:
-        # Generate unique project ID
-        project_id = str(uuid.uuid4())
-        
         # Initialize project status
-        project_cache[project_id] = {
+        project_cache.create(project_id, {
             "status": "planning",
             "progress": 10,
             "message": "Analyzing requirements...",
+            "tenant": tenant,
+            "request": {
+                "prompt": request.prompt,
+                "stack": request.stack,
+                "features": request.features,
+                "tenant": tenant,
+                "compression_level": request.compression_level,
+                "quality": request.quality
+            },
+            "lease_owner": WORKER_ID,
+            "lease_expires": time.time() + LEASE_TTL,
             "created_at": datetime.now()
-        }
+        })
+    except Exception as e:
+        logger.error(f"Failed to start project generation: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    try:
+        # Attach duplicates (retries, double clicks) to the job that is already running
+        try:
+            existing = claim_request(project_id, tenant, request, idempotency_key)
+        except HTTPException:
+            project_cache.delete(project_id)
+            raise
+        if existing:
+            project_cache.delete(project_id)
+            # Attaching starts no generation, so it doesn't count against the rate limit
+            rate_limiter.refund(tenant)
+            DEDUPLICATED.inc()
+            existing_id, existing_job = existing
+            if traffic_recorder:
+                traffic_recorder.record_request(existing_id, tenant, request.model_dump(), "attached", idempotency_key)
+            return ProjectResponse(
+                project_id=existing_id,
+                status=existing_job["status"],
+                message="Attached to existing project generation",
+                download_url=existing_job.get("download_url"),
+                preview={"project_id": existing_id}
+            )
         
         # Start generation in background
-        background_tasks.add_task(
-            generate_project_background,
+        submit_generation(
             project_id,
             request.prompt,
             request.stack,
-            request.features
+            request.features,
+            tenant,
+            request.compression_level,
+            request.quality
         )
+        if traffic_recorder:
+            traffic_recorder.record_request(project_id, tenant, request.model_dump(), "started", idempotency_key)
         
         return ProjectResponse(
             project_id=project_id,
@@ -155,130 +482,312 @@ async def generate_project(request: PromptRequest, background_tasks: BackgroundT
             preview={"project_id": project_id}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to start project generation: {e}")
+        abandon_job(project_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
-async def generate_project_background(
+def abandon_job(project_id: str, error: Exception):
+    """Fail a job that couldn't be started and release its lease, so no worker resumes it."""
+    if job_queue.remove(project_id):
+        running_jobs[project_id].cancel()
+    try:
+        project_cache.update(project_id, {
+            "status": "failed",
+            "progress": 0,
+            "message": f"Generation failed: {error}",
+            "error": str(error),
+            "failed_at": datetime.now(),
+            "lease_owner": None,
+            "lease_expires": 0
+        })
+    except Exception as e:
+        logger.error(f"Failed to mark project {project_id} as failed: {e}")
+
+def claim_request(
+    project_id: str,
+    tenant: str,
+    request: PromptRequest,
+    idempotency_key: Optional[str]
+) -> Optional[tuple]:
+    """Claim the request's dedup key for ``project_id``.
+    
+    Returns ``(project_id, job)`` of an existing live job holding the key, or
+    None if this request should start a new generation.
+    """
+    fingerprint = request_fingerprint(request.prompt, request.stack, request.features, request.quality)
+    if idempotency_key:
+        key = f"idempotency:{tenant}:{idempotency_key}"
+        ttl = IDEMPOTENCY_TTL
+    elif DEDUP_WINDOW > 0:
+        key = f"request:{tenant}:{fingerprint}"
+        ttl = DEDUP_WINDOW
+    else:
+        return None
+    
+    owner = project_cache.claim_key(key, project_id, ttl)
+    if owner == project_id:
+        return None
+    
+    job = project_cache.get(owner)
+    if job is None or job["status"] == "failed":
+        # Don't attach to a deleted or failed job; let the retry start over
+        project_cache.claim_key(key, project_id, ttl, replace=True)
+        return None
+    original = job.get("request") or {}
+    if fingerprint != request_fingerprint(
+        original.get("prompt"), original.get("stack"), original.get("features"), original.get("quality")
+    ):
+        # The job holding the key stores the request it was started with
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request"
+        )
+    return owner, job
+
+def request_fingerprint(
+    prompt: Optional[str],
+    stack: Optional[str],
+    features: Optional[List[str]],
+    quality: Optional[str]
+) -> str:
+    """Hash of the request fields that decide what gets generated."""
+    fingerprint = json.dumps([prompt, stack, sorted(features or []), quality])
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+def submit_generation(
     project_id: str,
     prompt: str,
     preferred_stack: Optional[str] = None,
-    preferred_features: Optional[List[str]] = None
+    preferred_features: Optional[List[str]] = None,
+    tenant: str = "anonymous",
+    compression_level: Optional[int] = None,
+    quality: Optional[str] = None
 ):
-    """Background task for project generation."""
-    try:
-        # Update status: Planning
-        project_cache[project_id].update({
-            "status": "planning",
-            "progress": 20,
-            "message": "Creating project specification..."
-        })
-        
-        # Step 1: Plan the project
-        logger.info(f"Planning project {project_id}")
-        plan = planner.analyze_requirements(prompt)
-        
-        # Apply user preferences if provided
-        if preferred_stack:
-            plan["stack"] = preferred_stack
-        if preferred_features:
-            plan["features"] = preferred_features
-        
-        # Update status: Generating
-        project_cache[project_id].update({
-            "status": "generating",
-            "progress": 50,
-            "message": f"Generating {plan['stack']} project...",
-            "plan": plan
-        })
-        
-        # Step 2: Generate code
-        logger.info(f"Generating code for project {project_id}")
-        temp_dir = tempfile.mkdtemp(prefix=f"ultrabox_{project_id}_")
-        
-        try:
-            created_files = generator.generate_project(plan, temp_dir)
-            
-            # Update status: Packaging
-            project_cache[project_id].update({
-                "status": "packaging",
-                "progress": 80,
-                "message": "Creating project package...",
-                "files_created": len(created_files)
-            })
-            
-            # Step 3: Create zip file
-            zip_filename = f"{plan['project_name']}_{project_id}.zip"
-            zip_path = os.path.join("/tmp", zip_filename)
-            
-            shutil.make_archive(
-                zip_path.replace(".zip", ""),
-                "zip",
-                temp_dir
-            )
-            
-            # Update status: Complete
-            project_cache[project_id].update({
-                "status": "completed",
-                "progress": 100,
-                "message": "Project generated successfully!",
-                "download_url": f"/download/{zip_filename}",
-                "zip_path": zip_path,
-                "plan": plan,
-                "files_created": len(created_files),
-                "completed_at": datetime.now()
-            })
-            
-            logger.info(f"Project {project_id} generated successfully")
-            
-        finally:
-            # Clean up temp directory
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            
-    except Exception as e:
-        logger.error(f"Failed to generate project {project_id}: {e}")
-        project_cache[project_id].update({
+    """Queue a generation for the job executor and track it for draining."""
+    args = (project_id, prompt, preferred_stack, preferred_features, tenant, compression_level, quality)
+    if JOB_EXECUTOR == "process":
+        call = (pipeline.run_job, *args)
+    else:
+        call = (job_pipeline.run, *args)
+    # The real plan doesn't exist yet; estimate the cost from the prompt
+    plan = planner.estimate_plan(prompt)
+    if preferred_stack:
+        plan["stack"] = preferred_stack
+    return enqueue_job(project_id, call, job_costs.estimate(plan))
+
+def submit_resume(project_id: str):
+    """Queue an interrupted generation to be resumed on the job executor."""
+    if JOB_EXECUTOR == "process":
+        call = (pipeline.resume_job, project_id)
+    else:
+        call = (job_pipeline.resume, project_id)
+    job = project_cache.get(project_id) or {}
+    if job.get("plan"):
+        cost = job_costs.estimate(job["plan"], planned=True)
+    else:
+        cost = job_costs.estimate(planner.estimate_plan((job.get("request") or {}).get("prompt", "")))
+    return enqueue_job(project_id, call, cost)
+
+def enqueue_job(project_id: str, call: tuple, cost: float) -> asyncio.Future:
+    """Queue a job for the next free worker; the future resolves when it finishes."""
+    job = asyncio.get_running_loop().create_future()
+    running_jobs[project_id] = job
+    job.add_done_callback(lambda _: running_jobs.pop(project_id, None))
+    
+    job_queue.push(project_id, cost, (call, job))
+    project_cache.update(project_id, {
+        "estimated_cost": round(cost, 3),
+        "estimated_completion": estimated_completion(project_id)
+    })
+    dispatch_jobs()
+    return job
+
+def dispatch_jobs():
+    """Start queued jobs, cheapest first, while generation workers are free."""
+    while job_queue and len(started_jobs) < JOB_WORKERS:
+        project_id, cost, (call, job) = job_queue.pop()
+        if job.done():
+            continue
+        started_jobs[project_id] = (time.time(), cost)
+        project_cache.update(project_id, {"estimated_completion": estimated_completion(project_id)})
+        future = asyncio.wrap_future(job_executor.submit(*call))
+        future.add_done_callback(functools.partial(job_finished, project_id, job))
+
+def job_finished(project_id: str, job: asyncio.Future, future: asyncio.Future):
+    """Record a finished job, learn its cost and start the next queued one."""
+    started_jobs.pop(project_id, None)
+    if not future.cancelled() and future.exception():
+        # The pipeline records its own failures; this only happens if the worker died
+        logger.error(f"Generation worker failed for project {project_id}: {future.exception()}")
+        project_cache.update(project_id, {
             "status": "failed",
             "progress": 0,
-            "message": f"Generation failed: {str(e)}",
-            "error": str(e),
+            "message": f"Generation failed: {future.exception()}",
+            "error": str(future.exception()),
             "failed_at": datetime.now()
         })
+    record = project_cache.get(project_id)
+    if record and record["status"] == "completed" and record.get("timings"):
+        job_costs.observe(record["plan"], record["timings"], record.get("files_created", 0))
+    if record and traffic_recorder and record["status"] in ("completed", "failed"):
+        traffic_recorder.record_result(project_id, record)
+    if not job.done():
+        job.set_result(None)
+    dispatch_jobs()
+
+def estimated_completion(project_id: str) -> Optional[datetime]:
+    """Completion estimate for a job queued or running on this worker."""
+    now = time.time()
+    if project_id in started_jobs:
+        started_at, cost = started_jobs[project_id]
+        return datetime.fromtimestamp(max(now, started_at + cost))
+    ahead = job_queue.ahead_of(project_id)
+    if ahead is None:
+        return None
+    # Work ahead of this job is shared by all workers
+    running = sum(max(0.0, started_at + cost - now) for started_at, cost in started_jobs.values())
+    wait = (ahead + running) / JOB_WORKERS
+    return datetime.fromtimestamp(now + wait + job_queue.cost_of(project_id))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this worker process."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/plans")
+async def get_plan_cache_stats(http_request: Request):
+    """Semantic plan cache hit rate for this worker; recent false-hit audits need the admin token."""
+    if not planner or not planner.plan_cache:
+        return {"enabled": False}
+    # Audits hold (sanitized) prompts of any tenant
+    admin = bool(ADMIN_TOKEN) and http_request.headers.get("X-Admin-Token") == ADMIN_TOKEN
+    return {"enabled": True, **planner.plan_cache.stats(include_audits=admin)}
+
+@app.post("/admin/profile")
+async def capture_profile(http_request: Request, mode: str = "sample", seconds: float = 10):
+    """Profile this worker for ``seconds`` (modes: sample, cprofile, py-spy)."""
+    if not ADMIN_TOKEN or http_request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+    
+    try:
+        # Imported lazily: profiling is rarely used and pulls in cProfile and pstats
+        import profiling
+        content, media_type = await profiling.capture(mode, seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Profile capture failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return PlainTextResponse(content, media_type=media_type)
 
 @app.get("/status/{project_id}", response_model=ProjectStatus)
 async def get_project_status(project_id: str):
     """Get the status of a project generation."""
-    if project_id not in project_cache:
+    project = project_cache.get(project_id)
+    if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    project = project_cache[project_id]
+    view = status_view(project)
+    if view["estimated_completion"] is not None:
+        # Jobs on this worker get a live estimate; others keep the stored one
+        view["estimated_completion"] = estimated_completion(project_id) or view["estimated_completion"]
+    return ProjectStatus(project_id=project_id, **view)
+
+def subscription_ids(value: Any) -> Optional[List[str]]:
+    """The project ids in a subscribe/unsubscribe value, or None if it is malformed.
     
-    return ProjectStatus(
-        project_id=project_id,
-        status=project["status"],
-        progress=project["progress"],
-        message=project["message"],
-        download_url=project.get("download_url")
-    )
+    ``"all"`` and a missing value name no ids; anything but a list of strings is malformed.
+    """
+    if value is None or value == "all":
+        return []
+    if isinstance(value, list) and all(isinstance(project_id, str) for project_id in value):
+        return value
+    return None
+
+@app.websocket("/ws/jobs")
+async def job_status_stream(websocket: WebSocket):
+    """Push status changes for many jobs over one connection.
+    
+    Client messages: ``{"subscribe": [project ids] | "all"}`` and
+    ``{"unsubscribe": [project ids] | "all"}``; ``"all"`` follows every job of
+    the caller's tenant, including ones created later. Server messages:
+    ``{"type": "jobs", "updates": {project_id: changed fields}, "deleted": [...]}``,
+    starting with the full state of newly subscribed jobs.
+    """
+    await websocket.accept()
+    subscriber = Subscriber(resolve_tenant(websocket))
+    job_hub.add(subscriber)
+    
+    async def send_updates():
+        while True:
+            await subscriber.wake.wait()
+            message = subscriber.take_message()
+            if message:
+                await websocket.send_json(message)
+                WS_MESSAGES.inc()
+    
+    sender = asyncio.create_task(send_updates())
+    try:
+        while True:
+            try:
+                request = await websocket.receive_json()
+                subscribe = request.get("subscribe")
+                unsubscribe = request.get("unsubscribe")
+            except (ValueError, AttributeError):
+                await websocket.send_json({"type": "error", "message": "Expected a JSON object"})
+                continue
+            subscribe_ids = subscription_ids(subscribe)
+            unsubscribe_ids = subscription_ids(unsubscribe)
+            if subscribe_ids is None or unsubscribe_ids is None:
+                await websocket.send_json({
+                    "type": "error",
+                    "message": 'Expected "all" or a list of project ids to subscribe or unsubscribe'
+                })
+                continue
+            
+            if subscribe:
+                if len(subscriber.project_ids) + len(subscribe_ids) > WS_MAX_SUBSCRIPTIONS:
+                    await websocket.send_json({
+                        "type": "error",
+                        "message": f"At most {WS_MAX_SUBSCRIPTIONS} project ids per connection"
+                    })
+                    continue
+                await job_hub.subscribe(subscriber, subscribe_ids, all_jobs=subscribe == "all")
+            if unsubscribe:
+                job_hub.unsubscribe(subscriber, unsubscribe_ids, all_jobs=unsubscribe == "all")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        job_hub.remove(subscriber)
 
 @app.get("/download/{filename}")
 async def download_project(filename: str):
     """Download a generated project."""
-    # Find the project by filename
-    project_id = None
-    for pid, project in project_cache.items():
-        if project.get("download_url") == f"/download/{filename}":
-            project_id = pid
-            break
-    
-    if not project_id:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    project = project_cache[project_id]
-    zip_path = project.get("zip_path")
-    
-    if not zip_path or not os.path.exists(zip_path):
-        raise HTTPException(status_code=404, detail="File not found")
+    with tracing.span("download.lookup", filename=filename) as span:
+        # Find the project by filename
+        project = None
+        for pid, candidate in project_cache.items():
+            if candidate.get("download_url") == f"/download/{filename}":
+                project = candidate
+                break
+        
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        
+        zip_path = project.get("zip_path")
+        
+        if not zip_path or not os.path.exists(zip_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        if span:
+            span.set_attribute("project_id", pid)
+            span.set_attribute("archive_bytes", os.path.getsize(zip_path))
     
     return FileResponse(
         path=zip_path,
@@ -298,26 +807,135 @@ async def list_projects():
             "message": project["message"],
             "created_at": project["created_at"],
             "plan": project.get("plan"),
-            "files_created": project.get("files_created")
+            "files_created": project.get("files_created"),
+            "usage": usage_view(project)
         })
     
     return {"projects": projects}
 
+def summarize_usage(jobs) -> Dict[str, Dict]:
+    """Add up the resource usage of completed jobs per stack."""
+    stacks: Dict[str, Dict] = {}
+    for job in jobs:
+        usage = usage_view(job)
+        if job["status"] != "completed" or usage is None:
+            continue
+        totals = stacks.setdefault(job["plan"]["stack"], {
+            "jobs": 0, "bytes_written": 0, "archive_bytes": 0, "llm": {}, "cpu_seconds": {}, "wall_seconds": {},
+            "models": {}, "escalations": 0, "cached_plans": 0
+        })
+        totals["jobs"] += 1
+        model = job["plan"].get("model")
+        if job["plan"].get("cached"):
+            # The model and escalations were counted for the job that produced the plan
+            totals["cached_plans"] += 1
+        elif model:
+            totals["models"][model] = totals["models"].get(model, 0) + 1
+            totals["escalations"] += job["plan"].get("escalations", 0)
+        totals["bytes_written"] += usage.get("bytes_written", 0)
+        totals["archive_bytes"] += usage.get("archive_bytes", 0)
+        for group in ("llm", "cpu_seconds", "wall_seconds"):
+            for key, value in (usage.get(group) or {}).items():
+                totals[group][key] = round(totals[group].get(key, 0) + value, 6)
+    
+    for totals in stacks.values():
+        llm = totals["llm"]
+        # Slow decoding and model-load stalls show up in different figures
+        if llm.get("eval_seconds"):
+            llm["decode_tokens_per_second"] = round(llm["completion_tokens"] / llm["eval_seconds"], 2)
+        if llm.get("prompt_eval_seconds"):
+            llm["prompt_tokens_per_second"] = round(llm["prompt_tokens"] / llm["prompt_eval_seconds"], 2)
+        if llm.get("calls"):
+            llm["mean_load_seconds"] = round(llm["load_seconds"] / llm["calls"], 6)
+    return stacks
+
+@app.get("/usage")
+async def get_usage():
+    """Resource usage of completed jobs, aggregated per stack, for capacity planning."""
+    jobs = [job for _, job in await asyncio.to_thread(project_cache.items)]
+    return {"stacks": summarize_usage(jobs)}
+
+async def project_archive(project_id: str):
+    """The archive index of a completed project, or a 404."""
+    project = project_cache.get(project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    zip_path = project.get("zip_path")
+    try:
+        return await asyncio.to_thread(archive_indexes.get, zip_path)
+    except (TypeError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Project archive not available")
+    except ValueError as e:
+        logger.error(f"Unreadable archive for project {project_id}: {e}")
+        raise HTTPException(status_code=500, detail="Project archive is corrupt")
+
+def file_tree(entries) -> List[Dict]:
+    """Nest archive entries into directories, sorted with directories first."""
+    root: Dict = {}
+    for entry in entries:
+        *parents, name = entry.name.split("/")
+        node = root
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = entry
+    
+    def listing(node: Dict, prefix: str) -> List[Dict]:
+        items = []
+        for name, child in sorted(node.items(), key=lambda item: (not isinstance(item[1], dict), item[0])):
+            path = prefix + name
+            if isinstance(child, dict):
+                items.append({"name": name, "path": path, "type": "directory", "children": listing(child, path + "/")})
+            else:
+                items.append({"name": name, "path": path, "type": "file", "size": child.size})
+        return items
+    
+    return listing(root, "")
+
+@app.get("/projects/{project_id}/files")
+async def list_project_files(project_id: str):
+    """List the files of a generated project without downloading it."""
+    index = await project_archive(project_id)
+    files = index.files()
+    return {
+        "project_id": project_id,
+        "files": len(files),
+        "total_size": sum(entry.size for entry in files),
+        "tree": file_tree(files)
+    }
+
+@app.get("/projects/{project_id}/files/{path:path}")
+async def get_project_file(project_id: str, path: str):
+    """Stream one file of a generated project straight out of its archive."""
+    index = await project_archive(project_id)
+    entry = index.entries.get(path)
+    if entry is None or path.endswith("/"):
+        raise HTTPException(status_code=404, detail="File not found in project")
+    
+    media_type, _ = mimetypes.guess_type(path)
+    return StreamingResponse(
+        index.stream(path),
+        media_type=media_type or "text/plain",
+        headers={"Content-Length": str(entry.size)}
+    )
+
 @app.delete("/projects/{project_id}")
 async def delete_project(project_id: str):
     """Delete a project and its files."""
-    if project_id not in project_cache:
+    project = project_cache.get(project_id)
+    if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    project = project_cache[project_id]
-    
     # Delete zip file if it exists
     zip_path = project.get("zip_path")
     if zip_path and os.path.exists(zip_path):
         os.remove(zip_path)
     
+    # Don't start it if it is still waiting for a worker
+    if job_queue.remove(project_id):
+        running_jobs[project_id].cancel()
+    
     # Remove from cache
-    del project_cache[project_id]
+    project_cache.delete(project_id)
     
     return {"message": "Project deleted successfully"}
 
@@ -413,5 +1031,9 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     
-    logger.info(f"Starting Ultra DevBox Zero-Code Builder API on {host}:{port}")
-    uvicorn.run(app, host=host, port=port)
\ No newline at end of file
+    logger.info(f"Starting Ultra DevBox Zero-Code Builder API on {host}:{port} with {WORKERS} worker(s)")
+    if WORKERS > 1:
+        # Multiple workers need an import string; job state lives in the shared ZERO_JOB_STORE
+        uvicorn.run("server:app", host=host, port=port, workers=WORKERS)
+    else:
+        uvicorn.run(app, host=host, port=port)
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+Cold start: a prebuilt startup snapshot and concurrent warm-up.
+
+A new replica pays for everything that doesn't depend on requests before it
+can serve one. ``build_snapshot`` precomputes the parts of that which only
+depend on the image, the compiled prompt templates and the compressed
+per-stack base layers, so they can be written once at image build time:
+
+    python startup.py --output /app/zero-snapshot.pkl
+
+and loaded with ``ZERO_STARTUP_SNAPSHOT=/app/zero-snapshot.pkl``. Each part
+is only used if it still matches the prompt file and generator it was built
+from, so a stale snapshot costs a rebuild, never a wrong template. The file
+is a pickle: only load snapshots produced by the same image.
+
+``warm_up`` runs the slow, independent first-use steps (loading the planner
+models into each Ollama backend, starting generation worker processes)
+concurrently, so a replica is ready after the slowest one rather than after
+all of them in turn.
+"""
+import argparse
+import functools
+import logging
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import metrics
+from archives import DEFLATE_LEVEL, build_base_layers
+from chains.codegen import CodeGenerator
+from chains.planner import SUPPORTED_STACKS
+from chains.prompt_registry import DEFAULT_PROMPTS_FILE, PromptRegistry
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+STARTUP_SECONDS = metrics.Gauge(
+    "zero_startup_seconds", "Time spent in each startup phase", ["phase"]
+)
+WARMUP_SECONDS = metrics.Gauge(
+    "zero_warmup_seconds", "Duration of each warm-up task", ["task", "outcome"]
+)
+
+
+def build_snapshot(prompts_file: str = DEFAULT_PROMPTS_FILE, level: int = DEFLATE_LEVEL) -> Dict[str, Any]:
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "prompts": PromptRegistry(prompts_file).current().snapshot(),
+        "layers": build_base_layers(CodeGenerator(), SUPPORTED_STACKS, level)
+    }
+
+
+def write_snapshot(path: str, snapshot: Dict[str, Any]):
+    part_path = path + ".part"
+    with open(part_path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(part_path, path)
+
+
+def load_snapshot(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Load a startup snapshot; a missing or unreadable one just means building from scratch."""
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring startup snapshot {path}: {e}")
+        return None
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        logger.warning(f"Ignoring startup snapshot {path}: format {snapshot.get('format')}")
+        return None
+    return snapshot
+
+
+def preload_tasks(client, models: Iterable[str]) -> Dict[str, Callable[[], Any]]:
+    """One warm-up task per (backend, model) pair."""
+    return {
+        f"preload {model} on {backend.url}": functools.partial(client.preload, backend, model)
+        for backend in client.backends
+        for model in dict.fromkeys(models)
+    }
+
+
+def warm_up(tasks: Dict[str, Callable[[], Any]], timeout: float) -> Dict[str, Dict[str, Any]]:
+    """Run warm-up tasks concurrently and report how each one went.
+
+    Tasks still running after ``timeout`` are reported as pending and left to
+    finish in the background; the returned report is a snapshot they no
+    longer write to.
+    """
+    report: Dict[str, Dict[str, Any]] = {}
+    if not tasks:
+        return report
+    lock = threading.Lock()
+
+    def timed(name: str, task: Callable[[], Any]):
+        started = time.monotonic()
+        try:
+            task()
+            outcome = {"outcome": "ok"}
+        except Exception as e:
+            outcome = {"outcome": "failed", "error": str(e)}
+        outcome["seconds"] = round(time.monotonic() - started, 3)
+        WARMUP_SECONDS.set(outcome["seconds"], task=name, outcome=outcome["outcome"])
+        with lock:
+            report[name] = outcome
+
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warm-up")
+    futures = [executor.submit(timed, name, task) for name, task in tasks.items()]
+    wait(futures, timeout=timeout)
+    executor.shutdown(wait=False)
+    with lock:
+        return {name: dict(report.get(name, {"outcome": "pending"})) for name in tasks}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write a startup snapshot (run at image build time)"
+    )
+    parser.add_argument("--output", required=True, help="snapshot file, e.g. /app/zero-snapshot.pkl")
+    parser.add_argument("--prompts-file", default=os.getenv("ZERO_PROMPTS_FILE") or DEFAULT_PROMPTS_FILE)
+    parser.add_argument(
+        "--level", type=int, default=int(os.getenv("ZERO_COMPRESSION_LEVEL", DEFLATE_LEVEL)) or DEFLATE_LEVEL,
+        help="deflate level of the base layers; must match ZERO_COMPRESSION_LEVEL to be used"
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    snapshot = build_snapshot(args.prompts_file, args.level)
+    write_snapshot(args.output, snapshot)
+    print(
+        f"Wrote {args.output}: prompt version {snapshot['prompts']['version']}, "
+        f"{len(snapshot['layers'])} base layers in {time.perf_counter() - started:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Lightweight OpenTelemetry-style tracing for the generation pipeline.
+
+Spans are recorded only when an exporter is configured:
+
+- ``ZERO_TRACE_FILE``: append finished spans as OTLP/JSON lines to a file
+- ``ZERO_OTLP_ENDPOINT``: batch spans to an OTLP/HTTP collector
+  (``<endpoint>/v1/traces``)
+
+Without either, ``span()`` is a no-op context manager.
+"""
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.getenv("ZERO_SERVICE_NAME", "zero-api")
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("zero_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _resource_spans(spans: List[Span]) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                _otlp_attribute("service.name", SERVICE_NAME),
+                _otlp_attribute("process.pid", os.getpid())
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "zero.tracing"},
+                "spans": [span.to_otlp() for span in spans]
+            }]
+        }]
+    }
+
+
+class FileSpanExporter:
+    """Append each finished span as one OTLP/JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(_resource_spans([span])) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+class OTLPHttpExporter:
+    """Send spans to an OTLP/HTTP collector in batches from a background thread."""
+
+    def __init__(self, endpoint: str, interval: float = 2.0, max_batch: int = 512):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.interval = interval
+        self.max_batch = max_batch
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+
+    def export(self, span: Span):
+        with self._lock:
+            if len(self._pending) < self.max_batch * 10:
+                self._pending.append(span)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if not batch:
+                continue
+            request = urllib.request.Request(
+                self.url,
+                data=json.dumps(_resource_spans(batch)).encode(),
+                headers={"Content-Type": "application/json"}
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception as e:
+                logger.warning(f"Failed to export {len(batch)} spans to {self.url}: {e}")
+
+
+def _configure_exporters() -> List[Any]:
+    exporters = []
+    trace_file = os.getenv("ZERO_TRACE_FILE")
+    if trace_file:
+        exporters.append(FileSpanExporter(trace_file))
+    otlp_endpoint = os.getenv("ZERO_OTLP_ENDPOINT")
+    if otlp_endpoint:
+        exporters.append(OTLPHttpExporter(otlp_endpoint))
+    return exporters
+
+
+_exporters: Optional[List[Any]] = None
+_exporters_lock = threading.Lock()
+
+
+def _get_exporters() -> List[Any]:
+    global _exporters
+    if _exporters is None:
+        with _exporters_lock:
+            if _exporters is None:
+                _exporters = _configure_exporters()
+    return _exporters
+
+
+def enabled() -> bool:
+    return bool(_get_exporters())
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes):
+    """Record a span around the block; nested spans become its children.
+
+    A new trace is started when there is no current span; ``trace_id``
+    (32 hex chars, e.g. a project UUID without dashes) pins its id.
+    """
+    if not _get_exporters():
+        yield None
+        return
+
+    parent = _current_span.get()
+    if parent is not None and trace_id is None:
+        current = Span(name, parent.trace_id, parent.span_id, attributes)
+    else:
+        current = Span(name, trace_id or secrets.token_hex(16), None, attributes)
+
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        for exporter in _exporters:
+            try:
+                exporter.export(current)
+            except Exception as e:
+                logger.warning(f"Span export failed: {e}")
+
+
+def trace_id_for(project_id: str) -> str:
+    """Use the project UUID as the trace id so traces are easy to find."""
+    return project_id.replace("-", "")[:32].ljust(32, "0")